@@ -1,8 +1,13 @@
-from datetime import datetime, timezone
-import psycopg2
-from psycopg2.extras import execute_values, Json
+"""
+Data Exporter: Carga Invoices a PostgreSQL
+Usa el mismo loader que qbo_project (PostgresClient.upsert_records), que
+mantiene las columnas tipadas, raw.extraction_requests, el contador de
+filas y raw.volumetry_stats en la transaccion del upsert.
+"""
+import sys
+import os
 
-from mage_ai.data_preparation.shared.secrets import get_secret_value
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'qbo_project'))
 
 if 'data_exporter' not in globals():
     from mage_ai.data_preparation.decorators import data_exporter
@@ -13,6 +18,8 @@ if 'test' not in globals():
 
 @data_exporter
 def export_data(data, *args, **kwargs):
+    from utils.db_utils import get_postgres_client
+
     print("=" * 50)
     print("CARGA DE INVOICES A POSTGRESQL")
     print("=" * 50)
@@ -21,81 +28,33 @@ def export_data(data, *args, **kwargs):
         print("[WARN] No hay datos para cargar")
         return {'status': 'completed', 'inserted': 0, 'updated': 0}
 
-    conn = psycopg2.connect(
-        host=get_secret_value('PG_HOST') or 'postgres',
-        port=get_secret_value('PG_PORT') or '5432',
-        database=get_secret_value('PG_DATABASE') or 'qbo_database',
-        user=get_secret_value('PG_USER') or 'qbo_user',
-        password=get_secret_value('PG_PASSWORD') or 'qbo_password_change_me',
-    )
-
-    cursor = conn.cursor()
-    ingested_at = datetime.now(timezone.utc)
-
-    values = []
-    for item in data:
-        record = item['record']
-        values.append(
-            (
-                str(record['Id']),
-                Json(record),
-                ingested_at,
-                item.get('extract_window_start'),
-                item.get('extract_window_end'),
-                item.get('page_number'),
-                item.get('page_size'),
-                Json({'entity': 'Invoice'}),
-            )
-        )
-
-    upsert_query = """
-        INSERT INTO raw.qb_invoices (
-            id,
-            payload,
-            ingested_at_utc,
-            extract_window_start_utc,
-            extract_window_end_utc,
-            page_number,
-            page_size,
-            request_payload
+    window_start = data[0].get('extract_window_start')
+    window_end = data[0].get('extract_window_end')
+
+    db = get_postgres_client()
+    try:
+        result = db.upsert_records(
+            table_name='raw.qb_invoices',
+            records=data,
+            window_start=window_start,
+            window_end=window_end,
+            request_payload={
+                'entity': 'Invoice',
+                'window_start': window_start,
+                'window_end': window_end
+            }
         )
-        VALUES %s
-        ON CONFLICT (id) DO UPDATE SET
-            payload = EXCLUDED.payload,
-            ingested_at_utc = EXCLUDED.ingested_at_utc,
-            extract_window_start_utc = EXCLUDED.extract_window_start_utc,
-            extract_window_end_utc = EXCLUDED.extract_window_end_utc,
-            page_number = EXCLUDED.page_number,
-            page_size = EXCLUDED.page_size,
-            request_payload = EXCLUDED.request_payload
-        RETURNING (xmax = 0) AS inserted
-    """
-
-    result = execute_values(
-        cursor,
-        upsert_query,
-        values,
-        template="(%s, %s, %s, %s, %s, %s, %s, %s)",
-        fetch=True,
-    )
-
-    inserted = sum(1 for r in result if r[0])
-    updated = len(result) - inserted
-
-    conn.commit()
-
-    cursor.execute("SELECT COUNT(*) FROM raw.qb_invoices")
-    total = cursor.fetchone()[0]
-
-    cursor.close()
-    conn.close()
+        db.prune_volumetry('raw.qb_invoices')
+        total = db.get_record_count('raw.qb_invoices')
+    finally:
+        db.close()
 
-    print(f"Insertados: {inserted}")
-    print(f"Actualizados: {updated}")
+    print(f"Insertados: {result['inserted']}")
+    print(f"Actualizados: {result['updated']}")
     print(f"Total en tabla: {total}")
     print("=" * 50)
 
-    return {'inserted': inserted, 'updated': updated, 'total': total}
+    return {'inserted': result['inserted'], 'updated': result['updated'], 'total': total}
 
 
 @test
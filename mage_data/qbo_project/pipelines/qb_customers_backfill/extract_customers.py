@@ -21,48 +21,111 @@ def extract_customers(*args, **kwargs) -> List[Dict[str, Any]]:
     Extrae todos los clientes de QBO dentro de la ventana de fechas.
     """
     from utils.qbo_client import get_qbo_client
+    from utils.db_utils import get_postgres_client
+    from utils.backfill_runner import resume_point
+    from utils.backfill_windows import incremental_window
+    from utils.arrow_artifacts import ArtifactWriter
+    from utils.page_journal import PageJournal, journaled_pages
 
     fecha_inicio = kwargs.get('fecha_inicio', '2024-01-01T00:00:00Z')
     fecha_fin = kwargs.get('fecha_fin', '2024-12-31T23:59:59Z')
+    modo = kwargs.get('modo', 'backfill')
+
+    # Modo incremental: desde el watermark (menos solape) hasta ahora.
+    # Sin watermark previo se parte de fecha_inicio.
+    if modo == 'incremental':
+        db = get_postgres_client()
+        try:
+            watermark = db.get_watermark('customers')
+        finally:
+            db.close()
+        fecha_inicio, fecha_fin = incremental_window(
+            watermark or fecha_inicio,
+            overlap_minutes=int(kwargs.get('solape_minutos', 10))
+        )
 
     print("=" * 60)
     print("EXTRACCION DE CUSTOMERS - QBO BACKFILL")
     print("=" * 60)
     print(f"Fecha inicio (UTC): {fecha_inicio}")
     print(f"Fecha fin (UTC):    {fecha_fin}")
+    print(f"Modo:               {modo}")
     print("=" * 60)
 
     client = get_qbo_client()
-    records = []
-    start_time = datetime.now(timezone.utc)
 
-    try:
-        for item in client.fetch_entity_paginated(
+    # Reanudar desde la ultima pagina confirmada por load_customers (por fecha, ver resume_point)
+    start_page, resume_from = 1, None
+    if modo != 'incremental' and kwargs.get('reanudar_desde_checkpoint', True):
+        db = get_postgres_client()
+        try:
+            start_page, _, resume_from = resume_point(db, 'customers', fecha_inicio, fecha_fin, client.PAGE_SIZE)
+        finally:
+            db.close()
+
+    def fetch_pages(first_page, since):
+        return client.fetch_entity_pages(
             entity='Customer',
             start_date=fecha_inicio,
             end_date=fecha_fin,
-            date_field='MetaData.LastUpdatedTime'
-        ):
-            item['extract_window_start'] = fecha_inicio
-            item['extract_window_end'] = fecha_fin
-            records.append(item)
+            date_field='MetaData.LastUpdatedTime',
+            start_page=first_page,
+            resume_from=since
+        )
+
+    # Journal local: si el load falla, re-ejecutar lee las paginas del disco
+    # en lugar de volver a pedirlas a la API (solo con ventana fija)
+    pages = fetch_pages(start_page, resume_from)
+    if modo != 'incremental' and kwargs.get('usar_journal', False):
+        journal = PageJournal('customers', fecha_inicio, fecha_fin)
+        pages = journaled_pages(
+            journal, fetch_pages, start_page, resume_from,
+            max_age_hours=float(kwargs.get('journal_max_horas', 24))
+        )
+
+    # Intercambio con transform: lista de dicts (default) o artefacto Arrow
+    writer = None
+    if kwargs.get('formato_intercambio', 'lista') == 'arrow':
+        writer = ArtifactWriter('customers', fecha_inicio, fecha_fin)
+
+    records = []
+    start_time = datetime.now(timezone.utc)
+
+    try:
+        for page in pages:
+            for item in page:
+                item['extract_window_start'] = fecha_inicio
+                item['extract_window_end'] = fecha_fin
+
+            if writer:
+                writer.write_page(page)
+            else:
+                records.extend(page)
 
     except Exception as e:
+        if writer:
+            writer.abort()
         print(f"[ERROR] Fallo en extraccion: {str(e)}")
         raise
 
     duration = (datetime.now(timezone.utc) - start_time).total_seconds()
 
     print("\n" + "=" * 60)
-    print(f"Total registros extraidos: {len(records)}")
+    print(f"Total registros extraidos: {writer.records if writer else len(records)}")
     print(f"Duracion: {duration:.2f} segundos")
     print("=" * 60)
 
+    if writer:
+        return writer.close()
     return records
 
 
 @test
 def test_output(output, *args) -> None:
+    from collections.abc import Sequence
+    from utils.arrow_artifacts import as_records
+
     assert output is not None, 'La salida es None'
-    assert isinstance(output, list), 'La salida debe ser una lista'
+    output = as_records(output)
+    assert isinstance(output, Sequence), 'La salida debe ser una lista de registros'
     print(f"[TEST OK] Extraccion valida con {len(output)} registros")
@@ -19,17 +19,32 @@ if 'test' not in globals():
 def load_customers(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]:
     """Carga los Customers validados a PostgreSQL con UPSERT."""
     from utils.db_utils import get_postgres_client
+    from utils.backfill_runner import upsert_with_checkpoints
+    from utils.backfill_windows import high_water_mark
+    from utils.arrow_artifacts import as_records, remove_artifacts
+    from utils.page_journal import PageJournal
 
     print("=" * 60)
     print("CARGA DE CUSTOMERS A POSTGRESQL")
     print("=" * 60)
 
+    # Artefacto Arrow (formato_intercambio = arrow): vista con la misma interfaz
+    artifact = data
+    data = as_records(data)
+
     if not data:
+        remove_artifacts(artifact)
         return {'status': 'completed', 'records_loaded': 0, 'inserted': 0, 'updated': 0}
 
     fecha_inicio = kwargs.get('fecha_inicio', data[0].get('extract_window_start'))
     fecha_fin = kwargs.get('fecha_fin', data[0].get('extract_window_end'))
 
+    # En modo incremental la ventana la calcula el extract a partir del watermark
+    incremental = kwargs.get('modo', 'backfill') == 'incremental'
+    if incremental:
+        fecha_inicio = data[0].get('extract_window_start')
+        fecha_fin = data[0].get('extract_window_end')
+
     db = get_postgres_client()
     start_time = datetime.now(timezone.utc)
 
@@ -42,12 +57,18 @@ def load_customers(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any
             'window_end': fecha_fin
         }
 
-        result = db.upsert_records(
+        # Carga por bloques de paginas con checkpoint (ver extract_customers)
+        result = upsert_with_checkpoints(
+            db,
+            entity_name='customers',
             table_name='raw.qb_customers',
             records=data,
             window_start=fecha_inicio,
             window_end=fecha_fin,
-            request_payload=request_payload
+            request_payload=request_payload,
+            pages_per_checkpoint=int(kwargs.get('paginas_por_checkpoint', 20)),
+            skip_unchanged=kwargs.get('omitir_sin_cambios', False),
+            workers=int(kwargs.get('conexiones_carga', 1))
         )
 
         duration = (datetime.now(timezone.utc) - start_time).total_seconds()
@@ -62,9 +83,25 @@ def load_customers(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any
             status='completed'
         )
 
+        # El watermark avanza solo despues de una carga exitosa
+        if incremental:
+            db.advance_watermark('customers', high_water_mark(data), fecha_fin)
+
+        # Los artefactos intermedios y el journal del tramo ya no se necesitan
+        remove_artifacts(artifact)
+        if not incremental and kwargs.get('usar_journal', False):
+            PageJournal('customers', fecha_inicio, fecha_fin).remove()
+
+        if kwargs.get('mantener_particiones', False):
+            db.analyze_touched_partitions(
+                'raw.qb_customers',
+                (item['record'].get('Id') for item in data)
+            )
+
         final_count = db.get_record_count('raw.qb_customers')
 
-        print(f"Insertados: {result['inserted']}, Actualizados: {result['updated']}")
+        print(f"Insertados: {result['inserted']}, Actualizados: {result['updated']}, "
+              f"Sin cambios: {result['skipped']}")
         print(f"Total en tabla: {final_count}")
         print("=" * 60)
 
@@ -73,6 +110,7 @@ def load_customers(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any
             'records_loaded': len(data),
             'inserted': result['inserted'],
             'updated': result['updated'],
+            'skipped': result['skipped'],
             'total_in_table': final_count
         }
 
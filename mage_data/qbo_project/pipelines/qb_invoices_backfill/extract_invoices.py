@@ -25,43 +25,104 @@ def extract_invoices(*args, **kwargs) -> List[Dict[str, Any]]:
     Variables del pipeline:
         fecha_inicio: Fecha inicio en formato ISO (UTC)
         fecha_fin: Fecha fin en formato ISO (UTC)
+        reanudar_desde_checkpoint: Continuar desde la ultima pagina cargada
+        modo: 'backfill' (ventana explicita) o 'incremental' (desde el watermark)
+        solape_minutos: Minutos a restar al watermark en modo incremental
+        usar_journal: Pasar las paginas por el journal local (utils.page_journal)
+        journal_max_horas: Antiguedad maxima del journal para repetirlo
 
     Returns:
         List[Dict]: Lista de registros con payload y metadatos
     """
     from utils.qbo_client import get_qbo_client
+    from utils.db_utils import get_postgres_client
+    from utils.backfill_runner import resume_point
+    from utils.backfill_windows import incremental_window
+    from utils.arrow_artifacts import ArtifactWriter
+    from utils.page_journal import PageJournal, journaled_pages
 
     # Obtener parametros del pipeline
     fecha_inicio = kwargs.get('fecha_inicio', '2024-01-01T00:00:00Z')
     fecha_fin = kwargs.get('fecha_fin', '2024-12-31T23:59:59Z')
+    modo = kwargs.get('modo', 'backfill')
+
+    # Modo incremental: desde el watermark (menos solape) hasta ahora.
+    # Sin watermark previo se parte de fecha_inicio.
+    if modo == 'incremental':
+        db = get_postgres_client()
+        try:
+            watermark = db.get_watermark('invoices')
+        finally:
+            db.close()
+        fecha_inicio, fecha_fin = incremental_window(
+            watermark or fecha_inicio,
+            overlap_minutes=int(kwargs.get('solape_minutos', 10))
+        )
 
     print("=" * 60)
     print("EXTRACCION DE INVOICES - QBO BACKFILL")
     print("=" * 60)
     print(f"Fecha inicio (UTC): {fecha_inicio}")
     print(f"Fecha fin (UTC):    {fecha_fin}")
+    print(f"Modo:               {modo}")
     print("=" * 60)
 
     # Iniciar cliente de QBO
     client = get_qbo_client()
 
+    # Reanudar desde la ultima pagina confirmada por load_invoices (por fecha, ver resume_point)
+    start_page, resume_from = 1, None
+    if modo != 'incremental' and kwargs.get('reanudar_desde_checkpoint', True):
+        db = get_postgres_client()
+        try:
+            start_page, _, resume_from = resume_point(db, 'invoices', fecha_inicio, fecha_fin, client.PAGE_SIZE)
+        finally:
+            db.close()
+
+    def fetch_pages(first_page, since):
+        return client.fetch_entity_pages(
+            entity='Invoice',
+            start_date=fecha_inicio,
+            end_date=fecha_fin,
+            date_field='MetaData.LastUpdatedTime',
+            start_page=first_page,
+            resume_from=since
+        )
+
+    # Journal local: si el load falla, re-ejecutar lee las paginas del disco
+    # en lugar de volver a pedirlas a la API (solo con ventana fija)
+    pages = fetch_pages(start_page, resume_from)
+    if modo != 'incremental' and kwargs.get('usar_journal', False):
+        journal = PageJournal('invoices', fecha_inicio, fecha_fin)
+        pages = journaled_pages(
+            journal, fetch_pages, start_page, resume_from,
+            max_age_hours=float(kwargs.get('journal_max_horas', 24))
+        )
+
+    # Intercambio con transform: lista de dicts (default) o artefacto Arrow
+    writer = None
+    if kwargs.get('formato_intercambio', 'lista') == 'arrow':
+        writer = ArtifactWriter('invoices', fecha_inicio, fecha_fin)
+
     # Extraer con paginacion
     records = []
     start_time = datetime.now(timezone.utc)
 
     try:
-        for item in client.fetch_entity_paginated(
-            entity='Invoice',
-            start_date=fecha_inicio,
-            end_date=fecha_fin,
-            date_field='MetaData.LastUpdatedTime'
-        ):
+        for page in pages:
             # Agregar metadatos de extraccion
-            item['extract_window_start'] = fecha_inicio
-            item['extract_window_end'] = fecha_fin
-            records.append(item)
+            for item in page:
+                item['extract_window_start'] = fecha_inicio
+                item['extract_window_end'] = fecha_fin
+
+            if writer:
+                writer.write_page(page)
+            else:
+                records.extend(page)
 
     except Exception as e:
+        if writer:
+            writer.abort()
         print(f"[ERROR] Fallo en extraccion: {str(e)}")
         raise
 
@@ -70,12 +131,14 @@ def extract_invoices(*args, **kwargs) -> List[Dict[str, Any]]:
     print("\n" + "=" * 60)
     print("RESUMEN DE EXTRACCION")
     print("=" * 60)
-    print(f"Total registros extraidos: {len(records)}")
+    print(f"Total registros extraidos: {writer.records if writer else len(records)}")
     print(f"Duracion: {duration:.2f} segundos")
     print(f"Requests totales: {client.total_requests}")
     print(f"Reintentos totales: {client.total_retries}")
     print("=" * 60)
 
+    if writer:
+        return writer.close()
     return records
 
 
@@ -84,8 +147,12 @@ def test_output(output, *args) -> None:
     """
     Valida que la salida no este vacia y tenga la estructura correcta
     """
+    from collections.abc import Sequence
+    from utils.arrow_artifacts import as_records
+
     assert output is not None, 'La salida es None'
-    assert isinstance(output, list), 'La salida debe ser una lista'
+    output = as_records(output)
+    assert isinstance(output, Sequence), 'La salida debe ser una lista de registros'
 
     if len(output) > 0:
         sample = output[0]
@@ -27,12 +27,21 @@ def load_invoices(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]
         Dict: Resumen de la carga
     """
     from utils.db_utils import get_postgres_client
+    from utils.backfill_runner import upsert_with_checkpoints
+    from utils.backfill_windows import high_water_mark
+    from utils.arrow_artifacts import as_records, remove_artifacts
+    from utils.page_journal import PageJournal
 
     print("=" * 60)
     print("CARGA DE INVOICES A POSTGRESQL")
     print("=" * 60)
 
+    # Artefacto Arrow (formato_intercambio = arrow): vista con la misma interfaz
+    artifact = data
+    data = as_records(data)
+
     if not data:
+        remove_artifacts(artifact)
         print("[WARN] No hay datos para cargar")
         return {
             'status': 'completed',
@@ -45,6 +54,12 @@ def load_invoices(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]
     fecha_inicio = kwargs.get('fecha_inicio', data[0].get('extract_window_start'))
     fecha_fin = kwargs.get('fecha_fin', data[0].get('extract_window_end'))
 
+    # En modo incremental la ventana la calcula el extract a partir del watermark
+    incremental = kwargs.get('modo', 'backfill') == 'incremental'
+    if incremental:
+        fecha_inicio = data[0].get('extract_window_start')
+        fecha_fin = data[0].get('extract_window_end')
+
     # Iniciar cliente de Postgres
     db = get_postgres_client()
     start_time = datetime.now(timezone.utc)
@@ -74,12 +89,18 @@ def load_invoices(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]
         }
 
         # Cargar en batch
-        result = db.upsert_records(
+        # Carga por bloques de paginas con checkpoint (ver extract_invoices)
+        result = upsert_with_checkpoints(
+            db,
+            entity_name='invoices',
             table_name='raw.qb_invoices',
             records=data,
             window_start=fecha_inicio,
             window_end=fecha_fin,
-            request_payload=request_payload
+            request_payload=request_payload,
+            pages_per_checkpoint=int(kwargs.get('paginas_por_checkpoint', 20)),
+            skip_unchanged=kwargs.get('omitir_sin_cambios', False),
+            workers=int(kwargs.get('conexiones_carga', 1))
         )
 
         total_inserted = result['inserted']
@@ -98,7 +119,22 @@ def load_invoices(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]
             status='completed'
         )
 
+        # El watermark avanza solo despues de una carga exitosa
+        if incremental:
+            db.advance_watermark('invoices', high_water_mark(data), fecha_fin)
+
+        # Los artefactos intermedios y el journal del tramo ya no se necesitan
+        remove_artifacts(artifact)
+        if not incremental and kwargs.get('usar_journal', False):
+            PageJournal('invoices', fecha_inicio, fecha_fin).remove()
+
         # Verificar conteo final
+        if kwargs.get('mantener_particiones', False):
+            db.analyze_touched_partitions(
+                'raw.qb_invoices',
+                (item['record'].get('Id') for item in data)
+            )
+
         final_count = db.get_record_count('raw.qb_invoices')
 
         print("\n" + "=" * 60)
@@ -107,6 +143,7 @@ def load_invoices(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]
         print(f"Registros procesados: {len(data)}")
         print(f"Insertados:           {total_inserted}")
         print(f"Actualizados:         {total_updated}")
+        print(f"Sin cambios omitidos: {result['skipped']}")
         print(f"Paginas procesadas:   {len(total_pages)}")
         print(f"Duracion:             {duration:.2f} segundos")
         print(f"Total en tabla:       {final_count}")
@@ -117,6 +154,7 @@ def load_invoices(data: List[Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]
             'records_loaded': len(data),
             'inserted': total_inserted,
             'updated': total_updated,
+            'skipped': result['skipped'],
             'pages': len(total_pages),
             'duration_seconds': duration,
             'total_in_table': final_count,
@@ -2,8 +2,11 @@
 Transformer: Valida y prepara Invoices para carga
 Pipeline: qb_invoices_backfill
 """
+import sys
+import os
 from typing import List, Dict, Any
-from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 if 'transformer' not in globals():
     from mage_ai.data_preparation.decorators import transformer
@@ -16,10 +19,11 @@ def transform_invoices(data: List[Dict[str, Any]], *args, **kwargs) -> List[Dict
     """
     Valida y transforma los registros de Invoices.
 
-    Validaciones:
-    - Verificar que cada registro tenga ID
-    - Detectar y reportar registros invalidos
-    - Agregar metricas de calidad
+    Validaciones (ver utils.validation):
+    - Reglas declaradas para invoices (ID requerido, tipos, rangos)
+    - Referencias a customers/items contra el cache de ids cargados
+    - Descartar IDs duplicados
+    - Reportar conteos por regla
 
     Args:
         data: Lista de registros extraidos
@@ -31,71 +35,50 @@ def transform_invoices(data: List[Dict[str, Any]], *args, **kwargs) -> List[Dict
     print("TRANSFORMACION Y VALIDACION DE INVOICES")
     print("=" * 60)
 
-    if not data:
+    from utils.arrow_artifacts import is_artifact, filter_artifact, as_records
+    from utils.validation import validate_records, referenced_ids, print_report
+    from utils.db_utils import get_postgres_client
+    from utils.reference_cache import ReferenceCache, queue_references
+
+    procesos = int(kwargs.get('procesos_transform', 1))
+
+    if not is_artifact(data) and not data:
         print("[WARN] No hay datos para transformar")
         return []
 
-    valid_records = []
-    invalid_records = []
-    duplicate_ids = set()
-    seen_ids = set()
-
-    for item in data:
-        record = item.get('record', {})
-        record_id = record.get('Id')
-
-        # Validacion 1: ID presente y no nulo
-        if not record_id:
-            invalid_records.append({
-                'reason': 'ID nulo o faltante',
-                'record': record
-            })
-            continue
-
-        # Validacion 2: ID no duplicado
-        if record_id in seen_ids:
-            duplicate_ids.add(record_id)
-            continue
-        seen_ids.add(record_id)
-
-        # Validacion 3: Payload no vacio
-        if not record:
-            invalid_records.append({
-                'reason': 'Payload vacio',
-                'id': record_id
-            })
-            continue
-
-        # Registro valido
-        valid_records.append(item)
-
-    # Reportar metricas de calidad
-    print(f"\nMetricas de calidad:")
-    print(f"  Total recibidos:    {len(data)}")
-    print(f"  Registros validos:  {len(valid_records)}")
-    print(f"  Registros invalidos:{len(invalid_records)}")
-    print(f"  IDs duplicados:     {len(duplicate_ids)}")
-
-    if invalid_records:
-        print(f"\n[WARN] Registros invalidos detectados:")
-        for inv in invalid_records[:5]:  # Mostrar solo primeros 5
-            print(f"  - {inv.get('reason')}: {inv.get('id', 'N/A')}")
-        if len(invalid_records) > 5:
-            print(f"  ... y {len(invalid_records) - 5} mas")
-
-    if duplicate_ids:
-        print(f"\n[WARN] IDs duplicados: {list(duplicate_ids)[:10]}")
-
-    # Agregar timestamp de transformacion
-    transform_time = datetime.now(timezone.utc).isoformat()
-    for item in valid_records:
-        item['transformed_at_utc'] = transform_time
+    # Referencias a customers/items: se consultan solo los ids que usa la
+    # ventana (lookup O(1)); los faltantes se encolan para un fetch puntual
+    db = get_postgres_client() if kwargs.get('verificar_referencias', True) else None
+    try:
+        cache = ReferenceCache.load(db, referenced_ids(as_records(data), 'invoices')) if db else None
+        references = cache.references() if cache else None
+
+        # Artefacto Arrow: se valida lote por lote sin materializar la lista
+        if is_artifact(data):
+            output, report = filter_artifact(
+                data, entity_name='invoices', references=references, workers=procesos
+            )
+        else:
+            if procesos > 1:
+                print("[WARN] procesos_transform solo aplica con formato_intercambio: arrow "
+                      "(la lista ya llega decodificada); se valida en este proceso")
+
+            # Reglas declaradas en utils.validation.ENTITY_RULES['invoices']
+            output, report = validate_records(data, entity_name='invoices', references=references)
+
+        print_report(report)
+        if cache:
+            queue_references(db, cache.unresolved(report), referenced_by='invoices')
+
+    finally:
+        if db:
+            db.close()
 
     print("=" * 60)
-    print(f"Registros listos para carga: {len(valid_records)}")
+    print(f"Registros listos para carga: {report['valid']}")
     print("=" * 60)
 
-    return valid_records
+    return output
 
 
 @test
@@ -103,8 +86,12 @@ def test_output(output, *args) -> None:
     """
     Valida que los registros transformados sean correctos
     """
+    from collections.abc import Sequence
+    from utils.arrow_artifacts import as_records
+
     assert output is not None, 'La salida es None'
-    assert isinstance(output, list), 'La salida debe ser una lista'
+    output = as_records(output)
+    assert isinstance(output, Sequence), 'La salida debe ser una lista de registros'
 
     # Verificar que no hay IDs duplicados
     ids = [item['record']['Id'] for item in output if 'record' in item]
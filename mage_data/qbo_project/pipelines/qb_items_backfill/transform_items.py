@@ -2,8 +2,11 @@
 Transformer: Valida y prepara Items para carga
 Pipeline: qb_items_backfill
 """
+import sys
+import os
 from typing import List, Dict, Any
-from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 if 'transformer' not in globals():
     from mage_ai.data_preparation.decorators import transformer
@@ -18,25 +21,28 @@ def transform_items(data: List[Dict[str, Any]], *args, **kwargs) -> List[Dict[st
     print("TRANSFORMACION Y VALIDACION DE ITEMS")
     print("=" * 60)
 
-    if not data:
-        print("[WARN] No hay datos para transformar")
-        return []
+    from utils.arrow_artifacts import is_artifact, filter_artifact
+    from utils.validation import validate_records, print_report
 
-    valid_records = []
-    seen_ids = set()
+    procesos = int(kwargs.get('procesos_transform', 1))
 
-    for item in data:
-        record = item.get('record', {})
-        record_id = record.get('Id')
+    # Artefacto Arrow: se valida lote por lote sin materializar la lista
+    if is_artifact(data):
+        filtered, report = filter_artifact(data, entity_name='items', workers=procesos)
+        print_report(report)
+        print("=" * 60)
+        return filtered
 
-        if not record_id or record_id in seen_ids:
-            continue
+    if not data:
+        print("[WARN] No hay datos para transformar")
+        return []
 
-        seen_ids.add(record_id)
-        item['transformed_at_utc'] = datetime.now(timezone.utc).isoformat()
-        valid_records.append(item)
+    if procesos > 1:
+        print("[WARN] procesos_transform solo aplica con formato_intercambio: arrow "
+              "(la lista ya llega decodificada); se valida en este proceso")
 
-    print(f"Total recibidos: {len(data)}, Validos: {len(valid_records)}")
+    valid_records, report = validate_records(data, entity_name='items')
+    print_report(report)
     print("=" * 60)
 
     return valid_records
@@ -44,5 +50,8 @@ def transform_items(data: List[Dict[str, Any]], *args, **kwargs) -> List[Dict[st
 
 @test
 def test_output(output, *args) -> None:
+    from utils.arrow_artifacts import as_records
+
     assert output is not None, 'La salida es None'
+    output = as_records(output)
     print(f"[TEST OK] Transformacion valida con {len(output)} registros")
@@ -0,0 +1,97 @@
+"""
+Data Loader: Backfill en streaming (extract -> validate -> upsert por lotes)
+Pipeline: qb_streaming_backfill
+"""
+import sys
+import os
+from typing import Dict, Any
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+if 'data_loader' not in globals():
+    from mage_ai.data_preparation.decorators import data_loader
+if 'test' not in globals():
+    from mage_ai.data_preparation.decorators import test
+
+
+@data_loader
+def stream_backfill(*args, **kwargs) -> Dict[str, Any]:
+    """
+    Ejecuta un tramo completo sin materializar la ventana en memoria.
+
+    A diferencia de qb_<entidad>_backfill, los registros no pasan por
+    variables_dir entre bloques: cada lote de paginas se valida y se carga
+    apenas se descarga, y el bloque solo retorna el resumen.
+
+    Variables del pipeline:
+        entidad: invoices, customers o items
+        fecha_inicio: Fecha inicio en formato ISO (UTC)
+        fecha_fin: Fecha fin en formato ISO (UTC)
+        paginas_por_lote: Paginas por transaccion de carga
+        omitir_sin_cambios: Omitir registros con el mismo SyncToken ya cargado
+        reanudar_desde_checkpoint: Continuar desde la ultima pagina cargada
+        destino: postgres (capa RAW) o lake (Parquet/NDJSON, ver utils.lake_sink)
+        formato_lake: parquet o ndjson (solo con destino = lake)
+
+    Returns:
+        Dict: Resumen de la carga
+    """
+    from utils.backfill_runner import run_window
+    from utils.lake_sink import get_lake_sink
+    from utils.validation import print_report
+
+    entidad = kwargs.get('entidad', 'invoices')
+    fecha_inicio = kwargs.get('fecha_inicio', '2024-01-01T00:00:00Z')
+    fecha_fin = kwargs.get('fecha_fin', '2024-12-31T23:59:59Z')
+    paginas_por_lote = int(kwargs.get('paginas_por_lote', 5))
+    destino = kwargs.get('destino', 'postgres')
+
+    print("=" * 60)
+    print(f"BACKFILL EN STREAMING - {entidad.upper()}")
+    print("=" * 60)
+    print(f"Fecha inicio (UTC): {fecha_inicio}")
+    print(f"Fecha fin (UTC):    {fecha_fin}")
+    print(f"Paginas por lote:   {paginas_por_lote}")
+    print(f"Destino:            {destino}")
+    print("=" * 60)
+
+    sink = None
+    if destino == 'lake':
+        sink = get_lake_sink(file_format=kwargs.get('formato_lake', 'parquet'))
+
+    result = run_window(
+        entidad,
+        fecha_inicio,
+        fecha_fin,
+        skip_unchanged=kwargs.get('omitir_sin_cambios', False),
+        resume=kwargs.get('reanudar_desde_checkpoint', True),
+        pages_per_batch=paginas_por_lote,
+        sink=sink
+    )
+
+    print("\n" + "=" * 60)
+    print("RESUMEN DE CARGA")
+    print("=" * 60)
+    print(f"Registros procesados: {result['records_loaded']}")
+    print(f"Insertados:           {result['inserted']}")
+    print(f"Actualizados:         {result['updated']}")
+    print(f"Sin cambios omitidos: {result['skipped']}")
+    print(f"Paginas procesadas:   {result['pages']}")
+    print(f"Duracion:             {result['duration_seconds']:.2f} segundos")
+    print("=" * 60)
+    print_report(result['quality'])
+
+    return result
+
+
+@test
+def test_output(output, *args) -> None:
+    """
+    Valida que la carga fue exitosa
+    """
+    assert output is not None, 'La salida es None'
+    assert output.get('status') == 'completed', f"Estado incorrecto: {output.get('status')}"
+    assert output.get('records_loaded', 0) >= 0, 'Conteo de registros invalido'
+
+    print(f"[TEST OK] Streaming completado: {output.get('inserted')} insertados, "
+          f"{output.get('updated')} actualizados")
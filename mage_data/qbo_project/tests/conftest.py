@@ -0,0 +1,38 @@
+# Los modulos de utils se importan como en los bloques de Mage: desde la raiz del proyecto
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Tablas que los tests de base de datos vacian antes de cada test
+DB_TABLES = (
+    'raw.qb_invoices', 'raw.qb_customers', 'raw.qb_items', 'raw.qb_invoice_lines',
+    'raw.extraction_requests', 'raw.volumetry_stats', 'raw.backfill_log',
+    'raw.backfill_jobs', 'raw.backfill_checkpoints', 'raw.pending_references'
+)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """
+    PostgresClient sobre una base dedicada a tests (sql/init.sql aplicado)
+
+    La base se indica en QBO_TEST_DATABASE (el resto de la conexion en
+    PG_HOST, PG_PORT, PG_USER, PG_PASSWORD); sin ella el test se omite.
+    """
+    database = os.environ.get('QBO_TEST_DATABASE')
+    if not database:
+        pytest.skip('QBO_TEST_DATABASE no definida')
+    monkeypatch.setenv('PG_DATABASE', database)
+
+    from utils.db_utils import get_postgres_client
+    client = get_postgres_client()
+    conn = client.connect()
+    with conn.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(DB_TABLES)} RESTART IDENTITY CASCADE")
+        cursor.execute("UPDATE raw.table_row_counts SET row_count = 0")
+    conn.commit()
+    yield client
+    client.close()
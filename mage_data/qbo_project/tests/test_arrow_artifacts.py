@@ -0,0 +1,45 @@
+"""Tests de utils.arrow_artifacts.filter_artifact: una fila por Id, la version mas reciente"""
+import pytest
+
+from utils import arrow_artifacts
+from utils.arrow_artifacts import ArtifactWriter, RecordsView, filter_artifact
+
+WINDOW = ('2024-01-01T00:00:00Z', '2024-01-31T23:59:59Z')
+
+
+@pytest.fixture(autouse=True)
+def artifacts_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(arrow_artifacts, 'ARTIFACTS_DIR', str(tmp_path))
+
+
+def item(record_id, sync_token, updated, page_number):
+    return {
+        'record': {
+            'Id': record_id, 'SyncToken': str(sync_token),
+            'MetaData': {'LastUpdatedTime': updated}, 'TotalAmt': sync_token
+        },
+        'page_number': page_number, 'page_size': 3, 'position_in_page': 0
+    }
+
+
+def test_filter_keeps_latest_version_per_id_across_pages():
+    writer = ArtifactWriter('invoices', *WINDOW)
+    writer.write_page([
+        item('a', 2, '2024-01-02T00:00:00Z', 1),
+        item('b', 1, '2024-01-02T00:00:00Z', 1),
+        item('c', 1, '2024-01-02T00:00:00Z', 1),
+    ])
+    writer.write_page([
+        item('a', 1, '2024-01-05T00:00:00Z', 2),   # SyncToken menor: pierde aunque sea posterior
+        item('b', 3, '2024-01-03T00:00:00Z', 2),   # SyncToken mayor en una pagina posterior
+        item('c', 1, '2024-01-04T00:00:00Z', 2),   # Mismo SyncToken: desempata LastUpdatedTime
+    ])
+    filtered, report = filter_artifact(writer.close(), entity_name='invoices')
+
+    rows = {row['record']['Id']: row for row in RecordsView(filtered)}
+    assert sorted(rows) == ['a', 'b', 'c']
+    assert (rows['a']['page_number'], rows['a']['record']['SyncToken']) == (1, '2')
+    assert (rows['b']['page_number'], rows['b']['record']['SyncToken']) == (2, '3')
+    assert rows['c']['record']['MetaData']['LastUpdatedTime'] == '2024-01-04T00:00:00Z'
+    assert (report['received'], report['duplicates'], report['valid']) == (6, 3, 3)
+    assert filtered['records'] == 3
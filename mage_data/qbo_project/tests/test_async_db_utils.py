@@ -0,0 +1,106 @@
+"""Tests de utils.async_db_utils.load_window_async: fin del productor si falla la escritura"""
+import asyncio
+
+import pytest
+
+from utils import async_db_utils
+from utils.async_db_utils import load_window_async
+
+WINDOW = ('2024-01-01T00:00:00Z', '2024-01-31T23:59:59Z')
+
+
+class FakeAsyncDB:
+    def __init__(self, fail_on_page=None):
+        self.fail_on_page = fail_on_page
+        self.pages = 0
+        self.logged = []
+
+    async def log_backfill_start(self, entity_name, window_start, window_end):
+        return 1
+
+    async def log_backfill_complete(self, log_id, *args, status, error_message=None):
+        self.logged.append((status, error_message))
+
+    async def upsert_records(self, table_name, page, window_start, window_end, request_payload=None):
+        self.pages += 1
+        await asyncio.sleep(0.01)
+        if self.pages == self.fail_on_page:
+            raise RuntimeError('fallo de escritura')
+        return {'inserted': len(page), 'updated': 0, 'skipped': 0}
+
+    async def prune_volumetry(self, table_name):
+        pass
+
+
+def fake_pages(total):
+    async def iter_pages(client, entity, window_start, window_end):
+        for page_number in range(1, total + 1):
+            yield [{'record': {'Id': str(page_number)}, 'page_number': page_number}]
+    return iter_pages
+
+
+def run(db, prefetch_pages=1):
+    return asyncio.run(asyncio.wait_for(
+        load_window_async(None, db, 'Invoice', 'raw.qb_invoices', 'invoices', *WINDOW,
+                          prefetch_pages=prefetch_pages),
+        timeout=5
+    ))
+
+
+def test_loads_every_page(monkeypatch):
+    monkeypatch.setattr(async_db_utils, 'iter_pages_async', fake_pages(5))
+    db = FakeAsyncDB()
+    result = run(db)
+    assert (result['pages'], result['inserted']) == (5, 5)
+    assert db.logged == [('completed', None)]
+
+
+def test_write_failure_with_full_queue_does_not_hang(monkeypatch):
+    # Al fallar la escritura el productor espera lugar en la cola llena
+    monkeypatch.setattr(async_db_utils, 'iter_pages_async', fake_pages(50))
+    db = FakeAsyncDB(fail_on_page=2)
+
+    async def load_and_list_pending():
+        with pytest.raises(RuntimeError, match='fallo de escritura'):
+            await load_window_async(None, db, 'Invoice', 'raw.qb_invoices', 'invoices', *WINDOW,
+                                    prefetch_pages=1)
+        await asyncio.sleep(0.1)
+        return [task for task in asyncio.all_tasks() if task.get_coro().__name__ == 'produce']
+
+    # El productor termino: no queda colgado esperando la cola
+    assert asyncio.run(asyncio.wait_for(load_and_list_pending(), timeout=5)) == []
+    assert db.logged == [('failed', 'fallo de escritura')]
+
+
+def invoice(record_id, sync_token, total):
+    return {
+        'record': {
+            'Id': record_id, 'SyncToken': str(sync_token), 'TotalAmt': total,
+            'MetaData': {'LastUpdatedTime': '2024-01-10T00:00:00Z'}
+        },
+        'page_number': 1, 'page_size': 100,
+        'extract_window_start': WINDOW[0], 'extract_window_end': WINDOW[1]
+    }
+
+
+def test_async_upsert_skips_stale_versions(db):
+    async def load():
+        client = async_db_utils.get_async_postgres_client()
+        try:
+            first = await client.upsert_records(
+                'raw.qb_invoices', [invoice('1', 3, 30), invoice('2', 1, 10)], *WINDOW
+            )
+            # Un re-intento con una version vieja no pisa la ya cargada; una nueva si
+            second = await client.upsert_records(
+                'raw.qb_invoices', [invoice('1', 2, 20), invoice('2', 4, 40)], *WINDOW
+            )
+        finally:
+            await client.close()
+        return first, second
+
+    first, second = asyncio.run(load())
+    assert (first['inserted'], first['updated']) == (2, 0)
+    assert (second['updated'], second['skipped']) == (1, 1)
+    with db.connect().cursor() as cursor:
+        cursor.execute("SELECT id, sync_token, payload->>'TotalAmt' FROM raw.qb_invoices ORDER BY id")
+        assert cursor.fetchall() == [('1', 3, '30'), ('2', 4, '40')]
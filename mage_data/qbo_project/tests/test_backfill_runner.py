@@ -0,0 +1,39 @@
+"""Tests de utils.backfill_runner.resume_point"""
+from datetime import datetime, timezone
+
+from utils.backfill_runner import resume_point
+
+WINDOW = ('2024-01-01T00:00:00Z', '2024-01-31T23:59:59Z')
+
+
+class FakeDB:
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+
+    def get_checkpoint(self, entity_name, window_start, window_end):
+        return self.checkpoint
+
+
+def test_without_checkpoint_starts_at_page_one():
+    assert resume_point(FakeDB(None), 'invoices', *WINDOW, 100) == (1, 0, None)
+
+
+def test_resumes_after_last_page_from_its_date():
+    checkpoint = {
+        'last_page': 7, 'page_size': 100, 'records_loaded': 700,
+        'resume_from_utc': datetime(2024, 1, 9, 8, 30, tzinfo=timezone.utc)
+    }
+    assert resume_point(FakeDB(checkpoint), 'invoices', *WINDOW, 100) == (8, 700, '2024-01-09T08:30:00Z')
+
+
+def test_checkpoint_without_date_restarts():
+    checkpoint = {'last_page': 7, 'page_size': 100, 'records_loaded': 700, 'resume_from_utc': None}
+    assert resume_point(FakeDB(checkpoint), 'invoices', *WINDOW, 100) == (1, 0, None)
+
+
+def test_other_page_size_restarts():
+    checkpoint = {
+        'last_page': 7, 'page_size': 50, 'records_loaded': 350,
+        'resume_from_utc': datetime(2024, 1, 9, tzinfo=timezone.utc)
+    }
+    assert resume_point(FakeDB(checkpoint), 'invoices', *WINDOW, 100) == (1, 0, None)
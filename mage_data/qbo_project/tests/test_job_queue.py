@@ -0,0 +1,77 @@
+"""Tests de utils.job_queue contra Postgres (fixture db): claim, lease y backoff"""
+from utils.job_queue import (
+    RETRY_BACKOFF_SECONDS, enqueue_windows, claim_job, heartbeat_job, complete_job, fail_job
+)
+
+RANGE = ('2024-01-01T00:00:00Z', '2024-02-29T23:59:59Z')
+
+
+def job_state(db, job_id):
+    with db.connect().cursor() as cursor:
+        cursor.execute("""
+            SELECT status, attempts, EXTRACT(EPOCH FROM available_at_utc - NOW())
+            FROM raw.backfill_jobs WHERE id = %s
+        """, (job_id,))
+        status, attempts, wait = cursor.fetchone()
+    db.connect().commit()
+    return status, attempts, float(wait)
+
+
+def expire(db, job_id, column):
+    with db.connect().cursor() as cursor:
+        cursor.execute(
+            f"UPDATE raw.backfill_jobs SET {column} = NOW() - INTERVAL '1 second' WHERE id = %s",
+            (job_id,)
+        )
+    db.connect().commit()
+
+
+def test_workers_claim_distinct_windows_in_order(db):
+    assert enqueue_windows(db, 'invoices', *RANGE) == 2
+    assert enqueue_windows(db, 'invoices', *RANGE) == 0
+
+    first = claim_job(db, 'worker-a')
+    second = claim_job(db.clone(), 'worker-b')
+    assert first['window_start'] == '2024-01-01T00:00:00Z'
+    assert second['window_start'] == '2024-02-01T00:00:00Z'
+    assert claim_job(db, 'worker-c') is None
+
+
+def test_expired_lease_is_reassigned(db):
+    enqueue_windows(db, 'invoices', '2024-01-01T00:00:00Z', '2024-01-31T23:59:59Z')
+    job = claim_job(db, 'worker-a')
+    expire(db, job['id'], 'lease_expires_at_utc')
+
+    retaken = claim_job(db, 'worker-b')
+    assert (retaken['id'], retaken['attempts']) == (job['id'], 2)
+    # El worker original perdio el lease: no renueva ni completa
+    assert not heartbeat_job(db, job['id'], 'worker-a')
+    assert not complete_job(db, job['id'], 'worker-a')
+    assert complete_job(db, job['id'], 'worker-b')
+
+
+def test_failures_back_off_until_attempts_run_out(db):
+    window = ('2024-01-01T00:00:00Z', '2024-01-31T23:59:59Z')
+    enqueue_windows(db, 'invoices', *window, max_attempts=3)
+
+    # Backoff exponencial: 60s tras el primer fallo, 120s tras el segundo
+    for attempt in (1, 2):
+        job = claim_job(db, 'worker-a')
+        assert fail_job(db, job['id'], 'worker-a', 'timeout') == 'pending'
+        status, attempts, wait = job_state(db, job['id'])
+        backoff = RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+        assert (status, attempts) == ('pending', attempt)
+        assert backoff - 5 < wait <= backoff
+        # Durante el backoff el job no se reclama
+        assert claim_job(db, 'worker-a') is None
+        expire(db, job['id'], 'available_at_utc')
+
+    job = claim_job(db, 'worker-a')
+    assert fail_job(db, job['id'], 'worker-a', 'timeout') == 'failed'
+    assert job_state(db, job['id'])[:2] == ('failed', 3)
+    assert claim_job(db, 'worker-a') is None
+
+    # Re-encolar el rango devuelve el job fallido a la cola
+    assert enqueue_windows(db, 'invoices', *window) == 1
+    assert job_state(db, job['id'])[:2] == ('pending', 0)
+    assert claim_job(db, 'worker-a')['id'] == job['id']
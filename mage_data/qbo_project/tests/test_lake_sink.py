@@ -0,0 +1,70 @@
+"""Tests de utils.lake_sink.LakeSink: sobrescritura de ventanas y una fila por Id"""
+import os
+
+import pyarrow.parquet as pq
+
+from utils.lake_sink import LakeSink
+
+JANUARY = ('2024-01-01T00:00:00Z', '2024-01-31T23:59:59Z')
+FEBRUARY = ('2024-02-01T00:00:00Z', '2024-02-29T23:59:59Z')
+
+
+def item(record_id, sync_token, updated):
+    return {
+        'record': {'Id': record_id, 'SyncToken': str(sync_token), 'MetaData': {'LastUpdatedTime': updated}},
+        'page_number': 1, 'page_size': 100, 'position_in_page': 0
+    }
+
+
+def load(sink, window, records):
+    sink.upsert_records('raw.qb_customers', records, *window)
+    return sink.commit_window('raw.qb_customers', *window)
+
+
+def lake_rows(root):
+    """(id, sync_token, particion) de todos los archivos publicados"""
+    rows = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            assert not name.endswith('.tmp')
+            partition = os.path.basename(directory)
+            for row in pq.read_table(os.path.join(directory, name)).to_pylist():
+                rows.append((row['id'], row['sync_token'], partition))
+    return sorted(rows)
+
+
+def test_rerun_overwrites_only_its_window(tmp_path):
+    sink = LakeSink(root=str(tmp_path))
+    load(sink, JANUARY, [item('a', 1, '2024-01-05T00:00:00Z'), item('b', 1, '2024-01-20T00:00:00Z')])
+    load(sink, FEBRUARY, [item('c', 1, '2024-02-03T00:00:00Z')])
+
+    # Re-ejecutar enero reemplaza sus archivos (incluida la particion que ya no tiene filas)
+    result = load(sink, JANUARY, [item('a', 2, '2024-01-07T00:00:00Z')])
+    assert result['records'] == 1
+    assert lake_rows(tmp_path) == [
+        ('a', 2, 'last_updated_date=2024-01-07'),
+        ('c', 1, 'last_updated_date=2024-02-03'),
+    ]
+
+
+def test_aborted_rerun_keeps_published_window(tmp_path):
+    sink = LakeSink(root=str(tmp_path))
+    load(sink, JANUARY, [item('a', 1, '2024-01-05T00:00:00Z')])
+
+    sink.upsert_records('raw.qb_customers', [item('a', 2, '2024-01-06T00:00:00Z')], *JANUARY)
+    sink.abort_window('raw.qb_customers', *JANUARY)
+    assert lake_rows(tmp_path) == [('a', 1, 'last_updated_date=2024-01-05')]
+
+
+def test_one_row_per_id_when_newer_version_arrives_after_flush(tmp_path, monkeypatch):
+    monkeypatch.setattr(LakeSink, 'ROW_GROUP_ROWS', 1)
+    sink = LakeSink(root=str(tmp_path))
+    sink.upsert_records('raw.qb_customers', [item('a', 3, '2024-01-05T00:00:00Z')], *JANUARY)
+    counts = sink.upsert_records('raw.qb_customers', [
+        item('a', 2, '2024-01-09T00:00:00Z'),   # SyncToken menor: se omite
+        item('a', 4, '2024-01-10T00:00:00Z'),   # Reemplaza la fila ya escrita en otra particion
+    ], *JANUARY)
+    assert counts == {'inserted': 0, 'updated': 1, 'skipped': 1}
+
+    sink.commit_window('raw.qb_customers', *JANUARY)
+    assert lake_rows(tmp_path) == [('a', 4, 'last_updated_date=2024-01-10')]
@@ -0,0 +1,139 @@
+"""Tests de utils.page_journal: recuperacion de frames truncados y checksums"""
+import os
+
+import pytest
+
+from utils.page_journal import FRAME_HEADER, PageJournal, journaled_pages
+
+WINDOW = ('2024-01-01T00:00:00Z', '2024-01-31T23:59:59Z')
+
+
+def make_page(page_number, size=3):
+    updated = f"2024-01-{page_number:02d}T00:00:00Z"
+    return [
+        {'record': {'Id': f"{page_number}-{i}", 'MetaData': {'LastUpdatedTime': updated}},
+         'page_number': page_number}
+        for i in range(size)
+    ]
+
+
+def new_journal(root):
+    return PageJournal('invoices', *WINDOW, root=str(root))
+
+
+def segment_file(journal, segment=0):
+    return journal._segment_path(segment)
+
+
+def test_append_and_read_roundtrip(tmp_path):
+    journal = new_journal(tmp_path)
+    for page_number in (1, 2, 3):
+        journal.append(make_page(page_number))
+
+    reopened = new_journal(tmp_path)
+    pages = [page for _, page in reopened.read()]
+    assert reopened.last_page() == 3
+    assert pages == [make_page(1), make_page(2), make_page(3)]
+    assert [page[0]['page_number'] for _, page in reopened.read(start_page=2)] == [2, 3]
+
+
+def test_torn_body_is_truncated_on_reopen(tmp_path):
+    journal = new_journal(tmp_path)
+    journal.append(make_page(1))
+    journal.append(make_page(2))
+    valid_size = os.path.getsize(segment_file(journal))
+
+    # Caida a mitad de escritura: la cabecera completa y solo parte del cuerpo
+    journal.append(make_page(3))
+    with open(segment_file(journal), 'r+b') as handle:
+        handle.truncate(valid_size + FRAME_HEADER.size + 5)
+
+    reopened = new_journal(tmp_path)
+    assert reopened.last_page() == 2
+    assert os.path.getsize(segment_file(reopened)) == valid_size
+
+    reopened.append(make_page(3))
+    assert [page[0]['page_number'] for _, page in new_journal(tmp_path).read()] == [1, 2, 3]
+
+
+def test_torn_header_is_truncated_on_reopen(tmp_path):
+    journal = new_journal(tmp_path)
+    journal.append(make_page(1))
+    valid_size = os.path.getsize(segment_file(journal))
+    with open(segment_file(journal), 'ab') as handle:
+        handle.write(b'QBJ')
+
+    reopened = new_journal(tmp_path)
+    assert reopened.last_page() == 1
+    assert os.path.getsize(segment_file(reopened)) == valid_size
+    assert len(list(reopened.read())) == 1
+
+
+def test_crc_mismatch_raises(tmp_path):
+    journal = new_journal(tmp_path)
+    journal.append(make_page(1))
+    journal.append(make_page(2))
+
+    # Alterar un byte del cuerpo del primer frame (mismo largo, otro CRC)
+    with open(segment_file(journal), 'r+b') as handle:
+        handle.seek(FRAME_HEADER.size + 2)
+        byte = handle.read(1)
+        handle.seek(FRAME_HEADER.size + 2)
+        handle.write(bytes([byte[0] ^ 0xFF]))
+
+    with pytest.raises(RuntimeError, match='Checksum invalido'):
+        list(new_journal(tmp_path).read())
+
+
+def test_bad_magic_raises(tmp_path):
+    journal = new_journal(tmp_path)
+    journal.append(make_page(1))
+    with open(segment_file(journal), 'r+b') as handle:
+        handle.write(b'XXXX')
+
+    with pytest.raises(RuntimeError, match='Journal corrupto'):
+        new_journal(tmp_path).last_page()
+
+
+def test_journaled_pages_resumes_after_last_journaled_page(tmp_path):
+    journal = new_journal(tmp_path)
+    journal.append(make_page(1))
+    journal.append(make_page(2))
+    requested = []
+
+    def fetch_pages(first_page, resume_from):
+        requested.append((first_page, resume_from))
+        for page_number in range(first_page, 5):
+            yield make_page(page_number)
+
+    pages = list(journaled_pages(new_journal(tmp_path), fetch_pages))
+    assert [page[0]['page_number'] for page in pages] == [1, 2, 3, 4]
+    # La API se retoma desde la mayor fecha ya extraida
+    assert requested == [(3, '2024-01-02T00:00:00Z')]
+    assert new_journal(tmp_path).is_complete()
+
+    # Con el journal completo no se pide nada a la API
+    requested.clear()
+    assert len(list(journaled_pages(new_journal(tmp_path), fetch_pages, start_page=2))) == 3
+    assert requested == []
+
+
+def test_expired_journal_is_discarded_before_replay(tmp_path):
+    journal = new_journal(tmp_path)
+    journal.append(make_page(1))
+    journal.append(make_page(2))
+    journal.mark_complete()
+    journal._write_json('journal.json', {'created_at_utc': '2024-01-01T00:00:00+00:00'})
+    requested = []
+
+    def fetch_pages(first_page, resume_from):
+        requested.append((first_page, resume_from))
+        yield make_page(first_page)
+
+    reopened = new_journal(tmp_path)
+    assert reopened.age_hours() > 24
+    pages = list(journaled_pages(reopened, fetch_pages, max_age_hours=24))
+    # El journal viejo no se repite: el tramo se vuelve a pedir a la API
+    assert requested == [(1, None)]
+    assert [page[0]['page_number'] for page in pages] == [1]
+    assert new_journal(tmp_path).age_hours() < 1
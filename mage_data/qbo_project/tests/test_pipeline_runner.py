@@ -0,0 +1,41 @@
+"""Tests de utils.pipeline_runner.ContiguousPages"""
+from datetime import datetime, timezone
+
+from utils.pipeline_runner import ContiguousPages
+
+
+def day(n):
+    return datetime(2024, 1, n, tzinfo=timezone.utc)
+
+
+def test_in_order_pages_advance():
+    pages = ContiguousPages(first_page=1)
+    assert pages.mark([(1, 100, day(1))])
+    assert pages.mark([(2, 100, day(2))])
+    assert pages.last_contiguous == 2
+    assert pages.records_loaded == 200
+    assert pages.resume_from == day(2)
+
+
+def test_gap_holds_checkpoint_until_filled():
+    pages = ContiguousPages(first_page=1)
+    assert not pages.mark([(2, 100, day(2)), (3, 100, day(3))])
+    assert pages.last_contiguous == 0
+    assert pages.records_loaded == 0
+    assert pages.resume_from is None
+
+    assert pages.mark([(1, 40, day(1))])
+    assert pages.last_contiguous == 3
+    assert pages.records_loaded == 240
+    assert pages.resume_from == day(3)
+
+
+def test_resume_from_checkpoint():
+    pages = ContiguousPages(first_page=11, records_before=1000, resume_from='2024-01-10T00:00:00Z')
+    assert pages.last_contiguous == 10
+    assert pages.resume_from == day(10)
+    assert not pages.mark([(12, 100, day(12))])
+    assert pages.mark([(11, 100, None)])
+    assert pages.last_contiguous == 12
+    assert pages.records_loaded == 1200
+    assert pages.resume_from == day(12)
@@ -0,0 +1,117 @@
+"""Tests de utils.qbo_client: paginacion ordenada y reanudacion por fecha"""
+import re
+
+from utils.qbo_client import QBOClient
+
+
+class FakeQBO(QBOClient):
+    """QBOClient que responde las queries sobre una lista en memoria"""
+
+    PAGE_SIZE = 2
+
+    def __init__(self, records):
+        super().__init__(auth=object())
+        # id -> MetaData.LastUpdatedTime
+        self.records = dict(records)
+        self.queries = []
+
+    def query(self, query_string):
+        self.queries.append(query_string)
+        entity = re.search(r"FROM (\w+)", query_string).group(1)
+        since = re.search(r">= '([^']+)'", query_string)
+        until = re.search(r"<= '([^']+)'", query_string)
+        rows = sorted(
+            (updated, record_id) for record_id, updated in self.records.items()
+            if (not since or updated >= since.group(1)) and (not until or updated <= until.group(1))
+        )
+        if 'ORDERBY' not in query_string:
+            rows.reverse()
+        if 'COUNT(*)' in query_string:
+            return {'QueryResponse': {'totalCount': len(rows)}}
+        position = int(re.search(r"STARTPOSITION (\d+)", query_string).group(1))
+        size = int(re.search(r"MAXRESULTS (\d+)", query_string).group(1))
+        return {'QueryResponse': {entity: [
+            {'Id': record_id, 'SyncToken': '0', 'MetaData': {'LastUpdatedTime': updated}}
+            for updated, record_id in rows[position - 1:position - 1 + size]
+        ]}}
+
+
+WINDOW = ('2024-01-01T00:00:00Z', '2024-01-31T23:59:59Z')
+RECORDS = {
+    'a': '2024-01-01T10:00:00Z',
+    'b': '2024-01-02T10:00:00Z',
+    'c': '2024-01-03T10:00:00Z',
+    'd': '2024-01-04T10:00:00Z',
+    'e': '2024-01-05T10:00:00Z',
+}
+
+
+def ids(pages):
+    return [item['record']['Id'] for page in pages for item in page]
+
+
+def test_build_query_orders_by_date_field():
+    client = FakeQBO(RECORDS)
+    query = client.build_query('Invoice', 1, *WINDOW)
+    assert 'ORDERBY MetaData.LastUpdatedTime STARTPOSITION 1 MAXRESULTS 2' in query
+
+
+def test_full_window_in_date_order():
+    client = FakeQBO(RECORDS)
+    pages = list(client.fetch_entity_pages('Invoice', *WINDOW))
+    assert ids(pages) == ['a', 'b', 'c', 'd', 'e']
+    assert [page[0]['page_number'] for page in pages] == [1, 2, 3]
+
+
+def test_resume_by_date_survives_records_leaving_the_window():
+    client = FakeQBO(RECORDS)
+    first_page = next(client.fetch_entity_pages('Invoice', *WINDOW))
+    assert ids([first_page]) == ['a', 'b']
+
+    # Tras la caida 'a' se modifica y sale de la ventana: las posiciones se corren
+    client.records['a'] = '2024-02-10T00:00:00Z'
+
+    # Por posicion (STARTPOSITION 3) se saltearia 'c'
+    assert 'c' not in ids(client.fetch_entity_pages('Invoice', *WINDOW, start_page=2))
+
+    # Por fecha se relee 'b' (mismo LastUpdatedTime, UPSERT idempotente) y no se pierde nada
+    pages = list(client.fetch_entity_pages(
+        'Invoice', *WINDOW, start_page=2, resume_from=RECORDS['b']
+    ))
+    assert ids(pages) == ['b', 'c', 'd', 'e']
+    assert [page[0]['page_number'] for page in pages] == [2, 3]
+
+
+def test_fetch_page_numbers_from_first_page():
+    client = FakeQBO(RECORDS)
+    page = client.fetch_page('Invoice', 3, RECORDS['c'], WINDOW[1], first_page=2)
+    assert ids([page]) == ['e']
+    assert page[0]['page_number'] == 3
+
+
+class RecordingQBO(QBOClient):
+    """QBOClient que solo registra las queries (respuestas vacias)"""
+
+    def __init__(self):
+        super().__init__(auth=object())
+        self.queries = []
+
+    def query(self, query_string):
+        self.queries.append(query_string)
+        return {'QueryResponse': {}}
+
+
+def test_entity_conditions_apply_to_extraction_count_and_ids():
+    for entity in ('Customer', 'Item'):
+        client = RecordingQBO()
+        client.queries.append(client.build_query(entity, 1, *WINDOW))
+        client.count(entity, *WINDOW)
+        list(client.fetch_by_ids(entity, ['1', '2']))
+
+        assert len(client.queries) == 3
+        for query in client.queries:
+            assert f"FROM {entity} WHERE" in query
+            assert 'Active IN (true, false)' in query
+
+    # Las entidades sin condiciones no cambian
+    assert 'Active' not in RecordingQBO().build_query('Invoice', 1, *WINDOW)
@@ -0,0 +1,32 @@
+"""Tests de utils.reconciliation.merge_versions"""
+from utils.reconciliation import merge_versions
+
+
+def test_identical_sides_yield_nothing():
+    remote = [('1', 0), ('2', 3)]
+    local = [('1', 0, False), ('2', 3, False)]
+    assert list(merge_versions(remote, local)) == []
+
+
+def test_all_actions():
+    remote = [('1', 0), ('3', 5), ('4', 1), ('6', 2)]
+    local = [('2', 1, False), ('3', 4, False), ('4', 1, True), ('5', 0, True), ('7', 0, False)]
+    assert list(merge_versions(remote, local)) == [
+        ('missing', '1'),
+        ('deleted', '2'),
+        ('stale', '3'),
+        ('restored', '4'),
+        ('missing', '6'),
+        ('deleted', '7'),
+    ]
+
+
+def test_unknown_sync_tokens():
+    remote = [('1', None), ('2', 3)]
+    local = [('1', 2, False), ('2', None, False)]
+    assert list(merge_versions(remote, local)) == [('stale', '2')]
+
+
+def test_empty_sides():
+    assert list(merge_versions([('1', 0)], [])) == [('missing', '1')]
+    assert list(merge_versions([], [('1', 0, False), ('2', 0, True)])) == [('deleted', '1')]
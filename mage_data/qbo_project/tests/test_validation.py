@@ -0,0 +1,31 @@
+"""Tests de utils.validation.collapse_versions"""
+from utils.validation import VersionIndex, collapse_versions, empty_report
+
+
+def test_unique_ids_are_all_kept():
+    report = empty_report()
+    keep = collapse_versions([(0, 'a', 1), (1, 'b', 1), (2, 'c', 1)], VersionIndex(), report)
+    assert keep == [0, 1, 2]
+    assert report['valid'] == 3
+    assert report['duplicates'] == 0
+
+
+def test_newest_copy_in_batch_wins():
+    report = empty_report()
+    keep = collapse_versions([(0, 'a', 1), (1, 'b', 1), (2, 'a', 3), (3, 'a', 2)], VersionIndex(), report)
+    assert keep == [1, 2]
+    assert report['duplicates'] == 2
+    assert report['superseded'] == 0
+    assert report['valid'] == 2
+
+
+def test_newer_copy_in_later_batch_is_reemitted():
+    versions = VersionIndex()
+    collapse_versions([(0, 'a', 1), (1, 'b', 5)], versions, empty_report())
+
+    report = empty_report()
+    keep = collapse_versions([(0, 'a', 2), (1, 'b', 4)], versions, report)
+    assert keep == [0]
+    assert report['duplicates'] == 2
+    assert report['superseded'] == 1
+    assert report['valid'] == 1
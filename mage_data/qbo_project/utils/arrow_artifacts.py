@@ -0,0 +1,328 @@
+"""
+Artefactos Arrow para el intercambio entre bloques de Mage
+En lugar de una lista de dicts anidados, extract/transform/load intercambian
+un handle pequeno que apunta a un archivo Arrow IPC (memory-mapped al leer)
+"""
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    import pyarrow as pa
+except ImportError:
+    # pyarrow es opcional: solo se requiere con formato_intercambio = arrow
+    pa = None
+
+from utils.db_utils import TYPED_COLUMNS
+from utils.backfill_windows import parse_utc
+from utils.validation import (
+    get_validation_engine, empty_report, merge_reports, pack_version,
+    init_worker, worker_engine, map_ordered
+)
+
+
+ARTIFACT_FORMAT = 'arrow'
+
+# Directorio de artefactos (por defecto junto a variables_dir de Mage)
+ARTIFACTS_DIR = os.environ.get('QBO_ARTIFACTS_DIR') or os.path.join(
+    os.path.expanduser('~'), '.mage_data', 'qbo_artifacts'
+)
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "pyarrow no esta instalado. Instalar con: pip install pyarrow"
+        )
+
+
+def artifact_schema():
+    """
+    Esquema columnar: columnas tipadas para filtrar sin decodificar el
+    payload, y el payload como bytes JSON
+    """
+    _require_pyarrow()
+    return pa.schema([
+        ('id', pa.string()),
+        ('sync_token', pa.int64()),
+        ('last_updated_utc', pa.timestamp('us', tz='UTC')),
+        ('page_number', pa.int32()),
+        ('page_size', pa.int32()),
+        ('position_in_page', pa.int32()),
+        ('payload', pa.binary()),
+    ])
+
+
+def _to_batch(items: List[Dict[str, Any]]):
+    """Convierte registros extraidos (dicts con 'record') a un RecordBatch"""
+    records = [item.get('record') or {} for item in items]
+    last_updated = [TYPED_COLUMNS['last_updated_utc'](record) for record in records]
+
+    return pa.record_batch([
+        pa.array([record.get('Id') for record in records], pa.string()),
+        pa.array([TYPED_COLUMNS['sync_token'](record) for record in records], pa.int64()),
+        pa.array([parse_utc(ts) if ts else None for ts in last_updated], pa.timestamp('us', tz='UTC')),
+        pa.array([item.get('page_number') for item in items], pa.int32()),
+        pa.array([item.get('page_size') for item in items], pa.int32()),
+        pa.array([item.get('position_in_page') for item in items], pa.int32()),
+        pa.array([json.dumps(record).encode('utf-8') for record in records], pa.binary()),
+    ], schema=artifact_schema())
+
+
+def is_artifact(data) -> bool:
+    """True si la salida de un bloque es un handle de artefacto Arrow"""
+    return isinstance(data, dict) and data.get('format') == ARTIFACT_FORMAT
+
+
+class ArtifactWriter:
+    """
+    Escribe paginas extraidas a un archivo Arrow IPC a medida que llegan
+
+    La memoria del extract queda acotada a una pagina; close() retorna el
+    handle que el bloque entrega a Mage.
+    """
+
+    def __init__(self, entity_name: str, window_start: str, window_end: str):
+        _require_pyarrow()
+        os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+        self.path = os.path.join(ARTIFACTS_DIR, f"{entity_name}_{uuid.uuid4().hex}.arrow")
+        self.entity_name = entity_name
+        self.window_start = window_start
+        self.window_end = window_end
+        self.records = 0
+        self._sink = pa.OSFile(self.path, 'wb')
+        self._writer = pa.ipc.new_file(self._sink, artifact_schema())
+
+    def write_page(self, items: List[Dict[str, Any]]):
+        if items:
+            self._writer.write_batch(_to_batch(items))
+            self.records += len(items)
+
+    def close(self) -> Dict[str, Any]:
+        self._writer.close()
+        self._sink.close()
+        return {
+            'format': ARTIFACT_FORMAT,
+            'path': self.path,
+            'entity': self.entity_name,
+            'records': self.records,
+            'extract_window_start': self.window_start,
+            'extract_window_end': self.window_end,
+            'transformed_at_utc': None,
+            'source_path': None
+        }
+
+    def abort(self):
+        """Descarta el archivo parcial (extraccion fallida)"""
+        try:
+            self._writer.close()
+            self._sink.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def open_reader(path: str):
+    """Lector del archivo IPC memory-mapped (acceso por indice de lote)"""
+    _require_pyarrow()
+    return pa.ipc.open_file(pa.memory_map(path, 'r'))
+
+
+def read_table(handle: Dict[str, Any]):
+    """Abre el artefacto memory-mapped (sin copiar los buffers a memoria)"""
+    return open_reader(handle['path']).read_all()
+
+
+class RecordsView(Sequence):
+    """
+    Vista de solo lectura de un artefacto con la interfaz de la lista de
+    dicts original ({'record': ..., 'page_number': ..., ...})
+
+    Los payloads se decodifican por lote al iterar, no todos a la vez.
+    """
+
+    def __init__(self, handle: Dict[str, Any]):
+        self.handle = handle
+        self.table = read_table(handle)
+
+    def _item(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        item = {
+            'record': json.loads(row['payload']),
+            'page_number': row['page_number'],
+            'page_size': row['page_size'],
+            'position_in_page': row['position_in_page'],
+            'extract_window_start': self.handle['extract_window_start'],
+            'extract_window_end': self.handle['extract_window_end'],
+        }
+        if self.handle.get('transformed_at_utc'):
+            item['transformed_at_utc'] = self.handle['transformed_at_utc']
+        return item
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Indice fuera de rango')
+        return self._item(self.table.slice(index, 1).to_pylist()[0])
+
+    def __iter__(self):
+        for batch in self.table.to_batches():
+            for row in batch.to_pylist():
+                yield self._item(row)
+
+
+def as_records(data):
+    """
+    Adaptador para bloques y tests: retorna la lista original o una
+    RecordsView si la salida es un artefacto Arrow
+    """
+    if is_artifact(data):
+        return RecordsView(data)
+    return data
+
+
+def _validate_batch(engine, batch, chosen: List[int]) -> Tuple[List[int], Dict[str, Any]]:
+    """Decodifica las filas elegidas de un lote y evalua las reglas"""
+    payloads = batch.column(batch.schema.get_field_index('payload'))
+    records = [json.loads(p) for p in payloads.take(pa.array(chosen, pa.int32())).to_pylist()]
+    passed, report = engine.apply_rules(records)
+    report['valid'] = len(passed)
+    return [chosen[i] for i in passed], report
+
+
+# Lectores abiertos en el proceso actual del pool (uno por artefacto)
+_worker_readers: Dict[str, Any] = {}
+
+
+def _validate_batch_in_worker(path: str, batch_index: int, chosen: List[int]):
+    """Tarea del pool: el proceso lee el lote del mismo archivo memory-mapped"""
+    reader = _worker_readers.get(path)
+    if reader is None:
+        reader = _worker_readers[path] = open_reader(path)
+    return _validate_batch(worker_engine(), reader.get_batch(batch_index), chosen)
+
+
+def filter_artifact(
+    handle: Dict[str, Any],
+    entity_name: Optional[str] = None,
+    references: Optional[Dict[str, set]] = None,
+    workers: int = 1
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Valida un artefacto con las reglas de la entidad, lote por lote
+
+    Primera pasada sobre las columnas tipadas (id, sync_token,
+    last_updated_utc, sin decodificar payloads): elige por Id la fila con
+    la version mas reciente de toda la ventana. Segunda pasada: decodifica
+    un RecordBatch a la vez, evalua las reglas (ver utils.validation) sobre
+    las filas elegidas y escribe un nuevo artefacto con las validas, sin
+    re-serializar los payloads.
+
+    Con workers > 1 la segunda pasada se reparte por lote en un pool de
+    procesos: cada proceso abre el mismo archivo memory-mapped, asi que
+    solo viajan el indice del lote y las posiciones elegidas.
+
+    Returns:
+        tuple: (handle del artefacto filtrado, reporte de calidad)
+    """
+    reader = open_reader(handle['path'])
+    entity_name = entity_name or handle.get('entity')
+    report = empty_report()
+
+    # Id -> (version, fila global) de la copia mas reciente
+    latest: Dict[str, Tuple[int, int]] = {}
+    collapsed = 0
+    received = 0
+    for batch_index in range(reader.num_record_batches):
+        batch = reader.get_batch(batch_index)
+        columns = batch.select(['id', 'sync_token', 'last_updated_utc']).to_pydict()
+        for record_id, token, last_updated in zip(
+            columns['id'], columns['sync_token'], columns['last_updated_utc']
+        ):
+            if record_id:
+                version = pack_version(token, last_updated)
+                current = latest.get(record_id)
+                if current is None:
+                    latest[record_id] = (version, received)
+                else:
+                    collapsed += 1
+                    if version > current[0]:
+                        latest[record_id] = (version, received)
+            received += 1
+
+    # Posiciones elegidas por lote (ids nulos pasan para que las reglas los cuenten)
+    tasks = []
+    row = 0
+    for batch_index in range(reader.num_record_batches):
+        ids = reader.get_batch(batch_index).column(0).to_pylist()
+        chosen = [
+            position for position, record_id in enumerate(ids)
+            if not record_id or latest[record_id][1] == row + position
+        ]
+        row += len(ids)
+        if chosen:
+            tasks.append((handle['path'], batch_index, chosen))
+
+    executor = None
+    if workers > 1 and len(tasks) > 1:
+        print(f"[TRANSFORM] Validacion en {workers} procesos: {len(tasks)} lotes")
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(entity_name, references)
+        )
+        results = map_ordered(executor, _validate_batch_in_worker, tasks, max_pending=workers * 2)
+    else:
+        engine = get_validation_engine(entity_name, references)
+        results = (
+            _validate_batch(engine, reader.get_batch(batch_index), chosen)
+            for _, batch_index, chosen in tasks
+        )
+
+    # Se escribe a .tmp y se renombra al terminar: un fallo a mitad de la
+    # validacion no deja un artefacto parcial con nombre definitivo
+    path = os.path.join(ARTIFACTS_DIR, f"{handle['entity']}_{uuid.uuid4().hex}.arrow")
+    try:
+        with pa.OSFile(path + '.tmp', 'wb') as sink:
+            with pa.ipc.new_file(sink, reader.schema) as writer:
+                for (_, batch_index, _), (positions, batch_report) in zip(tasks, results):
+                    merge_reports(report, batch_report)
+                    if positions:
+                        batch = reader.get_batch(batch_index)
+                        writer.write_batch(batch.take(pa.array(positions, pa.int32())))
+        os.replace(path + '.tmp', path)
+    except Exception:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    report['received'] = received
+    report['duplicates'] = collapsed
+
+    filtered = dict(handle)
+    filtered.update({
+        'path': path,
+        'records': report['valid'],
+        'transformed_at_utc': datetime.now(timezone.utc).isoformat(),
+        'source_path': handle['path']
+    })
+    return filtered, report
+
+
+def remove_artifacts(handle: Optional[Dict[str, Any]]):
+    """Elimina el artefacto y el artefacto de origen (tras una carga exitosa)"""
+    if not is_artifact(handle):
+        return
+    for path in (handle.get('path'), handle.get('source_path')):
+        if path and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,616 @@
+"""
+Cliente asincrono de PostgreSQL basado en asyncpg
+Carga paginas con COPY binario mientras se descargan las siguientes
+
+Uso (desde mage_data/qbo_project):
+    python -m utils.async_db_utils --entidad invoices \\
+        --fecha-inicio 2024-01-01T00:00:00Z --fecha-fin 2024-01-31T23:59:59Z
+"""
+import argparse
+import asyncio
+import json
+import random
+import uuid
+from datetime import datetime, date, timezone
+from decimal import Decimal
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+try:
+    import asyncpg
+except ImportError:
+    # asyncpg es opcional: solo se requiere para el modo asincrono
+    asyncpg = None
+
+from utils.qbo_client import get_qbo_client
+from utils.db_utils import PostgresClient, get_secret_value, typed_columns_for, CHILD_TABLES
+from utils.backfill_runner import ENTITIES, get_entity_config
+from utils.validation import record_version
+
+
+class AsyncPostgresClient:
+    """
+    Variante asincrona de PostgresClient
+
+    Cada pagina se carga en una transaccion: COPY binario
+    (copy_records_to_table) a una tabla temporal y un INSERT ... SELECT
+    ... ON CONFLICT sobre la tabla destino; solicitudes, contadores,
+    volumetria y tablas hijas (lineas de factura) se actualizan con
+    sentencias por pagina, no por fila.
+    """
+
+    # Tabla temporal de staging; se vacia sola al confirmar cada pagina
+    STAGE_TABLE = 'qb_stage'
+    STAGE_COLUMNS = [
+        'id',
+        'payload',
+        'ingested_at_utc',
+        'extract_window_start_utc',
+        'extract_window_end_utc',
+        'page_number',
+        'page_size',
+        'extraction_request_id'
+    ]
+
+    # Con un Id repetido en la pagina, DISTINCT ON se queda con la version mas nueva
+    STAGE_LATEST = 'id, sync_token DESC NULLS LAST, last_updated_utc DESC NULLS LAST'
+
+    ROW_COUNT_SLOTS = PostgresClient.ROW_COUNT_SLOTS
+
+    # Tipos de las columnas tipadas en staging (ver db_utils.TYPED_COLUMNS)
+    STAGE_TYPED_COLUMNS = {
+        'sync_token': 'INTEGER',
+        'last_updated_utc': 'TIMESTAMP WITH TIME ZONE',
+        'txn_date': 'DATE'
+    }
+
+    # Tipos de las columnas de tablas hijas que COPY binario no convierte solo
+    CHILD_COLUMN_TYPES = {
+        'qty': 'NUMERIC',
+        'unit_price': 'NUMERIC',
+        'amount': 'NUMERIC',
+        'txn_date': 'DATE'
+    }
+
+    def __init__(self):
+        """Inicializa el cliente cargando credenciales de Mage Secrets"""
+        if asyncpg is None:
+            raise ImportError(
+                "asyncpg no esta instalado. Instalar con: pip install asyncpg"
+            )
+        self.host = get_secret_value('PG_HOST') or 'postgres'
+        self.port = int(get_secret_value('PG_PORT') or '5432')
+        self.database = get_secret_value('PG_DATABASE') or 'qbo_database'
+        self.user = get_secret_value('PG_USER') or 'qbo_user'
+        self.password = get_secret_value('PG_PASSWORD')
+        self.connection = None
+
+    async def connect(self):
+        """Establece conexion con PostgreSQL y prepara la tabla de staging"""
+        if self.connection is None or self.connection.is_closed():
+            self.connection = await asyncpg.connect(
+                host=self.host,
+                port=self.port,
+                database=self.database,
+                user=self.user,
+                password=self.password
+            )
+            await self.connection.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS {self.STAGE_TABLE} (
+                    id VARCHAR(50),
+                    payload JSONB,
+                    ingested_at_utc TIMESTAMP WITH TIME ZONE,
+                    extract_window_start_utc TIMESTAMP WITH TIME ZONE,
+                    extract_window_end_utc TIMESTAMP WITH TIME ZONE,
+                    page_number INTEGER,
+                    page_size INTEGER,
+                    extraction_request_id BIGINT,
+                    sync_token INTEGER,
+                    last_updated_utc TIMESTAMP WITH TIME ZONE,
+                    txn_date DATE
+                ) ON COMMIT DELETE ROWS
+            """)
+            print(f"[DB ASYNC] Conectado a PostgreSQL: {self.host}:{self.port}/{self.database}")
+        return self.connection
+
+    async def close(self):
+        """Cierra la conexion"""
+        if self.connection and not self.connection.is_closed():
+            await self.connection.close()
+            print("[DB ASYNC] Conexion cerrada")
+
+    @staticmethod
+    def _parse_timestamp(value) -> Optional[datetime]:
+        """asyncpg exige datetime; las ventanas llegan como strings ISO"""
+        if value is None or isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+    @classmethod
+    def _convert_typed(cls, column: str, value, column_types: Optional[Dict[str, str]] = None):
+        """Convierte el valor extraido al tipo Python que espera asyncpg"""
+        if value is None:
+            return None
+        sql_type = (column_types or cls.STAGE_TYPED_COLUMNS).get(column)
+        if sql_type == 'DATE':
+            return date.fromisoformat(str(value)[:10])
+        if sql_type == 'TIMESTAMP WITH TIME ZONE':
+            return cls._parse_timestamp(value)
+        if sql_type == 'NUMERIC':
+            return Decimal(str(value))
+        return value
+
+    async def replace_child_rows(self, conn, table_name: str, records: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Reemplaza las filas hijas de los registros (ver db_utils.CHILD_TABLES)
+
+        Variante asincrona de PostgresClient.replace_child_rows: DELETE por
+        padre y COPY binario, en la transaccion del upsert. Si un id llega
+        repetido en la pagina se usan las lineas de la version que queda
+        cargada (mayor SyncToken y LastUpdatedTime).
+
+        Returns:
+            int: Filas cargadas, o None si la tabla no tiene tabla hija
+        """
+        child = CHILD_TABLES.get(table_name)
+        if child is None:
+            return None
+
+        latest: Dict[str, Dict[str, Any]] = {}
+        for item in records:
+            record = item['record']
+            current = latest.get(str(record['Id']))
+            if current is None or record_version(record) > record_version(current):
+                latest[str(record['Id'])] = record
+
+        await conn.execute(
+            f"DELETE FROM {child['table']} WHERE {child['parent_key']} = ANY($1::TEXT[])",
+            list(latest)
+        )
+        rows = [
+            tuple(
+                self._convert_typed(column, value, self.CHILD_COLUMN_TYPES)
+                for column, value in zip(child['columns'], row)
+            )
+            for record in latest.values()
+            for row in child['rows'](record)
+        ]
+        if rows:
+            schema, table = child['table'].split('.')
+            await conn.copy_records_to_table(
+                table, schema_name=schema, records=rows, columns=child['columns']
+            )
+        return len(rows)
+
+    async def upsert_records(
+        self,
+        table_name: str,
+        records: List[Dict[str, Any]],
+        window_start: str,
+        window_end: str,
+        request_payload: Optional[Dict] = None
+    ) -> Dict[str, int]:
+        """
+        Inserta o actualiza una pagina de registros (COPY + UPSERT)
+
+        Args:
+            table_name: Nombre de la tabla (ej: raw.qb_invoices)
+            records: Lista de registros con 'record' y metadatos de pagina
+            window_start: Inicio de ventana de extraccion (ISO format)
+            window_end: Fin de ventana de extraccion (ISO format)
+            request_payload: Payload de la solicitud original; se guarda
+                una vez por pagina en raw.extraction_requests
+
+        Returns:
+            dict: Contadores de registros insertados/actualizados
+        """
+        records = [item for item in records if item['record'].get('Id')]
+        if not records:
+            return {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+        ingested_at = datetime.now(timezone.utc)
+        start = self._parse_timestamp(window_start)
+        end = self._parse_timestamp(window_end)
+        typed_columns = typed_columns_for(table_name)
+        stage_columns = self.STAGE_COLUMNS + list(typed_columns)
+
+        columns = ', '.join(stage_columns)
+        update_set = ',\n                    '.join(
+            f"{column} = EXCLUDED.{column}" for column in stage_columns[1:]
+        )
+        # Misma regla que PostgresClient.upsert_records: una version mas
+        # vieja no pisa a la vigente
+        upsert_query = f"""
+            INSERT INTO {table_name} AS t ({columns})
+            SELECT DISTINCT ON (id) {columns} FROM {self.STAGE_TABLE}
+            ORDER BY {self.STAGE_LATEST}
+            ON CONFLICT (id) DO UPDATE SET
+                {update_set},
+                request_payload = NULL,
+                deleted_at_utc = NULL
+            WHERE EXCLUDED.sync_token >= t.sync_token OR t.sync_token IS NULL
+            RETURNING t.id, (xmax = 0) AS inserted
+        """
+
+        pages = {}
+        for item in records:
+            pages.setdefault(item.get('page_number'), item.get('page_size'))
+
+        conn = await self.connect()
+        async with conn.transaction():
+            run_id = uuid.uuid4()
+            request_json = json.dumps(request_payload) if request_payload else None
+            request_ids = {}
+            for page_number, page_size in pages.items():
+                request_ids[page_number] = await conn.fetchval(
+                    """
+                    INSERT INTO raw.extraction_requests (
+                        run_id, table_name, window_start_utc, window_end_utc,
+                        page_number, page_size, request_payload
+                    )
+                    VALUES ($1, $2, $3, $4, $5, $6, $7)
+                    RETURNING id
+                    """,
+                    run_id, table_name, start, end, page_number, page_size, request_json
+                )
+
+            rows = [
+                (
+                    str(item['record']['Id']),
+                    json.dumps(item['record']),
+                    ingested_at,
+                    start,
+                    end,
+                    item.get('page_number'),
+                    item.get('page_size'),
+                    request_ids.get(item.get('page_number')),
+                    *(
+                        self._convert_typed(column, extract(item['record']))
+                        for column, extract in typed_columns.items()
+                    )
+                )
+                for item in records
+            ]
+
+            await conn.copy_records_to_table(
+                self.STAGE_TABLE,
+                records=rows,
+                columns=stage_columns
+            )
+
+            # Filas vigentes bloqueadas en orden de id antes de tocarlas; las
+            # copias con un SyncToken menor al cargado salen del staging, y
+            # con ellas del upsert, la volumetria y las tablas hijas
+            await conn.execute(
+                f"""
+                SELECT 1 FROM {table_name}
+                WHERE id IN (SELECT id FROM {self.STAGE_TABLE})
+                ORDER BY id FOR UPDATE
+                """
+            )
+            staged_ids = await conn.fetchval(f"SELECT COUNT(DISTINCT id) FROM {self.STAGE_TABLE}")
+            await conn.execute(
+                f"""
+                DELETE FROM {self.STAGE_TABLE} s
+                USING {table_name} t
+                WHERE t.id = s.id
+                  AND t.sync_token IS NOT NULL
+                  AND (s.sync_token IS NULL OR s.sync_token < t.sync_token)
+                """
+            )
+            skipped = staged_ids - await conn.fetchval(
+                f"SELECT COUNT(DISTINCT id) FROM {self.STAGE_TABLE}"
+            )
+            if skipped:
+                print(f"[DB ASYNC] {skipped} registros omitidos en {table_name}: "
+                      f"ya hay una version mas nueva cargada")
+            # Volumetria: filas existentes fuera de su ventana/pagina previa y
+            # filas de la pagina en la actual, en una sola sentencia ordenada
+            # por (ventana, pagina) para que dos cargas no entren en deadlock.
+            # Las filas en cero se eliminan al cerrar el tramo (prune_volumetry)
+            await conn.execute(
+                f"""
+                INSERT INTO raw.volumetry_stats AS vs (
+                    table_name, window_start_utc, window_end_utc, page_number,
+                    record_count, first_ingested_utc, last_ingested_utc
+                )
+                SELECT $1, window_start_utc, window_end_utc, page_number,
+                       SUM(delta), MIN(ingested_at_utc), MAX(ingested_at_utc)
+                FROM (
+                    SELECT
+                        COALESCE(t.extract_window_start_utc, '-infinity') AS window_start_utc,
+                        COALESCE(t.extract_window_end_utc, 'infinity') AS window_end_utc,
+                        COALESCE(t.page_number, 0) AS page_number,
+                        -1 AS delta,
+                        NULL::TIMESTAMPTZ AS ingested_at_utc
+                    FROM {table_name} t
+                    WHERE t.id IN (SELECT id FROM {self.STAGE_TABLE})
+                    UNION ALL
+                    SELECT
+                        COALESCE(s.extract_window_start_utc, '-infinity'),
+                        COALESCE(s.extract_window_end_utc, 'infinity'),
+                        COALESCE(s.page_number, 0),
+                        1,
+                        s.ingested_at_utc
+                    FROM (
+                        SELECT DISTINCT ON (id) * FROM {self.STAGE_TABLE}
+                        ORDER BY {self.STAGE_LATEST}
+                    ) s
+                ) changes
+                GROUP BY 2, 3, 4
+                ORDER BY 2, 3, 4
+                ON CONFLICT (table_name, window_start_utc, window_end_utc, page_number) DO UPDATE
+                SET record_count = vs.record_count + EXCLUDED.record_count,
+                    first_ingested_utc = LEAST(vs.first_ingested_utc, EXCLUDED.first_ingested_utc),
+                    last_ingested_utc = GREATEST(vs.last_ingested_utc, EXCLUDED.last_ingested_utc)
+                """,
+                table_name
+            )
+
+            result = await conn.fetch(upsert_query)
+            written = {row['id'] for row in result}
+            inserted = sum(1 for row in result if row['inserted'])
+            updated = len(result) - inserted
+
+            # Tablas hijas (ej: lineas de factura) en la misma transaccion
+            child_rows = await self.replace_child_rows(
+                conn, table_name,
+                [item for item in records if str(item['record']['Id']) in written]
+            )
+
+            # Contador de filas en la misma transaccion del upsert
+            if inserted:
+                await conn.execute(
+                    """
+                    INSERT INTO raw.table_row_counts (table_name, counter_slot, row_count)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (table_name, counter_slot) DO UPDATE
+                    SET row_count = raw.table_row_counts.row_count + EXCLUDED.row_count,
+                        updated_at_utc = NOW()
+                    """,
+                    table_name,
+                    random.randrange(self.ROW_COUNT_SLOTS),
+                    inserted
+                )
+
+        print(f"[DB ASYNC] Upsert completado en {table_name}: "
+              f"{inserted} insertados, {updated} actualizados")
+        if child_rows is not None:
+            print(f"[DB ASYNC] {child_rows} filas reemplazadas en {CHILD_TABLES[table_name]['table']}")
+        return {'inserted': inserted, 'updated': updated, 'skipped': skipped}
+
+    async def prune_volumetry(self, table_name: str) -> int:
+        """Elimina las filas de volumetria en cero (ver PostgresClient.prune_volumetry)"""
+        conn = await self.connect()
+        status = await conn.execute(
+            "DELETE FROM raw.volumetry_stats WHERE table_name = $1 AND record_count = 0",
+            table_name
+        )
+        return int(status.split()[-1])
+
+    async def log_backfill_start(
+        self,
+        entity_name: str,
+        window_start: str,
+        window_end: str
+    ) -> int:
+        """Registra el inicio de una ejecucion de backfill"""
+        conn = await self.connect()
+        log_id = await conn.fetchval(
+            """
+            INSERT INTO raw.backfill_log (
+                entity_name, window_start_utc, window_end_utc,
+                status, started_at_utc
+            )
+            VALUES ($1, $2, $3, 'running', $4)
+            RETURNING id
+            """,
+            entity_name,
+            self._parse_timestamp(window_start),
+            self._parse_timestamp(window_end),
+            datetime.now(timezone.utc)
+        )
+        print(f"[LOG] Iniciado backfill log ID: {log_id}")
+        return log_id
+
+    async def log_backfill_complete(
+        self,
+        log_id: int,
+        records_read: int,
+        records_inserted: int,
+        records_updated: int,
+        pages_processed: int,
+        duration_seconds: float,
+        status: str = 'completed',
+        error_message: Optional[str] = None
+    ):
+        """Actualiza el registro de log con los resultados finales"""
+        conn = await self.connect()
+        await conn.execute(
+            """
+            UPDATE raw.backfill_log
+            SET records_read = $1,
+                records_inserted = $2,
+                records_updated = $3,
+                pages_processed = $4,
+                duration_seconds = $5,
+                status = $6,
+                error_message = $7,
+                completed_at_utc = $8
+            WHERE id = $9
+            """,
+            records_read,
+            records_inserted,
+            records_updated,
+            pages_processed,
+            round(duration_seconds, 2),
+            status,
+            error_message,
+            datetime.now(timezone.utc),
+            log_id
+        )
+        print(f"[LOG] Backfill log ID {log_id} actualizado: {status}")
+
+
+async def iter_pages_async(
+    client,
+    entity: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    date_field: str = 'MetaData.LastUpdatedTime'
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Adapta QBOClient.fetch_entity_pages (bloqueante) a un iterador asincrono
+
+    Cada pagina se descarga en un hilo para no bloquear el event loop.
+    """
+    pages = client.fetch_entity_pages(entity, start_date, end_date, date_field)
+    while True:
+        page = await asyncio.to_thread(next, pages, None)
+        if page is None:
+            break
+        yield page
+
+
+async def load_window_async(
+    client,
+    db: AsyncPostgresClient,
+    entity: str,
+    table_name: str,
+    log_entity: str,
+    window_start: str,
+    window_end: str,
+    prefetch_pages: int = 2
+) -> Dict[str, Any]:
+    """
+    Extrae y carga una ventana solapando descarga y escritura
+
+    Una tarea descarga paginas a una cola acotada (prefetch_pages) mientras
+    otra las escribe a medida que llegan, todo sobre el mismo event loop.
+
+    Args:
+        client: Instancia de QBOClient
+        db: Instancia de AsyncPostgresClient
+        entity: Entidad de QBO (Invoice, Customer, Item)
+        table_name: Tabla destino (ej: raw.qb_invoices)
+        log_entity: Nombre en raw.backfill_log (invoices, customers, items)
+        window_start: Inicio de ventana (ISO format UTC)
+        window_end: Fin de ventana (ISO format UTC)
+        prefetch_pages: Paginas descargadas por adelantado como maximo
+
+    Returns:
+        dict: Resumen de la carga
+    """
+    start_time = datetime.now(timezone.utc)
+    log_id = await db.log_backfill_start(log_entity, window_start, window_end)
+    request_payload = {
+        'entity': entity,
+        'window_start': window_start,
+        'window_end': window_end
+    }
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=prefetch_pages)
+    totals = {'records_read': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'pages': 0}
+
+    async def produce():
+        try:
+            async for page in iter_pages_async(client, entity, window_start, window_end):
+                await queue.put(page)
+        except asyncio.CancelledError:
+            # Cancelado porque fallo la escritura: nadie lee la cola, no se
+            # espera lugar para el fin (con la cola llena quedaria colgado)
+            raise
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+
+    try:
+        while True:
+            page = await queue.get()
+            if page is None:
+                break
+            for item in page:
+                item['extract_window_start'] = window_start
+                item['extract_window_end'] = window_end
+            result = await db.upsert_records(
+                table_name, page, window_start, window_end,
+                request_payload=request_payload
+            )
+            totals['records_read'] += len(page)
+            totals['inserted'] += result['inserted']
+            totals['updated'] += result['updated']
+            totals['skipped'] += result['skipped']
+            totals['pages'] += 1
+
+        # Propaga errores de extraccion
+        await producer
+        await db.prune_volumetry(table_name)
+
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        await db.log_backfill_complete(
+            log_id, totals['records_read'], totals['inserted'], totals['updated'],
+            totals['pages'], duration, status='completed'
+        )
+
+    except Exception as e:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        await db.log_backfill_complete(
+            log_id, totals['records_read'], totals['inserted'], totals['updated'],
+            totals['pages'], duration, status='failed', error_message=str(e)
+        )
+        print(f"[ERROR] Fallo en carga asincrona: {str(e)}")
+        raise
+
+    return {
+        'status': 'completed',
+        'records_loaded': totals['records_read'],
+        'inserted': totals['inserted'],
+        'updated': totals['updated'],
+        'skipped': totals['skipped'],
+        'pages': totals['pages'],
+        'duration_seconds': duration,
+        'log_id': log_id
+    }
+
+
+def get_async_postgres_client():
+    """
+    Factory function para obtener una instancia del cliente asincrono
+
+    Returns:
+        AsyncPostgresClient: Instancia configurada del cliente
+    """
+    return AsyncPostgresClient()
+
+
+async def _run_window(entity_name: str, window_start: str, window_end: str, prefetch_pages: int):
+    """Carga un tramo con una conexion propia y la cierra al terminar"""
+    config = get_entity_config(entity_name)
+    db = get_async_postgres_client()
+    try:
+        return await load_window_async(
+            get_qbo_client(), db, config['qbo_entity'], config['table_name'], entity_name,
+            window_start, window_end, prefetch_pages=prefetch_pages
+        )
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Carga asincrona (asyncpg) de un tramo de QBO')
+    parser.add_argument('--entidad', required=True, choices=list(ENTITIES))
+    parser.add_argument('--fecha-inicio', required=True, help='ISO 8601 UTC (ej: 2024-01-01T00:00:00Z)')
+    parser.add_argument('--fecha-fin', required=True, help='ISO 8601 UTC (ej: 2024-01-31T23:59:59Z)')
+    parser.add_argument('--paginas-adelantadas', type=int, default=2,
+                        help='Paginas descargadas por adelantado mientras se escribe la actual')
+    args = parser.parse_args()
+
+    asyncio.run(_run_window(args.entidad, args.fecha_inicio, args.fecha_fin, args.paginas_adelantadas))
+
+
+if __name__ == '__main__':
+    main()
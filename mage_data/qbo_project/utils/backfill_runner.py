@@ -0,0 +1,319 @@
+"""
+Ejecucion de un tramo de backfill fuera de Mage
+Reutiliza QBOClient, las validaciones de transform y PostgresClient
+"""
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from utils.qbo_client import get_qbo_client
+from utils.db_utils import get_postgres_client
+from utils.validation import validate_records, empty_report, merge_reports, VersionIndex
+from utils.backfill_windows import format_utc, high_water_mark
+
+
+# Configuracion por entidad: nombre en QBO y tabla destino.
+# La clave es el entity_name usado en raw.backfill_log.
+ENTITIES = {
+    'invoices': {'qbo_entity': 'Invoice', 'table_name': 'raw.qb_invoices'},
+    'customers': {'qbo_entity': 'Customer', 'table_name': 'raw.qb_customers'},
+    'items': {'qbo_entity': 'Item', 'table_name': 'raw.qb_items'},
+}
+
+
+def get_entity_config(entity_name: str) -> Dict[str, str]:
+    """Retorna la configuracion de una entidad (invoices, customers, items)"""
+    if entity_name not in ENTITIES:
+        raise ValueError(
+            f"Entidad desconocida: {entity_name}. Usar una de {list(ENTITIES)}"
+        )
+    return ENTITIES[entity_name]
+
+
+def resume_point(
+    db,
+    entity_name: str,
+    window_start: str,
+    window_end: str,
+    page_size: int
+) -> Tuple[int, int, Optional[str]]:
+    """
+    Punto de reanudacion de un tramo segun raw.backfill_checkpoints
+
+    El tramo se retoma por fecha, no por posicion: la tercera componente
+    es el mayor LastUpdatedTime ya cargado y se pasa como resume_from a
+    QBOClient.fetch_entity_pages. Un STARTPOSITION calculado con
+    last_page saltearia registros si alguno salio de la ventana despues de
+    la caida. Un checkpoint sin esa fecha, o guardado con otro tamano de
+    pagina, reinicia el tramo desde el inicio.
+
+    Returns:
+        tuple: (primera pagina a extraer, registros ya cargados, fecha de reanudacion)
+    """
+    checkpoint = db.get_checkpoint(entity_name, window_start, window_end)
+    if checkpoint is None:
+        return 1, 0, None
+    if checkpoint['page_size'] != page_size:
+        print(f"[CHECKPOINT] Tamano de pagina distinto ({checkpoint['page_size']} != {page_size}); "
+              f"se reinicia el tramo")
+        return 1, 0, None
+    if checkpoint.get('resume_from_utc') is None:
+        print("[CHECKPOINT] Checkpoint sin fecha de reanudacion; se reinicia el tramo")
+        return 1, 0, None
+
+    resume_from = format_utc(checkpoint['resume_from_utc'])
+    print(f"[CHECKPOINT] {entity_name} {window_start} -> {window_end}: "
+          f"{checkpoint['last_page']} paginas ({checkpoint['records_loaded']} registros) ya cargadas; "
+          f"se reanuda desde {resume_from}")
+    return checkpoint['last_page'] + 1, checkpoint['records_loaded'], resume_from
+
+
+def upsert_with_checkpoints(
+    db,
+    entity_name: str,
+    table_name: str,
+    records: List[Dict[str, Any]],
+    window_start: str,
+    window_end: str,
+    request_payload: Optional[Dict] = None,
+    pages_per_checkpoint: int = 20,
+    skip_unchanged: bool = False,
+    workers: int = 1
+) -> Dict[str, int]:
+    """
+    Carga registros de un tramo en bloques de paginas, guardando un checkpoint
+    tras cada bloque confirmado y eliminandolo al terminar
+
+    Usado por los bloques load_* de Mage: si la carga falla, la siguiente
+    ejecucion del extract reanuda desde la ultima pagina confirmada.
+
+    Returns:
+        dict: inserted, updated y skipped acumulados
+    """
+    pages: Dict[int, List[Dict[str, Any]]] = {}
+    for item in records:
+        pages.setdefault(item.get('page_number', 1), []).append(item)
+    page_numbers = sorted(pages)
+    page_size = records[0].get('page_size', 100) if records else 100
+
+    # Acumulado previo solo si estos registros continuan el checkpoint existente
+    records_before = 0
+    resume_from = None
+    checkpoint = db.get_checkpoint(entity_name, window_start, window_end)
+    if checkpoint and page_numbers and checkpoint['last_page'] == page_numbers[0] - 1:
+        records_before = checkpoint['records_loaded']
+        resume_from = checkpoint.get('resume_from_utc')
+
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    loaded = 0
+    chunk_size = max(1, pages_per_checkpoint)
+
+    for i in range(0, len(page_numbers), chunk_size):
+        chunk_pages = page_numbers[i:i + chunk_size]
+        chunk = [item for page in chunk_pages for item in pages[page]]
+
+        result = db.upsert_records_parallel(
+            table_name=table_name,
+            records=chunk,
+            window_start=window_start,
+            window_end=window_end,
+            request_payload=request_payload,
+            skip_unchanged=skip_unchanged,
+            workers=workers
+        )
+        for key in totals:
+            totals[key] += result.get(key, 0)
+        loaded += len(chunk)
+        resume_from = high_water_mark(chunk, since=resume_from)
+
+        db.save_checkpoint(
+            entity_name, window_start, window_end,
+            last_page=chunk_pages[-1],
+            page_size=page_size,
+            records_loaded=records_before + loaded,
+            resume_from=resume_from
+        )
+        print(f"[CHECKPOINT] Paginas hasta {chunk_pages[-1]} confirmadas "
+              f"({records_before + loaded} registros)")
+
+    db.clear_checkpoint(entity_name, window_start, window_end)
+    db.prune_volumetry(table_name)
+    return totals
+
+
+def run_window(
+    entity_name: str,
+    window_start: str,
+    window_end: str,
+    client=None,
+    db=None,
+    skip_unchanged: bool = False,
+    resume: bool = True,
+    pages_per_batch: int = 1,
+    sink=None,
+    should_abort: Optional[Callable[[], bool]] = None
+) -> Dict[str, Any]:
+    """
+    Extrae, valida y carga un tramo completo en lotes de paginas
+
+    Equivale a ejecutar extract -> transform -> load del pipeline
+    qb_<entidad>_backfill, con un registro en raw.backfill_log. Cada lote
+    se carga apenas se completa, por lo que la memoria es O(lote) y no
+    O(ventana).
+
+    Args:
+        entity_name: invoices, customers o items
+        window_start: Inicio de ventana (ISO format UTC)
+        window_end: Fin de ventana (ISO format UTC)
+        client: QBOClient a reutilizar (por defecto uno nuevo)
+        db: PostgresClient a reutilizar (por defecto uno nuevo, que se cierra al final)
+        skip_unchanged: Omitir registros con el mismo SyncToken ya cargado
+        resume: Continuar desde el checkpoint del tramo (raw.backfill_checkpoints)
+        pages_per_batch: Paginas acumuladas por transaccion de carga
+        sink: Destino alternativo con la interfaz de upsert_records (ej:
+            LakeSink); la ventana se publica completa al final, asi que no
+            hay checkpoints por pagina. raw.backfill_log sigue en Postgres,
+            con el destino del sink (no cuenta como cobertura de Postgres)
+        should_abort: Se consulta antes de cada lote; si devuelve True el
+            tramo se interrumpe con error (ej: el worker perdio el lease)
+
+    Returns:
+        dict: Resumen del tramo
+    """
+    config = get_entity_config(entity_name)
+    client = client or get_qbo_client()
+    owns_db = db is None
+    db = db or get_postgres_client()
+
+    start_time = datetime.now(timezone.utc)
+    log_id = db.log_backfill_start(
+        entity_name, window_start, window_end,
+        destination='postgres' if sink is None else sink.destination
+    )
+
+    request_payload = {
+        'entity': config['qbo_entity'],
+        'window_start': window_start,
+        'window_end': window_end
+    }
+    totals = {'records_read': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'pages': 0}
+    versions = VersionIndex()
+    quality = empty_report()
+    batch: List[Dict[str, Any]] = []
+    batch_pages = 0
+    records_before = 0
+    # Mayor LastUpdatedTime de las paginas extraidas (fecha de reanudacion)
+    progress = {'resume_from': None}
+
+    def flush_batch(last_page: int):
+        """Carga el lote acumulado y registra el checkpoint de su ultima pagina"""
+        if should_abort is not None and should_abort():
+            raise RuntimeError(f"Tramo interrumpido antes de cargar la pagina {last_page}")
+        result = (sink or db).upsert_records(
+            table_name=config['table_name'],
+            records=batch,
+            window_start=window_start,
+            window_end=window_end,
+            request_payload=request_payload,
+            skip_unchanged=skip_unchanged
+        )
+        for key in ('inserted', 'updated', 'skipped'):
+            totals[key] += result.get(key, 0)
+        if sink is not None:
+            return
+
+        # El lote ya esta confirmado: una caida posterior reanuda desde la pagina siguiente
+        db.save_checkpoint(
+            entity_name, window_start, window_end,
+            last_page=last_page,
+            page_size=client.PAGE_SIZE,
+            records_loaded=records_before + totals['records_read'],
+            resume_from=progress['resume_from']
+        )
+
+    try:
+        start_page = 1
+        if resume and sink is None:
+            start_page, records_before, progress['resume_from'] = resume_point(
+                db, entity_name, window_start, window_end, client.PAGE_SIZE
+            )
+
+        for page in client.fetch_entity_pages(
+            entity=config['qbo_entity'],
+            start_date=window_start,
+            end_date=window_end,
+            date_field='MetaData.LastUpdatedTime',
+            start_page=start_page,
+            resume_from=progress['resume_from']
+        ):
+            for item in page:
+                item['extract_window_start'] = window_start
+                item['extract_window_end'] = window_end
+            progress['resume_from'] = high_water_mark(page, since=progress['resume_from'])
+
+            valid_records, report = validate_records(page, versions, entity_name=entity_name)
+            merge_reports(quality, report)
+            batch.extend(valid_records)
+            batch_pages += 1
+            totals['records_read'] += len(page)
+            totals['pages'] += 1
+
+            if batch_pages >= pages_per_batch:
+                flush_batch(page[0]['page_number'])
+                batch = []
+                batch_pages = 0
+
+        if batch_pages:
+            flush_batch(start_page + totals['pages'] - 1)
+
+        if sink is not None:
+            sink.commit_window(config['table_name'], window_start, window_end)
+        else:
+            db.clear_checkpoint(entity_name, window_start, window_end)
+            db.prune_volumetry(config['table_name'])
+
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        db.log_backfill_complete(
+            log_id=log_id,
+            records_read=totals['records_read'],
+            records_inserted=totals['inserted'],
+            records_updated=totals['updated'],
+            pages_processed=totals['pages'],
+            duration_seconds=duration,
+            status='completed'
+        )
+
+    except Exception as e:
+        if sink is not None:
+            sink.abort_window(config['table_name'], window_start, window_end)
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        db.log_backfill_complete(
+            log_id=log_id,
+            records_read=totals['records_read'],
+            records_inserted=totals['inserted'],
+            records_updated=totals['updated'],
+            pages_processed=totals['pages'],
+            duration_seconds=duration,
+            status='failed',
+            error_message=str(e)
+        )
+        print(f"[ERROR] Fallo en tramo {entity_name} {window_start} -> {window_end}: {str(e)}")
+        raise
+
+    finally:
+        if owns_db:
+            db.close()
+
+    return {
+        'status': 'completed',
+        'entity': entity_name,
+        'window_start': window_start,
+        'window_end': window_end,
+        'records_loaded': totals['records_read'],
+        'inserted': totals['inserted'],
+        'updated': totals['updated'],
+        'skipped': totals['skipped'],
+        'pages': totals['pages'],
+        'duration_seconds': duration,
+        'quality': quality,
+        'log_id': log_id
+    }
@@ -0,0 +1,262 @@
+"""
+Planificador de tramos de backfill
+Segmenta un rango, omite tramos completados, reintenta fallidos y
+ejecuta el resto en un pool acotado que comparte el rate limit de QBO
+
+Uso (desde mage_data/qbo_project):
+    python -m utils.backfill_scheduler --entidad invoices \\
+        --fecha-inicio 2022-01-01T00:00:00Z --fecha-fin 2024-12-31T23:59:59Z \\
+        --tramo month --workers 4 --verificar
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import List, Dict, Any
+
+from utils.qbo_auth import get_qbo_authenticator
+from utils.qbo_client import QBOClient, RateLimiter, get_qbo_client
+from utils.db_utils import get_postgres_client
+from utils.backfill_runner import run_window, get_entity_config
+from utils.backfill_windows import split_windows, parse_utc, GRANULARITIES
+from utils.count_verification import verify_range
+from utils.lake_sink import get_lake_sink, FORMATS as LAKE_FORMATS
+
+
+# QBO limita las requests concurrentes por compania (realm)
+MAX_CONCURRENT_WINDOWS = 10
+
+# Espera entre reintentos de un mismo tramo (se duplica en cada intento)
+RETRY_BACKOFF_SECONDS = 30
+
+
+def plan_windows(
+    entity_name: str,
+    start: str,
+    end: str,
+    granularity: str = 'month',
+    db=None,
+    include_running: bool = False,
+    destination: str = 'postgres'
+) -> List[Dict[str, Any]]:
+    """
+    Segmenta el rango y decide que hacer con cada tramo segun raw.backfill_log
+
+    Acciones:
+    - skip: el tramo ya esta cubierto por ejecuciones 'completed'
+    - retry: intersecta un tramo 'failed' sin cobertura
+    - pending: nunca se ejecuto
+    - running: solo intersecta ejecuciones 'running' (se omite salvo include_running)
+
+    Solo cuentan las ejecuciones hacia `destination`: el lake y Postgres
+    tienen coberturas independientes.
+
+    Returns:
+        list: Dicts con window_start, window_end y action
+    """
+    get_entity_config(entity_name)
+    owns_db = db is None
+    db = db or get_postgres_client()
+
+    try:
+        gaps = db.find_missing_windows(entity_name, start, end, destination=destination)
+    finally:
+        if owns_db:
+            db.close()
+
+    plan = []
+    for window_start, window_end in split_windows(start, end, granularity):
+        ws, we = parse_utc(window_start), parse_utc(window_end)
+        statuses = {
+            gap['status'] for gap in gaps
+            if gap['window_start'] <= we and gap['window_end'] >= ws
+        }
+
+        if not statuses:
+            action = 'skip'
+        elif 'failed' in statuses:
+            action = 'retry'
+        elif 'missing' in statuses or include_running:
+            action = 'pending'
+        else:
+            action = 'running'
+
+        plan.append({'window_start': window_start, 'window_end': window_end, 'action': action})
+
+    return plan
+
+
+def run_backfill(
+    entity_name: str,
+    start: str,
+    end: str,
+    granularity: str = 'month',
+    max_workers: int = 3,
+    max_attempts: int = 2,
+    skip_unchanged: bool = False,
+    include_running: bool = False,
+    dry_run: bool = False,
+    verify: bool = False,
+    destination: str = 'postgres',
+    lake_format: str = 'parquet'
+) -> Dict[str, Any]:
+    """
+    Ejecuta un backfill completo de una entidad en un solo comando
+
+    Los tramos pendientes o fallidos se ejecutan en paralelo (max_workers,
+    acotado por MAX_CONCURRENT_WINDOWS). Todos los workers comparten el
+    autenticador y un unico RateLimiter, asi que el pool consume el
+    presupuesto de requests por minuto de QBO sin excederlo.
+
+    Args:
+        entity_name: invoices, customers o items
+        start: Inicio del rango (ISO format UTC)
+        end: Fin del rango (ISO format UTC)
+        granularity: Tamano de tramo (day, week, month, quarter, year)
+        max_workers: Tramos ejecutados en paralelo
+        max_attempts: Intentos por tramo dentro de esta ejecucion
+        skip_unchanged: Omitir registros con el mismo SyncToken ya cargado
+        include_running: Re-ejecutar tramos que figuran como 'running'
+        dry_run: Solo mostrar el plan, sin ejecutar
+        verify: Al terminar sin fallos, comparar conteos por tramo contra
+            QBO y re-extraer las sub-ventanas con diferencia
+        destination: postgres (capa RAW) o lake (archivos, ver utils.lake_sink)
+        lake_format: parquet o ndjson (solo con destination = lake)
+
+    Returns:
+        dict: Resumen con el plan y el resultado de cada tramo
+    """
+    start_time = datetime.now(timezone.utc)
+    plan = plan_windows(
+        entity_name, start, end, granularity,
+        include_running=include_running, destination=destination
+    )
+    to_run = [w for w in plan if w['action'] in ('pending', 'retry')]
+
+    print("=" * 60)
+    print(f"PLAN DE BACKFILL - {entity_name.upper()}")
+    print("=" * 60)
+    for window in plan:
+        print(f"  [{window['action']:>7}] {window['window_start']} -> {window['window_end']}")
+    print(f"Tramos a ejecutar: {len(to_run)} de {len(plan)}")
+    print("=" * 60)
+
+    if dry_run or (not to_run and not verify):
+        return {'status': 'completed', 'plan': plan, 'results': []}
+
+    workers = max(1, min(max_workers, MAX_CONCURRENT_WINDOWS, len(to_run) or max_workers))
+    auth = get_qbo_authenticator()
+    rate_limiter = RateLimiter(QBOClient.RATE_LIMIT_REQUESTS, QBOClient.RATE_LIMIT_WINDOW)
+    sink = get_lake_sink(file_format=lake_format) if destination == 'lake' else None
+
+    def execute(window: Dict[str, Any]) -> Dict[str, Any]:
+        client = get_qbo_client(auth=auth, rate_limiter=rate_limiter)
+        last_error = None
+
+        for attempt in range(1, max_attempts + 1):
+            try:
+                return run_window(
+                    entity_name,
+                    window['window_start'],
+                    window['window_end'],
+                    client=client,
+                    skip_unchanged=skip_unchanged,
+                    sink=sink
+                )
+            except Exception as e:
+                last_error = e
+                if attempt < max_attempts:
+                    wait_time = RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1))
+                    print(f"[RETRY {attempt}/{max_attempts}] Tramo "
+                          f"{window['window_start']} fallo. Reintentando en {wait_time}s...")
+                    time.sleep(wait_time)
+
+        return {
+            'status': 'failed',
+            'entity': entity_name,
+            'window_start': window['window_start'],
+            'window_end': window['window_end'],
+            'error': str(last_error)
+        }
+
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(execute, window) for window in to_run]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    results.sort(key=lambda r: r['window_start'])
+    completed = [r for r in results if r['status'] == 'completed']
+    failed = [r for r in results if r['status'] == 'failed']
+    duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+
+    print("\n" + "=" * 60)
+    print("RESUMEN DE BACKFILL")
+    print("=" * 60)
+    print(f"Tramos completados:   {len(completed)}")
+    print(f"Tramos fallidos:      {len(failed)}")
+    print(f"Insertados:           {sum(r['inserted'] for r in completed)}")
+    print(f"Actualizados:         {sum(r['updated'] for r in completed)}")
+    print(f"Duracion:             {duration:.2f} segundos")
+    for result in failed:
+        print(f"  [FAILED] {result['window_start']} -> {result['window_end']}: {result['error']}")
+    print("=" * 60)
+
+    verification = None
+    if verify and sink is not None:
+        print("[WARN] --verificar compara contra Postgres; se omite con destino lake")
+    elif verify and not failed:
+        verification = verify_range(
+            entity_name, start, end, granularity,
+            workers=workers, auth=auth, rate_limiter=rate_limiter
+        )
+
+    status = 'failed' if failed else 'completed'
+    if verification and verification['status'] != 'completed':
+        status = 'mismatch'
+
+    return {
+        'status': status,
+        'plan': plan,
+        'results': results,
+        'verification': verification,
+        'duration_seconds': duration
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Planifica y ejecuta un backfill de QBO por tramos')
+    parser.add_argument('--entidad', required=True, choices=['invoices', 'customers', 'items'])
+    parser.add_argument('--fecha-inicio', required=True, help='ISO 8601 UTC (ej: 2024-01-01T00:00:00Z)')
+    parser.add_argument('--fecha-fin', required=True, help='ISO 8601 UTC (ej: 2024-12-31T23:59:59Z)')
+    parser.add_argument('--tramo', default='month', choices=GRANULARITIES)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--intentos', type=int, default=2)
+    parser.add_argument('--omitir-sin-cambios', action='store_true')
+    parser.add_argument('--incluir-running', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--verificar', action='store_true',
+                        help='Comparar conteos por tramo contra QBO al terminar')
+    parser.add_argument('--destino', default='postgres', choices=['postgres', 'lake'])
+    parser.add_argument('--formato-lake', default='parquet', choices=LAKE_FORMATS)
+    args = parser.parse_args()
+
+    summary = run_backfill(
+        args.entidad,
+        args.fecha_inicio,
+        args.fecha_fin,
+        granularity=args.tramo,
+        max_workers=args.workers,
+        max_attempts=args.intentos,
+        skip_unchanged=args.omitir_sin_cambios,
+        include_running=args.incluir_running,
+        dry_run=args.dry_run,
+        verify=args.verificar,
+        destination=args.destino,
+        lake_format=args.formato_lake
+    )
+    raise SystemExit(0 if summary['status'] == 'completed' else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Utilidades de ventanas (tramos) de backfill
+Parseo/formato de fechas UTC y segmentacion de rangos
+"""
+from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+# Granularidades soportadas para segmentar un rango
+GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def parse_utc(value) -> datetime:
+    """
+    Convierte un string ISO 8601 (ej: 2024-01-01T00:00:00Z) a datetime UTC
+
+    Fechas sin zona horaria se interpretan como UTC.
+    """
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def format_utc(value: datetime) -> str:
+    """Formatea un datetime como ISO 8601 UTC con sufijo Z (formato de QBO)"""
+    return parse_utc(value).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _next_boundary(current: datetime, granularity: str) -> datetime:
+    """Inicio del siguiente periodo calendario a partir de current"""
+    if granularity == 'day':
+        start = current.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        start = current.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start + timedelta(days=7 - start.weekday())
+
+    month_start = current.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    if granularity == 'quarter':
+        month_start = month_start.replace(month=(month_start.month - 1) // 3 * 3 + 1)
+    elif granularity == 'year':
+        month_start = month_start.replace(month=1)
+
+    month_index = month_start.month - 1 + months
+    return month_start.replace(
+        year=month_start.year + month_index // 12,
+        month=month_index % 12 + 1
+    )
+
+
+def split_windows(start, end, granularity: str = 'month') -> List[Tuple[str, str]]:
+    """
+    Segmenta [start, end] en tramos calendario contiguos
+
+    Cada tramo es inclusivo y termina 1 segundo antes del siguiente
+    (ej: 2024-01-01T00:00:00Z -> 2024-01-31T23:59:59Z), igual que la
+    segmentacion recomendada en el README.
+
+    Args:
+        start: Inicio del rango (ISO format UTC o datetime)
+        end: Fin del rango, inclusivo (ISO format UTC o datetime)
+        granularity: day, week, month, quarter o year
+
+    Returns:
+        list: Tuplas (fecha_inicio, fecha_fin) en formato ISO UTC
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularidad invalida: {granularity}. Usar una de {GRANULARITIES}")
+
+    current = parse_utc(start)
+    last = parse_utc(end)
+    if current > last:
+        raise ValueError(f"Rango invalido: {start} > {end}")
+
+    windows = []
+    while current <= last:
+        window_end = min(_next_boundary(current, granularity) - timedelta(seconds=1), last)
+        windows.append((format_utc(current), format_utc(window_end)))
+        current = window_end + timedelta(seconds=1)
+
+    return windows
+
+
+def window_key(start, end) -> str:
+    """Identificador compacto de un tramo, apto para nombres de archivo"""
+    if start is None or end is None:
+        return 'sin_ventana'
+    return f"w{parse_utc(start).strftime('%Y%m%dT%H%M%S')}_{parse_utc(end).strftime('%Y%m%dT%H%M%S')}"
+
+
+def bisect_window(start, end, min_seconds: int = 3600) -> List[Tuple[str, str]]:
+    """
+    Divide un tramo inclusivo en dos mitades contiguas (a nivel de segundo)
+
+    Tramos de menos de 2 * min_seconds no se dividen y se retornan tal cual.
+
+    Returns:
+        list: [(inicio, fin)] o [(inicio, medio - 1s), (medio, fin)]
+    """
+    start_dt, end_dt = parse_utc(start), parse_utc(end)
+    if (end_dt - start_dt).total_seconds() < 2 * min_seconds:
+        return [(format_utc(start_dt), format_utc(end_dt))]
+
+    middle = (start_dt + (end_dt - start_dt) / 2).replace(microsecond=0)
+    return [
+        (format_utc(start_dt), format_utc(middle - timedelta(seconds=1))),
+        (format_utc(middle), format_utc(end_dt))
+    ]
+
+
+def incremental_window(watermark, overlap_minutes: int = 10, end=None) -> Tuple[str, str]:
+    """
+    Ventana incremental: desde el watermark menos un solape hasta ahora
+
+    El solape cubre registros con LastUpdatedTime cercano al watermark que
+    QBO aun no retornaba en la ejecucion anterior; se re-cargan de forma
+    idempotente.
+
+    Args:
+        watermark: Ultimo LastUpdatedTime cargado (ISO format UTC o datetime)
+        overlap_minutes: Minutos a restar al watermark
+        end: Fin de la ventana (por defecto el momento actual)
+
+    Returns:
+        tuple: (fecha_inicio, fecha_fin) en formato ISO UTC
+    """
+    start = parse_utc(watermark) - timedelta(minutes=overlap_minutes)
+    window_end = parse_utc(end) if end else datetime.now(timezone.utc)
+    return format_utc(start), format_utc(window_end)
+
+
+def high_water_mark(data: List[Dict[str, Any]], since=None) -> Optional[datetime]:
+    """
+    Mayor MetaData.LastUpdatedTime (UTC) de un lote de registros extraidos
+
+    Args:
+        since: Marca previa (ej: la de las paginas ya cargadas); el
+            resultado nunca es menor
+    """
+    values = [
+        parse_utc(item['record']['MetaData']['LastUpdatedTime'])
+        for item in data
+        if (item.get('record') or {}).get('MetaData', {}).get('LastUpdatedTime')
+    ]
+    if since is not None:
+        values.append(parse_utc(since))
+    return max(values) if values else None
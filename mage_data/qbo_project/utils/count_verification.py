@@ -0,0 +1,233 @@
+"""
+Verificacion de conteos por ventana entre QBO y Postgres
+Compara SELECT COUNT(*) de QBO con el conteo indexado de last_updated_utc
+en cada tramo; los tramos con diferencia se subdividen hasta aislar
+sub-ventanas chicas, que son las unicas que se re-extraen.
+
+Uso (desde mage_data/qbo_project):
+    python -m utils.count_verification --entidad invoices \\
+        --fecha-inicio 2024-01-01T00:00:00Z --fecha-fin 2024-12-31T23:59:59Z
+    python -m utils.count_verification --entidad customers \\
+        --fecha-inicio 2024-01-01T00:00:00Z --fecha-fin 2024-12-31T23:59:59Z --sin-reextraer
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Tuple, Optional
+
+from utils.qbo_auth import get_qbo_authenticator
+from utils.qbo_client import QBOClient, RateLimiter, get_qbo_client
+from utils.db_utils import get_postgres_client
+from utils.backfill_runner import ENTITIES, run_window, get_entity_config
+from utils.backfill_windows import split_windows, bisect_window, GRANULARITIES
+
+
+# Sub-ventanas de menos de 2 horas no se siguen dividiendo
+MIN_SUBWINDOW_SECONDS = 3600
+
+# Con hasta estos registros en QBO re-extraer es mas barato que seguir dividiendo
+REEXTRACT_MAX_RECORDS = 1000
+
+
+def find_mismatches(
+    entity_name: str,
+    windows: List[Tuple[str, str]],
+    db,
+    workers: int = 4,
+    auth=None,
+    rate_limiter: Optional[RateLimiter] = None,
+    min_seconds: int = MIN_SUBWINDOW_SECONDS
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Compara conteos por ventana y subdivide las que no coinciden
+
+    Cada nivel cuesta un COUNT(*) de QBO por ventana (en paralelo, con el
+    rate limiter compartido) y una sola query en Postgres para todas.
+
+    Returns:
+        tuple: (sub-ventanas con diferencia, cantidad de conteos en QBO)
+    """
+    config = get_entity_config(entity_name)
+    auth = auth or get_qbo_authenticator()
+    rate_limiter = rate_limiter or RateLimiter(
+        QBOClient.RATE_LIMIT_REQUESTS, QBOClient.RATE_LIMIT_WINDOW
+    )
+
+    def qbo_count(window: Tuple[str, str]) -> int:
+        # count() aplica QBOClient.ENTITY_CONDITIONS, igual que la extraccion
+        client = get_qbo_client(auth=auth, rate_limiter=rate_limiter)
+        return client.count(config['qbo_entity'], start_date=window[0], end_date=window[1])
+
+    mismatches: List[Dict[str, Any]] = []
+    counted = 0
+    level = list(windows)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while level:
+            qbo_counts = list(executor.map(qbo_count, level))
+            postgres_counts = db.count_windows(config['table_name'], level)
+            counted += len(level)
+
+            next_level = []
+            for (window_start, window_end), qbo, postgres in zip(level, qbo_counts, postgres_counts):
+                if qbo == postgres:
+                    continue
+                halves = bisect_window(window_start, window_end, min_seconds)
+                if len(halves) == 1 or qbo <= REEXTRACT_MAX_RECORDS:
+                    mismatches.append({
+                        'window_start': window_start,
+                        'window_end': window_end,
+                        'qbo_count': qbo,
+                        'postgres_count': postgres
+                    })
+                else:
+                    print(f"[VERIFY] {window_start} -> {window_end}: QBO={qbo} Postgres={postgres}; "
+                          f"subdividiendo")
+                    next_level.extend(halves)
+            level = next_level
+
+    mismatches.sort(key=lambda m: m['window_start'])
+    return mismatches, counted
+
+
+def verify_range(
+    entity_name: str,
+    start: str,
+    end: str,
+    granularity: str = 'month',
+    workers: int = 4,
+    reextract: bool = True,
+    auth=None,
+    rate_limiter: Optional[RateLimiter] = None,
+    db=None
+) -> Dict[str, Any]:
+    """
+    Verifica un rango completo y re-extrae solo las sub-ventanas con diferencia
+
+    Cada sub-ventana con diferencia queda en raw.backfill_log (status
+    'mismatch') con ambos conteos apenas se detecta, antes de re-extraer;
+    el resultado de la re-extraccion se agrega despues a esa fila. Una
+    re-extraccion que falla no detiene a las demas. Si tras re-extraerla
+    Postgres sigue teniendo mas registros que QBO, la diferencia no es un
+    faltante sino registros borrados en QBO (ver utils.reconciliation).
+
+    Returns:
+        dict: Resumen con las sub-ventanas y su estado final
+    """
+    table_name = get_entity_config(entity_name)['table_name']
+    owns_db = db is None
+    db = db or get_postgres_client()
+    start_time = datetime.now(timezone.utc)
+    auth = auth or get_qbo_authenticator()
+    rate_limiter = rate_limiter or RateLimiter(
+        QBOClient.RATE_LIMIT_REQUESTS, QBOClient.RATE_LIMIT_WINDOW
+    )
+
+    try:
+        windows = split_windows(start, end, granularity)
+        mismatches, counted = find_mismatches(
+            entity_name, windows, db, workers=workers, auth=auth, rate_limiter=rate_limiter
+        )
+
+        # Registrar cada diferencia antes de re-extraer: si el proceso cae, queda en el log
+        for mismatch in mismatches:
+            mismatch['resolved'] = False
+            mismatch['log_id'] = db.log_count_mismatch(
+                entity_name, mismatch['window_start'], mismatch['window_end'],
+                mismatch['qbo_count'], mismatch['postgres_count'],
+                'pendiente de re-extraer' if reextract else 'sin re-extraer'
+            )
+
+        if mismatches and reextract:
+            def reextract_window(mismatch: Dict[str, Any]) -> Dict[str, Any]:
+                client = get_qbo_client(auth=auth, rate_limiter=rate_limiter)
+                try:
+                    result = run_window(
+                        entity_name, mismatch['window_start'], mismatch['window_end'],
+                        client=client, resume=False
+                    )
+                    mismatch['inserted'] = result['inserted']
+                except Exception as e:
+                    mismatch['error'] = str(e)
+                    print(f"[VERIFY] Fallo la re-extraccion de {mismatch['window_start']} -> "
+                          f"{mismatch['window_end']}: {str(e)}")
+                return mismatch
+
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(mismatches)))) as executor:
+                list(executor.map(reextract_window, mismatches))
+
+            reextracted = [m for m in mismatches if 'error' not in m]
+            final_counts = db.count_windows(
+                table_name, [(m['window_start'], m['window_end']) for m in reextracted]
+            ) if reextracted else []
+            for mismatch, final in zip(reextracted, final_counts):
+                mismatch['postgres_count_after'] = final
+
+            for mismatch in mismatches:
+                after = mismatch.get('postgres_count_after')
+                if 'error' in mismatch:
+                    detail = f"fallo la re-extraccion: {mismatch['error']}"
+                elif after == mismatch['qbo_count']:
+                    detail = f"re-extraido: {mismatch['inserted']} insertados, conteos iguales"
+                else:
+                    detail = (f"persiste tras re-extraer ({after} en Postgres): posibles borrados "
+                              f"en QBO, ver utils.reconciliation")
+                mismatch['resolved'] = after == mismatch['qbo_count']
+                db.update_count_mismatch(mismatch['log_id'], detail)
+
+    finally:
+        if owns_db:
+            db.close()
+
+    duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+    resolved = [m for m in mismatches if m['resolved']]
+
+    print("\n" + "=" * 60)
+    print(f"VERIFICACION DE CONTEOS - {entity_name.upper()}")
+    print("=" * 60)
+    print(f"Tramos verificados:   {len(windows)}")
+    print(f"Conteos en QBO:       {counted}")
+    print(f"Sub-ventanas con dif: {len(mismatches)}")
+    print(f"Resueltas:            {len(resolved)}")
+    print(f"Duracion:             {duration:.2f} segundos")
+    for mismatch in mismatches:
+        print(f"  [{'OK' if mismatch['resolved'] else 'MISMATCH':>8}] "
+              f"{mismatch['window_start']} -> {mismatch['window_end']}: "
+              f"QBO={mismatch['qbo_count']} Postgres={mismatch['postgres_count']}"
+              + (f" -> {mismatch['postgres_count_after']}" if 'postgres_count_after' in mismatch else '')
+              + (" (fallo la re-extraccion)" if 'error' in mismatch else ''))
+    print("=" * 60)
+
+    return {
+        'status': 'completed' if len(resolved) == len(mismatches) else 'mismatch',
+        'entity': entity_name,
+        'windows': len(windows),
+        'qbo_counts': counted,
+        'mismatches': mismatches,
+        'duration_seconds': duration
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica conteos por ventana entre QBO y Postgres')
+    parser.add_argument('--entidad', required=True, choices=list(ENTITIES))
+    parser.add_argument('--fecha-inicio', required=True, help='ISO 8601 UTC (ej: 2024-01-01T00:00:00Z)')
+    parser.add_argument('--fecha-fin', required=True, help='ISO 8601 UTC (ej: 2024-12-31T23:59:59Z)')
+    parser.add_argument('--tramo', default='month', choices=GRANULARITIES)
+    parser.add_argument('--workers', type=int, default=4, help='Conteos y re-extracciones concurrentes')
+    parser.add_argument('--sin-reextraer', action='store_true',
+                        help='Solo registrar las diferencias, sin re-extraer')
+    args = parser.parse_args()
+
+    summary = verify_range(
+        args.entidad,
+        args.fecha_inicio,
+        args.fecha_fin,
+        granularity=args.tramo,
+        workers=args.workers,
+        reextract=not args.sin_reextraer
+    )
+    raise SystemExit(0 if summary['status'] == 'completed' else 1)
+
+
+if __name__ == '__main__':
+    main()
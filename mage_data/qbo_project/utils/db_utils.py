@@ -3,9 +3,18 @@ Utilidades de base de datos para PostgreSQL
 Maneja conexiones, upserts e idempotencia
 """
 import os
+import io
+import csv
 import json
-from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
+import random
+import uuid
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Any, Optional, Iterable, Tuple, Callable, Set
 import psycopg2
 from psycopg2.extras import execute_values, Json
 
@@ -19,12 +28,174 @@ except ImportError:
         return os.environ.get(key)
 
 
+def _sync_token(record: Dict[str, Any]) -> Optional[int]:
+    """SyncToken de QBO como entero (None si no es numerico)"""
+    try:
+        return int(record.get('SyncToken'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _last_updated_time(record: Dict[str, Any]) -> Optional[str]:
+    """MetaData.LastUpdatedTime en ISO (Postgres lo convierte a timestamptz)"""
+    return (record.get('MetaData') or {}).get('LastUpdatedTime')
+
+
+def _txn_date(record: Dict[str, Any]) -> Optional[str]:
+    """TxnDate de la transaccion (YYYY-MM-DD)"""
+    return record.get('TxnDate') or None
+
+
+# Columnas tipadas derivadas del payload que mantiene el loader.
+# Las que requieren un cast no IMMUTABLE (fechas) no pueden ser GENERATED;
+# las extracciones de texto puro si lo son y se definen en init.sql.
+TYPED_COLUMNS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'sync_token': _sync_token,
+    'last_updated_utc': _last_updated_time,
+}
+
+TABLE_TYPED_COLUMNS: Dict[str, Dict[str, Callable[[Dict[str, Any]], Any]]] = {
+    'raw.qb_invoices': {'txn_date': _txn_date},
+}
+
+
+def typed_columns_for(table_name: str) -> Dict[str, Callable[[Dict[str, Any]], Any]]:
+    """Columnas tipadas (nombre -> extractor) que el loader escribe en la tabla"""
+    columns = dict(TYPED_COLUMNS)
+    columns.update(TABLE_TYPED_COLUMNS.get(table_name, {}))
+    return columns
+
+
+def _invoice_lines(record: Dict[str, Any]) -> Iterable[Tuple]:
+    """
+    Filas de raw.qb_invoice_lines para una factura (orden de INVOICE_LINE_COLUMNS)
+
+    El detalle tipado vive en la clave indicada por DetailType
+    (ej: SalesItemLineDetail.ItemRef). Solo se aplanan las lineas de primer
+    nivel; las lineas internas de GroupLineDetail quedan en el payload.
+    """
+    invoice_id = str(record['Id'])
+    txn_date = _txn_date(record)
+    for line_number, line in enumerate(record.get('Line') or [], start=1):
+        detail_type = line.get('DetailType')
+        detail = (line.get(detail_type) or {}) if detail_type else {}
+        yield (
+            invoice_id,
+            line_number,
+            line.get('Id'),
+            detail_type,
+            (detail.get('ItemRef') or {}).get('value'),
+            line.get('Description'),
+            detail.get('Qty'),
+            detail.get('UnitPrice'),
+            line.get('Amount'),
+            txn_date
+        )
+
+
+INVOICE_LINE_COLUMNS = [
+    'invoice_id', 'line_number', 'line_id', 'detail_type', 'item_ref',
+    'description', 'qty', 'unit_price', 'amount', 'txn_date'
+]
+
+# Tablas hijas aplanadas desde el payload: se reemplazan por registro
+# (DELETE + COPY) en la misma transaccion del upsert de la tabla padre.
+CHILD_TABLES: Dict[str, Dict[str, Any]] = {
+    'raw.qb_invoices': {
+        'table': 'raw.qb_invoice_lines',
+        'parent_key': 'invoice_id',
+        'columns': INVOICE_LINE_COLUMNS,
+        'rows': _invoice_lines,
+    },
+}
+
+
+def merge_volumetry(
+    target: Dict[Tuple[str, str, int], List[int]],
+    deltas: Dict[Tuple[str, str, int], List[int]]
+):
+    """Acumula cambios de volumetria (ver PostgresClient.volumetry_deltas)"""
+    for key, (delta, loaded) in deltas.items():
+        current = target.setdefault(key, [0, 0])
+        current[0] += delta
+        current[1] += loaded
+
+
+class SyncTokenIndex:
+    """
+    Indice compacto id -> SyncToken para filtrar registros sin cambios
+
+    Guarda los ids ordenados en una lista y los SyncToken en un array
+    de enteros paralelo; la busqueda es binaria (bisect). Evita un dict
+    de millones de entradas y su overhead por objeto.
+    """
+
+    MISSING_TOKEN = -1
+
+    def __init__(self, pairs: Iterable[Tuple[str, Optional[str]]]):
+        """
+        Args:
+            pairs: Tuplas (id, sync_token) tal como vienen de la base de datos
+        """
+        ordered = sorted((str(record_id), token) for record_id, token in pairs)
+        self._ids = [record_id for record_id, _ in ordered]
+        self._tokens = array('q', (self._parse_token(token) for _, token in ordered))
+
+    @classmethod
+    def _parse_token(cls, token) -> int:
+        """Convierte el SyncToken de QBO (string numerico) a entero"""
+        try:
+            return int(token)
+        except (TypeError, ValueError):
+            return cls.MISSING_TOKEN
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, record_id) -> Optional[int]:
+        """Retorna el SyncToken almacenado para un id, o None si no existe"""
+        key = str(record_id)
+        pos = bisect_left(self._ids, key)
+        if pos < len(self._ids) and self._ids[pos] == key:
+            return self._tokens[pos]
+        return None
+
+    def is_unchanged(self, record: Dict[str, Any]) -> bool:
+        """
+        Indica si el registro ya esta cargado con el mismo SyncToken
+
+        Un token no numerico o ausente se considera siempre como cambio.
+        """
+        stored = self.get(record.get('Id'))
+        if stored is None or stored == self.MISSING_TOKEN:
+            return False
+        return stored == self._parse_token(record.get('SyncToken'))
+
+
 class PostgresClient:
     """
     Cliente para interactuar con PostgreSQL
     Implementa upserts idempotentes y logging de ejecuciones
     """
 
+    # Tamano de lote para consultas con listas de ids (= ANY(%s))
+    ID_LOOKUP_BATCH_SIZE = 50000
+
+    # Slots del contador de filas: cargas paralelas no compiten por la misma fila
+    ROW_COUNT_SLOTS = 16
+
+    # Columnas base de raw.qb_*; se completan con typed_columns_for()
+    UPSERT_COLUMNS = [
+        'id',
+        'payload',
+        'ingested_at_utc',
+        'extract_window_start_utc',
+        'extract_window_end_utc',
+        'page_number',
+        'page_size',
+        'extraction_request_id'
+    ]
+
     def __init__(self):
         """Inicializa el cliente cargando credenciales de Mage Secrets"""
         self.host = get_secret_value('PG_HOST') or 'postgres'
@@ -53,13 +224,187 @@ class PostgresClient:
             self.connection.close()
             print("[DB] Conexion cerrada")
 
+    def clone(self) -> 'PostgresClient':
+        """Crea un cliente con los mismos parametros y conexion propia"""
+        client = PostgresClient.__new__(PostgresClient)
+        client.host = self.host
+        client.port = self.port
+        client.database = self.database
+        client.user = self.user
+        client.password = self.password
+        client.connection = None
+        return client
+
+    def existing_ids(self, table_name: str, record_ids: Iterable[str]) -> Set[str]:
+        """
+        Ids de record_ids que ya estan en una tabla raw.qb_*
+
+        Solo lee la PK (= ANY(%s) por lotes), sin tocar el payload.
+        """
+        ids = sorted({str(record_id) for record_id in record_ids if record_id})
+        found: Set[str] = set()
+
+        if ids:
+            conn = self.connect()
+            cursor = conn.cursor()
+            try:
+                for offset in range(0, len(ids), self.ID_LOOKUP_BATCH_SIZE):
+                    batch = ids[offset:offset + self.ID_LOOKUP_BATCH_SIZE]
+                    cursor.execute(f"SELECT id FROM {table_name} WHERE id = ANY(%s)", (batch,))
+                    found.update(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.close()
+        return found
+
+    def load_sync_token_index(
+        self,
+        table_name: str,
+        record_ids: Iterable[str]
+    ) -> SyncTokenIndex:
+        """
+        Pre-carga el mapa id -> SyncToken de los ids afectados
+
+        Usa el indice de la clave primaria con consultas = ANY(%s) por lotes,
+        leyendo la columna tipada sync_token sin tocar el payload JSONB.
+
+        Args:
+            table_name: Nombre de la tabla (ej: raw.qb_invoices)
+            record_ids: Ids de los registros a cargar
+
+        Returns:
+            SyncTokenIndex: Indice ordenado con los ids ya existentes
+        """
+        ids = sorted({str(record_id) for record_id in record_ids if record_id})
+        pairs = []
+
+        if ids:
+            conn = self.connect()
+            cursor = conn.cursor()
+            try:
+                for offset in range(0, len(ids), self.ID_LOOKUP_BATCH_SIZE):
+                    batch = ids[offset:offset + self.ID_LOOKUP_BATCH_SIZE]
+                    cursor.execute(
+                        f"SELECT id, sync_token FROM {table_name} "
+                        f"WHERE id = ANY(%s)",
+                        (batch,)
+                    )
+                    pairs.extend(cursor.fetchall())
+            finally:
+                cursor.close()
+
+        index = SyncTokenIndex(pairs)
+        print(f"[DB] Indice de SyncToken cargado para {table_name}: "
+              f"{len(index)} de {len(ids)} ids ya existen")
+        return index
+
+    def filter_unchanged_records(
+        self,
+        table_name: str,
+        records: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Descarta los registros cuyo SyncToken coincide con el ya cargado
+
+        Args:
+            table_name: Nombre de la tabla (ej: raw.qb_invoices)
+            records: Lista de registros con 'record' y metadatos de pagina
+
+        Returns:
+            tuple: (registros con cambios, cantidad de registros omitidos)
+        """
+        index = self.load_sync_token_index(
+            table_name,
+            (item['record'].get('Id') for item in records)
+        )
+
+        changed = [item for item in records if not index.is_unchanged(item['record'])]
+        skipped = len(records) - len(changed)
+
+        print(f"[DB] Filtro de cambios en {table_name}: "
+              f"{len(changed)} con cambios, {skipped} sin cambios omitidos")
+        return changed, skipped
+
+    def register_extraction_requests(
+        self,
+        table_name: str,
+        records: List[Dict[str, Any]],
+        window_start: str,
+        window_end: str,
+        request_payload: Optional[Dict] = None,
+        cursor=None
+    ) -> Dict[Optional[int], int]:
+        """
+        Registra una fila en raw.extraction_requests por pagina de la ejecucion
+
+        El request_payload se guarda una vez por pagina y cada registro
+        cargado solo lleva el id de su solicitud (extraction_request_id).
+
+        Args:
+            table_name: Tabla destino de los registros
+            records: Registros de la ejecucion (se usan sus paginas)
+            window_start: Inicio de ventana de extraccion (ISO format)
+            window_end: Fin de ventana de extraccion (ISO format)
+            request_payload: Payload de la solicitud original
+            cursor: Cursor de una transaccion abierta; si es None se usa
+                uno propio y se confirma al terminar
+
+        Returns:
+            dict: page_number -> id en raw.extraction_requests
+        """
+        pages = {}
+        for item in records:
+            pages.setdefault(item.get('page_number'), item.get('page_size'))
+
+        if not pages:
+            return {}
+
+        run_id = str(uuid.uuid4())
+        payload = Json(request_payload) if request_payload else None
+        values = [
+            (run_id, table_name, window_start, window_end, page_number, page_size, payload)
+            for page_number, page_size in pages.items()
+        ]
+
+        own_cursor = cursor is None
+        if own_cursor:
+            cursor = self.connect().cursor()
+
+        try:
+            result = execute_values(
+                cursor,
+                """
+                INSERT INTO raw.extraction_requests (
+                    run_id, table_name, window_start_utc, window_end_utc,
+                    page_number, page_size, request_payload
+                )
+                VALUES %s
+                RETURNING page_number, id
+                """,
+                values,
+                fetch=True
+            )
+            if own_cursor:
+                self.connection.commit()
+        except Exception:
+            if own_cursor:
+                self.connection.rollback()
+            raise
+        finally:
+            if own_cursor:
+                cursor.close()
+
+        return dict(result)
+
     def upsert_records(
         self,
         table_name: str,
         records: List[Dict[str, Any]],
         window_start: str,
         window_end: str,
-        request_payload: Optional[Dict] = None
+        request_payload: Optional[Dict] = None,
+        skip_unchanged: bool = False,
+        extraction_request_ids: Optional[Dict[Optional[int], int]] = None,
+        volumetry: Optional[Dict[Tuple[str, str, int], List[int]]] = None
     ) -> Dict[str, int]:
         """
         Inserta o actualiza registros de forma idempotente (UPSERT)
@@ -69,13 +414,27 @@ class PostgresClient:
             records: Lista de registros con 'record' y metadatos de pagina
             window_start: Inicio de ventana de extraccion (ISO format)
             window_end: Fin de ventana de extraccion (ISO format)
-            request_payload: Payload de la solicitud original
+            request_payload: Payload de la solicitud original; se guarda
+                una vez por pagina en raw.extraction_requests
+            skip_unchanged: Si es True, omite los registros cuyo SyncToken
+                ya esta cargado (ver filter_unchanged_records)
+            extraction_request_ids: Mapa page_number -> solicitud ya
+                registrada (ver register_extraction_requests); si es None
+                se registran en la misma transaccion del upsert
+            volumetry: Si se pasa, los cambios de raw.volumetry_stats se
+                acumulan ahi en lugar de aplicarse (ver upsert_records_parallel)
 
         Returns:
-            dict: Contadores de registros insertados/actualizados
+            dict: Contadores de registros insertados/actualizados/omitidos
         """
         if not records:
-            return {'inserted': 0, 'updated': 0}
+            return {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+        skipped = 0
+        if skip_unchanged:
+            records, skipped = self.filter_unchanged_records(table_name, records)
+            if not records:
+                return {'inserted': 0, 'updated': 0, 'skipped': skipped}
 
         conn = self.connect()
         cursor = conn.cursor()
@@ -84,6 +443,21 @@ class PostgresClient:
         updated = 0
         ingested_at = datetime.now(timezone.utc)
 
+        typed_columns = typed_columns_for(table_name)
+        columns = self.UPSERT_COLUMNS + list(typed_columns)
+
+        try:
+            if extraction_request_ids is None:
+                extraction_request_ids = self.register_extraction_requests(
+                    table_name, records, window_start, window_end,
+                    request_payload=request_payload, cursor=cursor
+                )
+        except Exception as e:
+            conn.rollback()
+            cursor.close()
+            print(f"[DB ERROR] Error registrando solicitudes de extraccion: {str(e)}")
+            raise
+
         # Preparar datos para upsert
         values = []
         for item in records:
@@ -102,56 +476,98 @@ class PostgresClient:
                 window_end,
                 item.get('page_number'),
                 item.get('page_size'),
-                Json(request_payload) if request_payload else None
+                extraction_request_ids.get(item.get('page_number')),
+                *(extract(record) for extract in typed_columns.values())
             ))
 
         if not values:
-            return {'inserted': 0, 'updated': 0}
+            conn.rollback()
+            cursor.close()
+            return {'inserted': 0, 'updated': 0, 'skipped': skipped}
+
+        # Orden por id: dos transacciones concurrentes toman los locks de
+        # fila en el mismo orden y no pueden entrar en deadlock
+        values.sort(key=lambda row: row[0])
+        sync_token_position = len(self.UPSERT_COLUMNS) + list(typed_columns).index('sync_token')
 
         # Query de UPSERT (INSERT ... ON CONFLICT UPDATE)
+        # request_payload por fila queda obsoleto: vive en raw.extraction_requests;
+        # un registro que vuelve a llegar de QBO deja de estar marcado como borrado.
+        # Una version mas vieja (lote confirmado fuera de orden) no pisa a la vigente.
+        update_set = ',\n                '.join(
+            [f"{column} = EXCLUDED.{column}" for column in columns[1:]]
+            + ['request_payload = NULL', 'deleted_at_utc = NULL']
+        )
         upsert_query = f"""
-            INSERT INTO {table_name} (
-                id,
-                payload,
-                ingested_at_utc,
-                extract_window_start_utc,
-                extract_window_end_utc,
-                page_number,
-                page_size,
-                request_payload
-            )
+            INSERT INTO {table_name} AS t ({', '.join(columns)})
             VALUES %s
             ON CONFLICT (id) DO UPDATE SET
-                payload = EXCLUDED.payload,
-                ingested_at_utc = EXCLUDED.ingested_at_utc,
-                extract_window_start_utc = EXCLUDED.extract_window_start_utc,
-                extract_window_end_utc = EXCLUDED.extract_window_end_utc,
-                page_number = EXCLUDED.page_number,
-                page_size = EXCLUDED.page_size,
-                request_payload = EXCLUDED.request_payload
-            RETURNING (xmax = 0) AS inserted
+                {update_set}
+            WHERE EXCLUDED.sync_token >= t.sync_token OR t.sync_token IS NULL
+            RETURNING t.id, (xmax = 0) AS inserted
         """
 
         try:
+            # Filas vigentes bloqueadas antes de tocarlas; las que ya tienen
+            # un SyncToken mayor quedan fuera del upsert y de la volumetria
+            current = self.lock_current_versions(cursor, table_name, [row[0] for row in values])
+            stale = {
+                row[0] for row in values
+                if current.get(row[0]) is not None
+                and (row[sync_token_position] is None or row[sync_token_position] < current[row[0]])
+            }
+            if stale:
+                values = [row for row in values if row[0] not in stale]
+                skipped += len(stale)
+                print(f"[DB] {len(stale)} registros omitidos en {table_name}: "
+                      f"ya hay una version mas nueva cargada")
+
+            # Volumetria: filas existentes fuera de su ventana/pagina previa y
+            # filas del lote en la actual (se calcula antes de reescribirlas)
+            deltas = self.volumetry_deltas(
+                cursor, table_name, [row[0] for row in values], window_start, window_end,
+                Counter(row[5] for row in values)
+            )
+
             # Ejecutar upsert en batch
             result = execute_values(
                 cursor,
                 upsert_query,
                 values,
-                template="(%s, %s, %s, %s, %s, %s, %s, %s)",
+                template=f"({', '.join(['%s'] * len(columns))})",
                 fetch=True
-            )
+            ) if values else []
 
             # Contar inserciones vs actualizaciones
-            for row in result:
-                if row[0]:  # xmax = 0 significa INSERT
+            written = set()
+            for record_id, is_insert in result:
+                written.add(record_id)
+                if is_insert:  # xmax = 0 significa INSERT
                     inserted += 1
                 else:
                     updated += 1
+            written_records = [
+                item for item in records
+                if item['record'].get('Id') and str(item['record']['Id']) in written
+            ]
+
+            # Tablas hijas (ej: lineas de factura) en la misma transaccion
+            child_rows = self.replace_child_rows(
+                cursor, table_name, [item['record'] for item in written_records]
+            )
+
+            # Contador de filas y volumetria en la misma transaccion del upsert
+            self.increment_row_count(cursor, table_name, inserted)
+            if volumetry is None:
+                self.apply_volumetry(cursor, table_name, deltas, ingested_at)
+            else:
+                merge_volumetry(volumetry, deltas)
 
             conn.commit()
             print(f"[DB] Upsert completado en {table_name}: "
                   f"{inserted} insertados, {updated} actualizados")
+            if child_rows is not None:
+                print(f"[DB] {child_rows} filas reemplazadas en {CHILD_TABLES[table_name]['table']}")
 
         except Exception as e:
             conn.rollback()
@@ -161,17 +577,283 @@ class PostgresClient:
         finally:
             cursor.close()
 
-        return {'inserted': inserted, 'updated': updated}
+        return {'inserted': inserted, 'updated': updated, 'skipped': skipped}
+
+    def lock_current_versions(
+        self,
+        cursor,
+        table_name: str,
+        record_ids: List[str]
+    ) -> Dict[str, Optional[int]]:
+        """
+        Bloquea (FOR UPDATE, en orden de id) las filas existentes de un lote
+
+        Debe llamarse con el cursor de la transaccion del upsert: hasta el
+        commit ningun otro writer puede reescribir esas filas.
+
+        Returns:
+            dict: id -> SyncToken cargado (solo ids que ya existen)
+        """
+        if not record_ids:
+            return {}
+        cursor.execute(
+            f"SELECT id, sync_token FROM {table_name} "
+            f"WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+            (sorted(record_ids),)
+        )
+        return dict(cursor.fetchall())
+
+    def replace_child_rows(
+        self,
+        cursor,
+        table_name: str,
+        records: List[Dict[str, Any]]
+    ) -> Optional[int]:
+        """
+        Reemplaza las filas hijas de los registros (ver CHILD_TABLES)
+
+        Borra las filas previas de cada padre y carga las nuevas con COPY
+        (un solo stream CSV por lote, sin INSERT por fila). Debe llamarse con
+        el cursor de la transaccion del upsert: una factura nunca queda con
+        lineas de dos versiones distintas.
+
+        Returns:
+            int: Filas cargadas, o None si la tabla no tiene tabla hija
+        """
+        child = CHILD_TABLES.get(table_name)
+        if child is None:
+            return None
+        if not records:
+            return 0
+
+        cursor.execute(
+            f"DELETE FROM {child['table']} WHERE {child['parent_key']} = ANY(%s)",
+            ([str(record['Id']) for record in records],)
+        )
+
+        # En CSV un campo vacio sin comillas es NULL
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        rows = 0
+        for record in records:
+            for row in child['rows'](record):
+                writer.writerow(row)
+                rows += 1
+
+        if rows:
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY {child['table']} ({', '.join(child['columns'])}) "
+                f"FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        return rows
+
+    @staticmethod
+    def partition_by_id(
+        records: List[Dict[str, Any]],
+        partitions: int
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Reparte registros en particiones disjuntas por hash estable del Id
+
+        Un mismo Id siempre cae en la misma particion, por lo que dos
+        conexiones nunca compiten por la misma fila.
+        """
+        shards = [[] for _ in range(partitions)]
+        for item in records:
+            record_id = str(item['record'].get('Id') or '')
+            shards[zlib.crc32(record_id.encode()) % partitions].append(item)
+        return shards
+
+    def upsert_records_parallel(
+        self,
+        table_name: str,
+        records: List[Dict[str, Any]],
+        window_start: str,
+        window_end: str,
+        request_payload: Optional[Dict] = None,
+        skip_unchanged: bool = False,
+        workers: int = 4
+    ) -> Dict[str, int]:
+        """
+        UPSERT paralelo particionado por hash del Id sobre N conexiones
+
+        Cada particion se carga con upsert_records en su propia conexion y
+        transaccion. Las particiones son disjuntas, asi que los workers no
+        se bloquean entre si. El registro en raw.backfill_log sigue siendo
+        uno solo: lo escribe el llamador con los contadores agregados.
+
+        Si una particion falla, las demas ya pueden haber confirmado; como
+        la carga es idempotente basta con re-ejecutar la ventana.
+
+        Todas las particiones tocan las mismas filas (tabla, ventana, pagina)
+        de raw.volumetry_stats: cada una devuelve sus cambios y se aplican
+        una sola vez, en una transaccion, cuando confirmaron todas.
+
+        Args:
+            workers: Numero de conexiones/particiones (1 = carga secuencial)
+
+        Returns:
+            dict: Contadores agregados de todas las particiones
+        """
+        if workers <= 1 or len(records) < workers:
+            return self.upsert_records(
+                table_name, records, window_start, window_end,
+                request_payload=request_payload,
+                skip_unchanged=skip_unchanged
+            )
+
+        shards = [shard for shard in self.partition_by_id(records, workers) if shard]
+        print(f"[DB] Carga paralela en {table_name}: {len(records)} registros "
+              f"en {len(shards)} particiones")
+
+        # Una sola solicitud por pagina para toda la ejecucion, no por particion
+        extraction_request_ids = self.register_extraction_requests(
+            table_name, records, window_start, window_end,
+            request_payload=request_payload
+        )
+
+        def load_shard(shard: List[Dict[str, Any]]) -> Tuple[Dict[str, int], Dict]:
+            client = self.clone()
+            shard_volumetry: Dict[Tuple[str, str, int], List[int]] = {}
+            try:
+                result = client.upsert_records(
+                    table_name, shard, window_start, window_end,
+                    request_payload=request_payload,
+                    skip_unchanged=skip_unchanged,
+                    extraction_request_ids=extraction_request_ids,
+                    volumetry=shard_volumetry
+                )
+                return result, shard_volumetry
+            finally:
+                client.close()
+
+        totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        volumetry: Dict[Tuple[str, str, int], List[int]] = {}
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            for result, shard_volumetry in executor.map(load_shard, shards):
+                for key in totals:
+                    totals[key] += result.get(key, 0)
+                merge_volumetry(volumetry, shard_volumetry)
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        try:
+            self.apply_volumetry(cursor, table_name, volumetry, datetime.now(timezone.utc))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[DB ERROR] Error actualizando volumetria: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+        print(f"[DB] Carga paralela completada en {table_name}: "
+              f"{totals['inserted']} insertados, {totals['updated']} actualizados")
+        return totals
+
+    def is_partitioned(self, table_name: str) -> bool:
+        """Indica si la tabla usa el layout particionado (ver migrar_particiones.sql)"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = %s::regclass)",
+            (table_name,)
+        )
+        partitioned = cursor.fetchone()[0]
+        cursor.close()
+        return partitioned
+
+    def migrate_to_partitioned(self, table_name: str, partitions: int = 8) -> int:
+        """
+        Migra una tabla raw.qb_* a particiones HASH (id)
+
+        Usa la funcion raw.migrate_to_hash_partitions definida en init.sql.
+        Es idempotente: si la tabla ya esta particionada retorna 0.
+
+        Returns:
+            int: Filas copiadas a la tabla particionada
+        """
+        schema, _, table = table_name.rpartition('.')
+        if schema and schema != 'raw':
+            raise ValueError(f"Solo se migran tablas del esquema raw: {table_name}")
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT raw.migrate_to_hash_partitions(%s, %s)",
+                (table, partitions)
+            )
+            rows = cursor.fetchone()[0]
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[DB ERROR] Error migrando {table_name}: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+        print(f"[DB] {table_name} particionada en {partitions} particiones ({rows} filas)")
+        return rows
+
+    def analyze_touched_partitions(
+        self,
+        table_name: str,
+        record_ids: Iterable[str]
+    ) -> List[str]:
+        """
+        Ejecuta ANALYZE solo en las particiones que recibieron los ids cargados
+
+        No hace nada si la tabla no esta particionada.
+
+        Returns:
+            list: Particiones analizadas
+        """
+        if not self.is_partitioned(table_name):
+            return []
+
+        ids = sorted({str(record_id) for record_id in record_ids if record_id})
+        if not ids:
+            return []
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        partitions = set()
+        try:
+            for offset in range(0, len(ids), self.ID_LOOKUP_BATCH_SIZE):
+                cursor.execute(
+                    f"SELECT DISTINCT tableoid::regclass::text FROM {table_name} "
+                    f"WHERE id = ANY(%s)",
+                    (ids[offset:offset + self.ID_LOOKUP_BATCH_SIZE],)
+                )
+                partitions.update(row[0] for row in cursor.fetchall())
+
+            for partition in sorted(partitions):
+                cursor.execute(f"ANALYZE {partition}")
+            conn.commit()
+        finally:
+            cursor.close()
+
+        print(f"[DB] ANALYZE en {len(partitions)} particiones de {table_name}")
+        return sorted(partitions)
 
     def log_backfill_start(
         self,
         entity_name: str,
         window_start: str,
-        window_end: str
+        window_end: str,
+        destination: str = 'postgres'
     ) -> int:
         """
         Registra el inicio de una ejecucion de backfill
 
+        Args:
+            destination: postgres (capa RAW) o lake; la cobertura de
+                find_missing_windows se calcula por destino
+
         Returns:
             int: ID del registro de log
         """
@@ -181,9 +863,9 @@ class PostgresClient:
         query = """
             INSERT INTO raw.backfill_log (
                 entity_name, window_start_utc, window_end_utc,
-                status, started_at_utc
+                status, started_at_utc, destination
             )
-            VALUES (%s, %s, %s, 'running', %s)
+            VALUES (%s, %s, %s, 'running', %s, %s)
             RETURNING id
         """
 
@@ -191,7 +873,8 @@ class PostgresClient:
             entity_name,
             window_start,
             window_end,
-            datetime.now(timezone.utc)
+            datetime.now(timezone.utc),
+            destination
         ))
 
         log_id = cursor.fetchone()[0]
@@ -248,16 +931,640 @@ class PostgresClient:
 
         print(f"[LOG] Backfill log ID {log_id} actualizado: {status}")
 
-    def get_record_count(self, table_name: str) -> int:
-        """Obtiene el conteo de registros en una tabla"""
+    def find_missing_windows(
+        self,
+        entity_name: str,
+        start: str,
+        end: str,
+        destination: str = 'postgres'
+    ) -> List[Dict[str, Any]]:
+        """
+        Calcula los sub-rangos de [start, end] sin un tramo completado
+
+        Usa window_range (tstzrange con indice GiST) y operaciones de
+        multirango: cobertura = range_agg de tramos 'completed'; cada
+        hueco se clasifica como 'failed', 'running' o 'missing' segun los
+        tramos del log que lo intersectan.
+
+        Args:
+            entity_name: Entidad en raw.backfill_log (invoices, customers, items)
+            start: Inicio del rango a verificar (ISO format UTC)
+            end: Fin del rango a verificar (ISO format UTC, inclusivo)
+            destination: Solo cuentan los tramos cargados a este destino
+                (un tramo escrito al lake no cubre Postgres)
+
+        Returns:
+            list: Dicts con status, window_start y window_end (inclusivos)
+        """
         conn = self.connect()
         cursor = conn.cursor()
 
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        count = cursor.fetchone()[0]
+        cursor.execute(
+            """
+            WITH requested AS (
+                SELECT tstzrange(%(start)s::timestamptz, %(end)s::timestamptz, '[]') AS r
+            ),
+            log AS (
+                SELECT status, window_range
+                FROM raw.backfill_log, requested
+                WHERE entity_name = %(entity)s
+                  AND destination = %(destination)s
+                  AND window_range && requested.r
+            ),
+            coverage AS (
+                SELECT
+                    tstzmultirange((SELECT r FROM requested))
+                        - COALESCE(range_agg(window_range) FILTER (WHERE status = 'completed'),
+                                   '{}'::tstzmultirange) AS gaps,
+                    COALESCE(range_agg(window_range) FILTER (WHERE status = 'failed'),
+                             '{}'::tstzmultirange) AS failed,
+                    COALESCE(range_agg(window_range) FILTER (WHERE status = 'running'),
+                             '{}'::tstzmultirange) AS running
+                FROM log
+            ),
+            classified AS (
+                SELECT 'failed' AS status, unnest(gaps * failed) AS gap FROM coverage
+                UNION ALL
+                SELECT 'running', unnest((gaps - failed) * running) FROM coverage
+                UNION ALL
+                SELECT 'missing', unnest(gaps - failed - running) FROM coverage
+            )
+            SELECT status, lower(gap), upper(gap), lower_inc(gap), upper_inc(gap)
+            FROM classified
+            -- Entre tramos contiguos (...23:59:59 / 00:00:00...) queda un hueco
+            -- abierto de 1 segundo que no es un tramo faltante
+            WHERE upper(gap) - lower(gap) > INTERVAL '1 second'
+            ORDER BY lower(gap)
+            """,
+            {'entity': entity_name, 'start': start, 'end': end, 'destination': destination}
+        )
+
+        one_second = timedelta(seconds=1)
+        windows = [
+            {
+                'status': status,
+                'window_start': lower if lower_inc else lower + one_second,
+                'window_end': upper if upper_inc else upper - one_second
+            }
+            for status, lower, upper, lower_inc, upper_inc in cursor.fetchall()
+        ]
+        cursor.close()
+
+        print(f"[DB] {entity_name} {start} -> {end}: {len(windows)} sub-rangos sin completar")
+        return windows
+
+    def count_windows(
+        self,
+        table_name: str,
+        windows: List[Tuple[str, str]]
+    ) -> List[int]:
+        """
+        Registros vigentes por ventana de last_updated_utc (inclusiva), en una query
+
+        Cada conteo es un rango sobre el indice parcial de last_updated_utc
+        (filas no marcadas como borradas), sin leer payloads; es el
+        equivalente en Postgres del COUNT(*) de QBO para la misma ventana.
+
+        Returns:
+            list: Conteos en el mismo orden que windows
+        """
+        if not windows:
+            return []
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT (
+                SELECT COUNT(*) FROM {table_name} t
+                WHERE t.last_updated_utc BETWEEN w.window_start AND w.window_end
+                  AND t.deleted_at_utc IS NULL
+            )
+            FROM unnest(%s::TIMESTAMPTZ[], %s::TIMESTAMPTZ[])
+                WITH ORDINALITY AS w(window_start, window_end, ordinal)
+            ORDER BY w.ordinal
+            """,
+            ([start for start, _ in windows], [end for _, end in windows])
+        )
+        counts = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+        return counts
+
+    def log_count_mismatch(
+        self,
+        entity_name: str,
+        window_start: str,
+        window_end: str,
+        qbo_count: int,
+        postgres_count: int,
+        detail: str
+    ) -> int:
+        """
+        Registra en raw.backfill_log una ventana cuyo conteo no coincide con QBO
+
+        La fila queda con status 'mismatch' y no cuenta como cobertura en
+        find_missing_windows; la re-extraccion genera su propia fila.
+
+        Returns:
+            int: ID del registro de log
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        now = datetime.now(timezone.utc)
+        cursor.execute(
+            """
+            INSERT INTO raw.backfill_log (
+                entity_name, window_start_utc, window_end_utc, status,
+                qbo_count, postgres_count, error_message,
+                started_at_utc, completed_at_utc
+            )
+            VALUES (%s, %s, %s, 'mismatch', %s, %s, %s, %s, %s)
+            RETURNING id
+            """,
+            (entity_name, window_start, window_end, qbo_count, postgres_count, detail, now, now)
+        )
+        log_id = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+
+        print(f"[LOG] Diferencia de conteo registrada (log ID {log_id}): "
+              f"{entity_name} {window_start} -> {window_end} QBO={qbo_count} Postgres={postgres_count}")
+        return log_id
+
+    def update_count_mismatch(self, log_id: int, detail: str):
+        """Actualiza el resultado (error_message) de una diferencia ya registrada"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE raw.backfill_log
+            SET error_message = %s,
+                completed_at_utc = %s
+            WHERE id = %s AND status = 'mismatch'
+            """,
+            (detail, datetime.now(timezone.utc), log_id)
+        )
+        conn.commit()
+        cursor.close()
+
+    def get_checkpoint(
+        self,
+        entity_name: str,
+        window_start: str,
+        window_end: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Retorna el checkpoint de un tramo (ultima pagina cargada), si existe
+
+        Returns:
+            dict: last_page, page_size, records_loaded y resume_from_utc, o None
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT last_page, page_size, records_loaded, resume_from_utc
+            FROM raw.backfill_checkpoints
+            WHERE entity_name = %s AND window_start_utc = %s AND window_end_utc = %s
+            """,
+            (entity_name, window_start, window_end)
+        )
+        row = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+
+        if row is None:
+            return None
+        return {
+            'last_page': row[0],
+            'page_size': row[1],
+            'records_loaded': row[2],
+            'resume_from_utc': row[3]
+        }
+
+    def save_checkpoint(
+        self,
+        entity_name: str,
+        window_start: str,
+        window_end: str,
+        last_page: int,
+        page_size: int,
+        records_loaded: int,
+        resume_from: Optional[datetime] = None
+    ):
+        """
+        Registra la ultima pagina del tramo cargada de forma durable
+
+        Llamar despues del commit de la pagina: si el proceso cae entre
+        ambos pasos la pagina se vuelve a cargar, lo cual es idempotente.
+
+        Args:
+            resume_from: Mayor MetaData.LastUpdatedTime cargado hasta
+                last_page; la reanudacion pide el tramo desde esa fecha
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO raw.backfill_checkpoints (
+                entity_name, window_start_utc, window_end_utc,
+                last_page, page_size, records_loaded, resume_from_utc, updated_at_utc
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (entity_name, window_start_utc, window_end_utc) DO UPDATE SET
+                last_page = EXCLUDED.last_page,
+                page_size = EXCLUDED.page_size,
+                records_loaded = EXCLUDED.records_loaded,
+                resume_from_utc = EXCLUDED.resume_from_utc,
+                updated_at_utc = NOW()
+            """,
+            (entity_name, window_start, window_end, last_page, page_size, records_loaded, resume_from)
+        )
+        conn.commit()
+        cursor.close()
+
+    def clear_checkpoint(self, entity_name: str, window_start: str, window_end: str):
+        """Elimina el checkpoint de un tramo completado"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            DELETE FROM raw.backfill_checkpoints
+            WHERE entity_name = %s AND window_start_utc = %s AND window_end_utc = %s
+            """,
+            (entity_name, window_start, window_end)
+        )
+        conn.commit()
+        cursor.close()
+
+    def get_watermark(self, entity_name: str) -> Optional[datetime]:
+        """Retorna el ultimo MetaData.LastUpdatedTime cargado de una entidad"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT last_updated_utc FROM raw.sync_watermarks WHERE entity_name = %s",
+            (entity_name,)
+        )
+        row = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+        return row[0] if row else None
+
+    def advance_watermark(
+        self,
+        entity_name: str,
+        last_updated: Optional[datetime],
+        window_end: Optional[str] = None
+    ) -> Optional[datetime]:
+        """
+        Avanza el watermark de una entidad (nunca retrocede)
+
+        Llamar solo despues de una carga exitosa.
+
+        Args:
+            entity_name: invoices, customers o items
+            last_updated: Mayor LastUpdatedTime de los registros cargados
+            window_end: Fin de la ventana extraida (informativo)
+
+        Returns:
+            datetime: Watermark vigente tras la actualizacion
+        """
+        if last_updated is None:
+            return self.get_watermark(entity_name)
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO raw.sync_watermarks (
+                entity_name, last_updated_utc, last_window_end_utc, updated_at_utc
+            )
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (entity_name) DO UPDATE SET
+                last_updated_utc = GREATEST(raw.sync_watermarks.last_updated_utc,
+                                            EXCLUDED.last_updated_utc),
+                last_window_end_utc = EXCLUDED.last_window_end_utc,
+                updated_at_utc = NOW()
+            RETURNING last_updated_utc
+            """,
+            (entity_name, last_updated, window_end)
+        )
+        watermark = cursor.fetchone()[0]
+        conn.commit()
         cursor.close()
 
-        return count
+        print(f"[WATERMARK] {entity_name}: {watermark.isoformat()}")
+        return watermark
+
+    def iter_versions(
+        self,
+        table_name: str,
+        ingested_before: Optional[datetime] = None
+    ) -> Iterable[Tuple[str, Optional[int], bool]]:
+        """
+        Recorre (id, sync_token, marcado_borrado) ordenado por id en orden binario
+
+        ORDER BY id COLLATE "C" coincide con el orden de str en Python, lo que
+        permite un merge en streaming contra ids ordenados del lado de QBO.
+        Solo lee la PK y columnas tipadas, nunca el payload.
+
+        Args:
+            ingested_before: Ignora filas cargadas desde este momento (llegaron
+                despues de la foto de QBO contra la que se compara)
+        """
+        conn = self.connect()
+        cursor = conn.cursor(name=f"iter_versions_{uuid.uuid4().hex[:8]}")
+        cursor.itersize = self.ID_LOOKUP_BATCH_SIZE
+        try:
+            cursor.execute(
+                f"""
+                SELECT id, sync_token, deleted_at_utc IS NOT NULL
+                FROM {table_name}
+                WHERE %s::TIMESTAMPTZ IS NULL OR ingested_at_utc < %s
+                ORDER BY id COLLATE "C"
+                """,
+                (ingested_before, ingested_before)
+            )
+            for row in cursor:
+                yield row
+        finally:
+            cursor.close()
+            conn.commit()
+
+    def mark_deleted(self, table_name: str, record_ids: List[str], deleted: bool = True) -> int:
+        """
+        Marca (o desmarca) registros como borrados en QBO (deleted_at_utc)
+
+        Las filas se conservan: el contador y la volumetria no cambian.
+
+        Returns:
+            int: Filas actualizadas
+        """
+        if not record_ids:
+            return 0
+        conn = self.connect()
+        cursor = conn.cursor()
+        updated = 0
+        try:
+            for offset in range(0, len(record_ids), self.ID_LOOKUP_BATCH_SIZE):
+                batch = record_ids[offset:offset + self.ID_LOOKUP_BATCH_SIZE]
+                if deleted:
+                    cursor.execute(
+                        f"UPDATE {table_name} SET deleted_at_utc = NOW() "
+                        f"WHERE id = ANY(%s) AND deleted_at_utc IS NULL",
+                        (batch,)
+                    )
+                else:
+                    cursor.execute(
+                        f"UPDATE {table_name} SET deleted_at_utc = NULL "
+                        f"WHERE id = ANY(%s) AND deleted_at_utc IS NOT NULL",
+                        (batch,)
+                    )
+                updated += cursor.rowcount
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[DB ERROR] Error marcando registros borrados: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+        return updated
+
+    def delete_records(self, table_name: str, record_ids: List[str]) -> int:
+        """
+        Elimina registros (y sus filas hijas) manteniendo contador y volumetria
+
+        Todo ocurre en una sola transaccion, igual que el upsert.
+
+        Returns:
+            int: Filas eliminadas
+        """
+        if not record_ids:
+            return 0
+        conn = self.connect()
+        cursor = conn.cursor()
+        deleted = 0
+        child = CHILD_TABLES.get(table_name)
+        try:
+            for offset in range(0, len(record_ids), self.ID_LOOKUP_BATCH_SIZE):
+                batch = record_ids[offset:offset + self.ID_LOOKUP_BATCH_SIZE]
+                self.apply_volumetry(
+                    cursor, table_name,
+                    self.volumetry_deltas(cursor, table_name, batch, None, None, {}),
+                    datetime.now(timezone.utc)
+                )
+                if child:
+                    cursor.execute(
+                        f"DELETE FROM {child['table']} WHERE {child['parent_key']} = ANY(%s)",
+                        (batch,)
+                    )
+                cursor.execute(f"DELETE FROM {table_name} WHERE id = ANY(%s)", (batch,))
+                deleted += cursor.rowcount
+
+            self.increment_row_count(cursor, table_name, -deleted)
+            conn.commit()
+            print(f"[DB] {deleted} registros eliminados de {table_name}")
+        except Exception as e:
+            conn.rollback()
+            print(f"[DB ERROR] Error eliminando registros: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+        self.prune_volumetry(table_name)
+        return deleted
+
+    def increment_row_count(self, cursor, table_name: str, delta: int):
+        """
+        Suma delta al contador de filas de la tabla (raw.table_row_counts)
+
+        Se ejecuta con el cursor de la transaccion de carga, asi que el
+        contador se confirma o revierte junto con los datos.
+        """
+        if not delta:
+            return
+        cursor.execute(
+            """
+            INSERT INTO raw.table_row_counts (table_name, counter_slot, row_count)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (table_name, counter_slot) DO UPDATE
+            SET row_count = raw.table_row_counts.row_count + EXCLUDED.row_count,
+                updated_at_utc = NOW()
+            """,
+            (table_name, random.randrange(self.ROW_COUNT_SLOTS), delta)
+        )
+
+    def volumetry_deltas(
+        self,
+        cursor,
+        table_name: str,
+        record_ids: List[str],
+        window_start: str,
+        window_end: str,
+        page_counts: Dict[Optional[int], int]
+    ) -> Dict[Tuple[str, str, int], List[int]]:
+        """
+        Cambios en raw.volumetry_stats de cargar un lote, sin aplicarlos
+
+        Resta las filas existentes de su ventana/pagina previa (lookup por
+        PK) y suma las del lote por pagina. Debe llamarse antes del upsert,
+        en su misma transaccion; solo lee, no bloquea raw.volumetry_stats.
+
+        Returns:
+            dict: (inicio, fin, pagina) -> [delta, registros cargados]
+        """
+        if not record_ids:
+            return {}
+        pages = [(page_number or 0, count) for page_number, count in page_counts.items()]
+        cursor.execute(
+            f"""
+            SELECT window_start_utc::TEXT, window_end_utc::TEXT, page_number,
+                   SUM(delta)::BIGINT, SUM(loaded)::BIGINT
+            FROM (
+                SELECT
+                    COALESCE(extract_window_start_utc, '-infinity') AS window_start_utc,
+                    COALESCE(extract_window_end_utc, 'infinity') AS window_end_utc,
+                    COALESCE(page_number, 0) AS page_number,
+                    -1 AS delta,
+                    0 AS loaded
+                FROM {table_name}
+                WHERE id = ANY(%(ids)s)
+                UNION ALL
+                SELECT
+                    COALESCE(%(start)s::TIMESTAMPTZ, '-infinity'),
+                    COALESCE(%(end)s::TIMESTAMPTZ, 'infinity'),
+                    added.page_number,
+                    added.records,
+                    added.records
+                FROM unnest(%(pages)s::INTEGER[], %(counts)s::INTEGER[])
+                    AS added(page_number, records)
+            ) changes
+            GROUP BY 1, 2, 3
+            """,
+            {
+                'ids': record_ids,
+                'start': window_start,
+                'end': window_end,
+                'pages': [page_number for page_number, _ in pages],
+                'counts': [count for _, count in pages]
+            }
+        )
+        return {
+            (start, end, page_number): [delta, loaded]
+            for start, end, page_number, delta, loaded in cursor.fetchall()
+        }
+
+    def apply_volumetry(
+        self,
+        cursor,
+        table_name: str,
+        deltas: Dict[Tuple[str, str, int], List[int]],
+        ingested_at: datetime
+    ):
+        """
+        Aplica cambios de volumetry_deltas en una sola sentencia
+
+        Las filas se actualizan ordenadas por (ventana, pagina): dos cargas
+        concurrentes toman los locks en el mismo orden y no entran en
+        deadlock. Las filas que quedan en cero se eliminan fuera de la
+        carga (ver prune_volumetry).
+        """
+        rows = [
+            (
+                table_name, start, end, page_number, delta,
+                ingested_at if loaded else None,
+                ingested_at if loaded else None
+            )
+            for (start, end, page_number), (delta, loaded) in sorted(deltas.items())
+            if delta or loaded
+        ]
+        if not rows:
+            return
+        execute_values(
+            cursor,
+            """
+            INSERT INTO raw.volumetry_stats AS vs (
+                table_name, window_start_utc, window_end_utc, page_number,
+                record_count, first_ingested_utc, last_ingested_utc
+            )
+            VALUES %s
+            ON CONFLICT (table_name, window_start_utc, window_end_utc, page_number) DO UPDATE
+            SET record_count = vs.record_count + EXCLUDED.record_count,
+                first_ingested_utc = LEAST(vs.first_ingested_utc, EXCLUDED.first_ingested_utc),
+                last_ingested_utc = GREATEST(vs.last_ingested_utc, EXCLUDED.last_ingested_utc)
+            """,
+            rows,
+            template="(%s, %s::TIMESTAMPTZ, %s::TIMESTAMPTZ, %s, %s, %s, %s)",
+            page_size=len(rows)
+        )
+
+    def prune_volumetry(self, table_name: str) -> int:
+        """
+        Elimina las filas de raw.volumetry_stats que quedaron en cero
+
+        Se ejecuta al cerrar un tramo, en su propia transaccion, y no en
+        cada upsert: recorre todas las filas de la tabla.
+
+        Returns:
+            int: Filas eliminadas
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "DELETE FROM raw.volumetry_stats WHERE table_name = %s AND record_count = 0",
+                (table_name,)
+            )
+            pruned = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return pruned
+
+    def get_record_count(self, table_name: str, exact: bool = False) -> int:
+        """
+        Obtiene el conteo de registros en una tabla
+
+        Por defecto lee el contador mantenido por el loader (O(1)). Si la
+        tabla no tiene contador usa la estimacion reltuples de pg_class
+        (sumando particiones si la tabla esta particionada).
+
+        Args:
+            table_name: Nombre de la tabla (ej: raw.qb_invoices)
+            exact: Si es True ejecuta SELECT COUNT(*) (recorre la tabla)
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+
+        if exact:
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            count = cursor.fetchone()[0]
+            cursor.close()
+            return count
+
+        cursor.execute(
+            "SELECT SUM(row_count) FROM raw.table_row_counts WHERE table_name = %s",
+            (table_name,)
+        )
+        count = cursor.fetchone()[0]
+
+        if count is None:
+            cursor.execute(
+                """
+                SELECT COALESCE(SUM(reltuples) FILTER (WHERE reltuples > 0), 0)::BIGINT
+                FROM pg_class
+                WHERE oid = %s::regclass
+                   OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)
+                """,
+                (table_name, table_name)
+            )
+            count = cursor.fetchone()[0]
+            print(f"[DB] {table_name} sin contador; usando estimacion de pg_class")
+
+        cursor.close()
+        return int(count)
 
 
 def get_postgres_client():
@@ -0,0 +1,394 @@
+"""
+Cola distribuida de tramos de backfill sobre raw.backfill_jobs
+Los workers reclaman jobs con FOR UPDATE SKIP LOCKED y mantienen un lease
+con heartbeats; si un worker cae, su lease vence y otro worker lo retoma.
+
+Uso (desde mage_data/qbo_project):
+    python -m utils.job_queue encolar --entidad invoices \\
+        --fecha-inicio 2022-01-01T00:00:00Z --fecha-fin 2024-12-31T23:59:59Z --tramo month
+    python -m utils.job_queue worker
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+from psycopg2.extras import execute_values
+
+from utils.qbo_client import QBOClient, RateLimiter, get_qbo_client
+from utils.db_utils import get_postgres_client
+from utils.backfill_runner import run_window, get_entity_config
+from utils.backfill_windows import split_windows, format_utc, GRANULARITIES
+
+
+# Duracion del lease; el heartbeat lo renueva cada LEASE_SECONDS / 3
+LEASE_SECONDS = 300
+
+# Espera antes de re-intentar un job fallido (se duplica por intento)
+RETRY_BACKOFF_SECONDS = 60
+
+# Espera entre consultas cuando la cola esta vacia
+IDLE_POLL_SECONDS = 15
+
+
+def default_worker_id() -> str:
+    """Identificador unico del worker: host, pid y sufijo aleatorio"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def enqueue_windows(
+    db,
+    entity_name: str,
+    start: str,
+    end: str,
+    granularity: str = 'month',
+    max_attempts: int = 3
+) -> int:
+    """
+    Encola un job por tramo del rango
+
+    Los tramos ya encolados se ignoran, salvo los 'failed', que vuelven a
+    'pending' con los intentos en cero.
+
+    Returns:
+        int: Cantidad de jobs nuevos o re-encolados
+    """
+    get_entity_config(entity_name)
+    windows = split_windows(start, end, granularity)
+
+    conn = db.connect()
+    cursor = conn.cursor()
+    rows = execute_values(
+        cursor,
+        """
+        INSERT INTO raw.backfill_jobs (entity_name, window_start_utc, window_end_utc, max_attempts)
+        VALUES %s
+        ON CONFLICT (entity_name, window_start_utc, window_end_utc) DO UPDATE
+        SET status = 'pending',
+            attempts = 0,
+            max_attempts = EXCLUDED.max_attempts,
+            available_at_utc = NOW(),
+            worker_id = NULL,
+            lease_expires_at_utc = NULL,
+            completed_at_utc = NULL
+        WHERE raw.backfill_jobs.status = 'failed'
+        RETURNING id, (xmax = 0) AS inserted
+        """,
+        [(entity_name, ws, we, max_attempts) for ws, we in windows],
+        fetch=True
+    )
+    conn.commit()
+    cursor.close()
+
+    inserted = sum(1 for _, is_new in rows if is_new)
+    print(f"[QUEUE] {inserted} jobs nuevos y {len(rows) - inserted} fallidos re-encolados "
+          f"de {len(windows)} tramos para {entity_name}")
+    return len(rows)
+
+
+def claim_job(db, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+    """
+    Reclama el siguiente job disponible para este worker
+
+    Un job es reclamable si esta 'pending' y su backoff vencio, o si esta
+    'running' con el lease vencido (worker caido). SKIP LOCKED evita que dos
+    workers bloqueen o reclamen el mismo job. Los jobs con lease vencido que
+    agotaron sus intentos se marcan 'failed'.
+
+    Returns:
+        dict: Job reclamado, o None si la cola no tiene trabajo disponible
+    """
+    conn = db.connect()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        UPDATE raw.backfill_jobs
+        SET status = 'failed',
+            last_error = COALESCE(last_error, 'Lease vencido sin intentos restantes'),
+            completed_at_utc = NOW()
+        WHERE status = 'running'
+          AND lease_expires_at_utc < NOW()
+          AND attempts >= max_attempts
+    """)
+
+    cursor.execute("""
+        WITH next_job AS (
+            SELECT id
+            FROM raw.backfill_jobs
+            WHERE (status = 'pending' AND available_at_utc <= NOW())
+               OR (status = 'running' AND lease_expires_at_utc < NOW())
+            ORDER BY window_start_utc, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE raw.backfill_jobs j
+        SET status = 'running',
+            worker_id = %s,
+            attempts = j.attempts + 1,
+            lease_expires_at_utc = NOW() + make_interval(secs => %s),
+            heartbeat_at_utc = NOW(),
+            started_at_utc = NOW()
+        FROM next_job
+        WHERE j.id = next_job.id
+        RETURNING j.id, j.entity_name, j.window_start_utc, j.window_end_utc,
+                  j.attempts, j.max_attempts
+    """, (worker_id, lease_seconds))
+
+    row = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+
+    if row is None:
+        return None
+
+    return {
+        'id': row[0],
+        'entity_name': row[1],
+        'window_start': format_utc(row[2]),
+        'window_end': format_utc(row[3]),
+        'attempts': row[4],
+        'max_attempts': row[5]
+    }
+
+
+def heartbeat_job(db, job_id: int, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> bool:
+    """
+    Renueva el lease de un job
+
+    Returns:
+        bool: False si el job ya no pertenece a este worker
+    """
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE raw.backfill_jobs
+        SET lease_expires_at_utc = NOW() + make_interval(secs => %s),
+            heartbeat_at_utc = NOW()
+        WHERE id = %s AND worker_id = %s AND status = 'running'
+    """, (lease_seconds, job_id, worker_id))
+    renewed = cursor.rowcount == 1
+    conn.commit()
+    cursor.close()
+    return renewed
+
+
+def complete_job(db, job_id: int, worker_id: str, log_id: Optional[int] = None) -> bool:
+    """Marca un job como completado (solo si el lease sigue siendo de este worker)"""
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE raw.backfill_jobs
+        SET status = 'completed',
+            backfill_log_id = %s,
+            last_error = NULL,
+            lease_expires_at_utc = NULL,
+            completed_at_utc = NOW()
+        WHERE id = %s AND worker_id = %s AND status = 'running'
+    """, (log_id, job_id, worker_id))
+    updated = cursor.rowcount == 1
+    conn.commit()
+    cursor.close()
+    return updated
+
+
+def fail_job(db, job_id: int, worker_id: str, error_message: str) -> Optional[str]:
+    """
+    Registra el fallo de un job
+
+    Si le quedan intentos vuelve a 'pending' con backoff exponencial,
+    de lo contrario queda 'failed'.
+
+    Returns:
+        str: Nuevo estado del job, o None si el lease ya no era de este worker
+    """
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE raw.backfill_jobs
+        SET status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END,
+            available_at_utc = NOW() + make_interval(secs => %s * power(2, attempts - 1)),
+            last_error = %s,
+            lease_expires_at_utc = NULL,
+            completed_at_utc = CASE WHEN attempts < max_attempts THEN NULL ELSE NOW() END
+        WHERE id = %s AND worker_id = %s AND status = 'running'
+        RETURNING status
+    """, (RETRY_BACKOFF_SECONDS, error_message, job_id, worker_id))
+    row = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    return row[0] if row else None
+
+
+class JobHeartbeat(threading.Thread):
+    """
+    Hilo que renueva el lease de un job mientras se ejecuta
+
+    Usa su propia conexion para no interferir con la transaccion de carga.
+    """
+
+    def __init__(self, job_id: int, worker_id: str, lease_seconds: int = LEASE_SECONDS):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lease_lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        db = get_postgres_client()
+        try:
+            while not self._stop_event.wait(self.lease_seconds / 3):
+                try:
+                    if not heartbeat_job(db, self.job_id, self.worker_id, self.lease_seconds):
+                        self.lease_lost = True
+                        print(f"[ADVERTENCIA] Job {self.job_id}: lease perdido, "
+                              f"otro worker puede estar procesando el tramo")
+                        return
+                except Exception as e:
+                    print(f"[ADVERTENCIA] Job {self.job_id}: heartbeat fallido: {str(e)}")
+                    db.close()
+        finally:
+            db.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_worker(
+    worker_id: Optional[str] = None,
+    requests_per_minute: int = QBOClient.RATE_LIMIT_REQUESTS,
+    lease_seconds: int = LEASE_SECONDS,
+    skip_unchanged: bool = False,
+    max_jobs: Optional[int] = None,
+    exit_when_empty: bool = False
+) -> Dict[str, int]:
+    """
+    Loop de un worker: reclama jobs y ejecuta cada tramo con run_window
+
+    La carga es idempotente (upsert), por lo que re-ejecutar un tramo cuyo
+    worker cayo a mitad de camino no duplica registros.
+
+    Args:
+        worker_id: Identificador del worker (por defecto host:pid:aleatorio)
+        requests_per_minute: Presupuesto de QBO para este worker; con N
+            workers usar ~400/N para no exceder el limite de la compania
+        lease_seconds: Duracion del lease renovado por heartbeat
+        skip_unchanged: Omitir registros con el mismo SyncToken ya cargado
+        max_jobs: Terminar tras procesar esta cantidad de jobs
+        exit_when_empty: Terminar cuando la cola no tenga trabajo disponible
+
+    Returns:
+        dict: Jobs completados y fallidos por este worker
+    """
+    worker_id = worker_id or default_worker_id()
+    db = get_postgres_client()
+    client = get_qbo_client(
+        rate_limiter=RateLimiter(requests_per_minute, QBOClient.RATE_LIMIT_WINDOW)
+    )
+    stats = {'completed': 0, 'failed': 0}
+
+    print(f"[WORKER] {worker_id} iniciado ({requests_per_minute} req/min)")
+
+    try:
+        while max_jobs is None or stats['completed'] + stats['failed'] < max_jobs:
+            job = claim_job(db, worker_id, lease_seconds)
+            if job is None:
+                if exit_when_empty:
+                    break
+                time.sleep(IDLE_POLL_SECONDS)
+                continue
+
+            print(f"[WORKER] Job {job['id']} ({job['entity_name']} {job['window_start']} -> "
+                  f"{job['window_end']}), intento {job['attempts']}/{job['max_attempts']}")
+
+            heartbeat = JobHeartbeat(job['id'], worker_id, lease_seconds)
+            heartbeat.start()
+            try:
+                result = run_window(
+                    job['entity_name'],
+                    job['window_start'],
+                    job['window_end'],
+                    client=client,
+                    db=db,
+                    skip_unchanged=skip_unchanged,
+                    should_abort=lambda: heartbeat.lease_lost
+                )
+            except Exception as e:
+                heartbeat.stop()
+                if heartbeat.lease_lost:
+                    print(f"[ADVERTENCIA] Job {job['id']} abortado: el lease ya pertenece "
+                          f"a otro worker")
+                    continue
+                status = fail_job(db, job['id'], worker_id, str(e))
+                stats['failed'] += 1
+                print(f"[WORKER] Job {job['id']} fallido -> {status}")
+                continue
+
+            heartbeat.stop()
+            if heartbeat.lease_lost:
+                print(f"[ADVERTENCIA] Job {job['id']} terminado pero el lease se perdio; "
+                      f"no se marca como completado")
+            elif complete_job(db, job['id'], worker_id, result['log_id']):
+                stats['completed'] += 1
+                print(f"[WORKER] Job {job['id']} completado: "
+                      f"{result['inserted']} insertados, {result['updated']} actualizados")
+            else:
+                print(f"[ADVERTENCIA] Job {job['id']} completado pero el lease ya "
+                      f"pertenecia a otro worker")
+
+    except KeyboardInterrupt:
+        print(f"[WORKER] {worker_id} detenido; los jobs en curso se re-asignan al vencer el lease")
+
+    finally:
+        db.close()
+
+    print(f"[WORKER] {worker_id} finalizado: {stats['completed']} completados, "
+          f"{stats['failed']} fallidos")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cola distribuida de tramos de backfill de QBO')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    encolar = subparsers.add_parser('encolar', help='Encola un job por tramo')
+    encolar.add_argument('--entidad', required=True, choices=['invoices', 'customers', 'items'])
+    encolar.add_argument('--fecha-inicio', required=True, help='ISO 8601 UTC (ej: 2024-01-01T00:00:00Z)')
+    encolar.add_argument('--fecha-fin', required=True, help='ISO 8601 UTC (ej: 2024-12-31T23:59:59Z)')
+    encolar.add_argument('--tramo', default='month', choices=GRANULARITIES)
+    encolar.add_argument('--intentos', type=int, default=3)
+
+    worker = subparsers.add_parser('worker', help='Procesa jobs de la cola')
+    worker.add_argument('--worker-id')
+    worker.add_argument('--requests-por-minuto', type=int, default=QBOClient.RATE_LIMIT_REQUESTS)
+    worker.add_argument('--lease', type=int, default=LEASE_SECONDS, help='Segundos de lease')
+    worker.add_argument('--omitir-sin-cambios', action='store_true')
+    worker.add_argument('--max-jobs', type=int)
+    worker.add_argument('--salir-si-vacia', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.comando == 'encolar':
+        db = get_postgres_client()
+        try:
+            enqueue_windows(db, args.entidad, args.fecha_inicio, args.fecha_fin,
+                            args.tramo, args.intentos)
+        finally:
+            db.close()
+    else:
+        run_worker(
+            worker_id=args.worker_id,
+            requests_per_minute=args.requests_por_minuto,
+            lease_seconds=args.lease,
+            skip_unchanged=args.omitir_sin_cambios,
+            max_jobs=args.max_jobs,
+            exit_when_empty=args.salir_si_vacia
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+"""
+Sink de archivos (lake local) como alternativa a la capa RAW de Postgres
+Escribe las paginas extraidas como Parquet (o NDJSON) comprimido con zstd,
+particionado por fecha de LastUpdatedTime, consultable con DuckDB o pyarrow
+"""
+import json
+import os
+import uuid
+from datetime import date, datetime, timezone
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # pyarrow es opcional: solo se requiere con destino = lake
+    pa = None
+    pq = None
+
+from utils.db_utils import typed_columns_for
+from utils.backfill_windows import parse_utc, window_key
+from utils.validation import pack_version
+
+
+# Directorio raiz del lake (por defecto junto a variables_dir de Mage)
+LAKE_DIR = os.environ.get('QBO_LAKE_DIR') or os.path.join(
+    os.path.expanduser('~'), '.mage_data', 'qbo_lake'
+)
+
+FORMATS = ('parquet', 'ndjson')
+EXTENSIONS = {'parquet': '.parquet', 'ndjson': '.ndjson.zst'}
+
+# Particion de los registros sin MetaData.LastUpdatedTime
+UNKNOWN_PARTITION = 'desconocida'
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "pyarrow no esta instalado. Instalar con: pip install pyarrow"
+        )
+
+
+def lake_schema(table_name: str):
+    """Columnas del lake: metadatos de la capa RAW, columnas tipadas y payload JSON"""
+    _require_pyarrow()
+    fields = [
+        ('id', pa.string()),
+        ('sync_token', pa.int64()),
+        ('last_updated_utc', pa.timestamp('us', tz='UTC')),
+    ]
+    if 'txn_date' in typed_columns_for(table_name):
+        fields.append(('txn_date', pa.date32()))
+    fields += [
+        ('payload', pa.string()),
+        ('ingested_at_utc', pa.timestamp('us', tz='UTC')),
+        ('extract_window_start_utc', pa.timestamp('us', tz='UTC')),
+        ('extract_window_end_utc', pa.timestamp('us', tz='UTC')),
+        ('page_number', pa.int32()),
+        ('page_size', pa.int32()),
+        ('position_in_page', pa.int32()),
+    ]
+    return pa.schema(fields)
+
+
+class _Part:
+    """
+    Archivo de datos en escritura (.tmp hasta el commit de la ventana)
+
+    size() son los bytes ya comprimidos en disco; sirve para rotar.
+    stale son las filas (id, version) ya escritas que una version mas
+    nueva del mismo id reemplazo; se filtran al publicar.
+    """
+
+    def __init__(self, file_format: str, tmp_path: str, schema, metadata: Dict[str, str]):
+        self.file_format = file_format
+        self.tmp_path = tmp_path
+        self.schema = schema.with_metadata(metadata)
+        self.rows = 0
+        self.stale: Set[Tuple[str, int]] = set()
+        self._sink = pa.OSFile(tmp_path, 'wb')
+        if file_format == 'parquet':
+            self._writer = pq.ParquetWriter(self._sink, self.schema, compression='zstd')
+        else:
+            self._writer = pa.CompressedOutputStream(self._sink, 'zstd')
+
+    def write(self, table):
+        if self.file_format == 'parquet':
+            self._writer.write_table(table)
+        else:
+            for row in table.to_pylist():
+                line = {key: value.isoformat() if isinstance(value, (datetime, date)) else value
+                        for key, value in row.items()}
+                line['payload'] = json.loads(line['payload'])
+                self._writer.write((json.dumps(line) + '\n').encode('utf-8'))
+        self.rows += table.num_rows
+
+    def size(self) -> int:
+        return self._sink.tell()
+
+    def close(self):
+        self._writer.close()
+        if not self._sink.closed:
+            self._sink.close()
+
+    def drop_stale(self) -> int:
+        """
+        Reescribe el archivo (ya cerrado) sin las filas reemplazadas
+
+        Returns:
+            int: Filas que quedan en el archivo
+        """
+        if not self.stale:
+            return self.rows
+        if self.file_format == 'parquet':
+            table = pq.ParquetFile(self.tmp_path).read()
+            keep = [
+                (record_id, pack_version(sync_token, last_updated)) not in self.stale
+                for record_id, sync_token, last_updated in zip(
+                    table.column('id').to_pylist(),
+                    table.column('sync_token').to_pylist(),
+                    table.column('last_updated_utc').to_pylist()
+                )
+            ]
+            kept = table.filter(pa.array(keep))
+        else:
+            with pa.CompressedInputStream(pa.OSFile(self.tmp_path, 'rb'), 'zstd') as stream:
+                lines = stream.read().decode('utf-8').splitlines()
+            kept = []
+            for line in lines:
+                row = json.loads(line)
+                last_updated = row['last_updated_utc']
+                version = pack_version(row['sync_token'],
+                                       datetime.fromisoformat(last_updated) if last_updated else None)
+                if (row['id'], version) not in self.stale:
+                    kept.append(line)
+
+        rows = kept.num_rows if self.file_format == 'parquet' else len(kept)
+        if rows:
+            rewrite_path = self.tmp_path[:-len('.tmp')] + '.dedup.tmp'
+            with pa.OSFile(rewrite_path, 'wb') as sink:
+                if self.file_format == 'parquet':
+                    with pq.ParquetWriter(sink, self.schema, compression='zstd') as writer:
+                        writer.write_table(kept)
+                else:
+                    with pa.CompressedOutputStream(sink, 'zstd') as stream:
+                        stream.write(''.join(line + '\n' for line in kept).encode('utf-8'))
+            os.replace(rewrite_path, self.tmp_path)
+        self.rows = rows
+        self.stale.clear()
+        return rows
+
+
+class _WindowWrite:
+    """
+    Archivos de una ventana en curso, agrupados por particion de fecha
+
+    versions guarda la version vigente de cada id de la ventana; buffered y
+    flushed indican donde esta esa fila (buffer de una particion o archivo).
+    """
+
+    def __init__(self, table_name: str, window_start: str, window_end: str):
+        self.table_name = table_name
+        self.window_start = window_start
+        self.window_end = window_end
+        self.run_id = uuid.uuid4().hex[:12]
+        self.records = 0
+        self.metadata: Dict[str, str] = {}
+        self.versions: Dict[str, int] = {}
+        self.buffered: Dict[str, str] = {}
+        self.flushed: Dict[str, _Part] = {}
+        self.buffers: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.open_parts: Dict[str, _Part] = {}
+        self.parts: List[Tuple[str, _Part]] = []
+
+
+class LakeSink:
+    """
+    Destino de archivos con la misma interfaz de carga que PostgresClient
+
+    upsert_records() acumula los registros de una ventana en archivos .tmp
+    (uno abierto por particion de fecha, rotado al superar max_file_bytes);
+    commit_window() los publica con os.replace (atomico) y elimina los
+    archivos de ejecuciones anteriores de la misma ventana, por lo que
+    re-ejecutar un tramo lo sobrescribe en lugar de duplicarlo.
+
+    Cada id aparece una sola vez por ventana: si llega otra version del
+    mismo id se conserva la de mayor SyncToken (y, a igual token, mayor
+    LastUpdatedTime), igual que el UPSERT de Postgres.
+
+    Layout: <root>/<tabla>/last_updated_date=YYYY-MM-DD/<ventana>-<run>-<n>.parquet
+    """
+
+    # Destino registrado en raw.backfill_log (cobertura propia del lake)
+    destination = 'lake'
+
+    # Tamano objetivo por archivo (comprimido)
+    MAX_FILE_BYTES = 128 * 1024 * 1024
+
+    # Filas por row group de Parquet (las paginas de QBO son de 100)
+    ROW_GROUP_ROWS = 10000
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        file_format: str = 'parquet',
+        max_file_bytes: Optional[int] = None
+    ):
+        _require_pyarrow()
+        if file_format not in FORMATS:
+            raise ValueError(f"Formato invalido: {file_format}. Opciones: {', '.join(FORMATS)}")
+        self.root = root or LAKE_DIR
+        self.file_format = file_format
+        self.max_file_bytes = max_file_bytes or self.MAX_FILE_BYTES
+        self._windows: Dict[Tuple[str, str, str], _WindowWrite] = {}
+
+    def table_dir(self, table_name: str) -> str:
+        return os.path.join(self.root, table_name.split('.')[-1])
+
+    @staticmethod
+    def window_key(window_start: str, window_end: str) -> str:
+        """Prefijo de archivo que identifica la ventana (para sobrescribirla)"""
+        return window_key(window_start, window_end)
+
+    def _rows(self, table_name: str, records: List[Dict[str, Any]], window_start, window_end):
+        """Filas del lake agrupadas por particion de fecha"""
+        ingested_at = datetime.now(timezone.utc)
+        typed_columns = typed_columns_for(table_name)
+        extra_columns = {
+            name: extractor for name, extractor in typed_columns.items()
+            if name not in ('sync_token', 'last_updated_utc')
+        }
+        partitions: Dict[str, List[Dict[str, Any]]] = {}
+
+        for item in records:
+            record = item['record']
+            last_updated = (record.get('MetaData') or {}).get('LastUpdatedTime')
+            last_updated = parse_utc(last_updated) if last_updated else None
+            row = {
+                'id': str(record.get('Id')),
+                'sync_token': typed_columns['sync_token'](record),
+                'last_updated_utc': last_updated,
+                'payload': json.dumps(record),
+                'ingested_at_utc': ingested_at,
+                'extract_window_start_utc': parse_utc(window_start) if window_start else None,
+                'extract_window_end_utc': parse_utc(window_end) if window_end else None,
+                'page_number': item.get('page_number'),
+                'page_size': item.get('page_size'),
+                'position_in_page': item.get('position_in_page'),
+            }
+            for name, extractor in extra_columns.items():
+                value = extractor(record)
+                row[name] = date.fromisoformat(value) if isinstance(value, str) else value
+
+            partition = last_updated.date().isoformat() if last_updated else UNKNOWN_PARTITION
+            partitions.setdefault(partition, []).append(row)
+        return partitions
+
+    def _flush(self, window: _WindowWrite, partition: str):
+        """Escribe el buffer de una particion, rotando el archivo si llego al tamano"""
+        buffer = window.buffers.pop(partition, None)
+        if not buffer:
+            return
+        rows = list(buffer.values())
+        part = window.open_parts.get(partition)
+        if part is None:
+            directory = os.path.join(self.table_dir(window.table_name), f"last_updated_date={partition}")
+            os.makedirs(directory, exist_ok=True)
+            name = (f"{self.window_key(window.window_start, window.window_end)}-{window.run_id}"
+                    f"-{len(window.parts):05d}{EXTENSIONS[self.file_format]}")
+            part = _Part(self.file_format, os.path.join(directory, name + '.tmp'),
+                         lake_schema(window.table_name), window.metadata)
+            window.open_parts[partition] = part
+            window.parts.append((partition, part))
+
+        schema = lake_schema(window.table_name)
+        part.write(pa.Table.from_pylist(rows, schema=schema))
+        for row in rows:
+            del window.buffered[row['id']]
+            window.flushed[row['id']] = part
+        if part.size() >= self.max_file_bytes:
+            part.close()
+            del window.open_parts[partition]
+
+    def upsert_records(
+        self,
+        table_name: str,
+        records: List[Dict[str, Any]],
+        window_start: str,
+        window_end: str,
+        request_payload: Optional[Dict] = None,
+        skip_unchanged: bool = False,
+        **kwargs
+    ) -> Dict[str, int]:
+        """
+        Agrega registros a la ventana en curso (visibles recien en commit_window)
+
+        skip_unchanged no aplica: el lake no guarda estado entre ventanas y
+        cada ventana se reescribe completa.
+
+        Returns:
+            dict: inserted = ids nuevos en la ventana, updated = versiones
+                mas nuevas de un id ya recibido, skipped = versiones viejas
+        """
+        if not records:
+            return {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+        key = (table_name, window_start, window_end)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _WindowWrite(table_name, window_start, window_end)
+
+        # Trazabilidad: la solicitud queda en los metadatos de cada archivo Parquet
+        if request_payload and not window.metadata:
+            window.metadata = {'qbo_request': json.dumps(request_payload)}
+        counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        for partition, rows in self._rows(table_name, records, window_start, window_end).items():
+            buffer = window.buffers.setdefault(partition, {})
+            for row in rows:
+                record_id = row['id']
+                version = pack_version(row['sync_token'], row['last_updated_utc'])
+                current = window.versions.get(record_id)
+                if current is not None and version <= current:
+                    counts['skipped'] += 1
+                    continue
+
+                # Version mas nueva: sacar la anterior del buffer o marcarla en su archivo
+                if current is None:
+                    counts['inserted'] += 1
+                else:
+                    counts['updated'] += 1
+                    if record_id in window.buffered:
+                        del window.buffers[window.buffered[record_id]][record_id]
+                    else:
+                        window.flushed.pop(record_id).stale.add((record_id, current))
+                window.versions[record_id] = version
+                window.buffered[record_id] = partition
+                buffer[record_id] = row
+
+            if len(buffer) >= self.ROW_GROUP_ROWS:
+                self._flush(window, partition)
+
+        window.records = len(window.versions)
+        return counts
+
+    def commit_window(self, table_name: str, window_start: str, window_end: str) -> Dict[str, Any]:
+        """
+        Publica los archivos de la ventana y elimina los de ejecuciones previas
+
+        Cada archivo aparece completo o no aparece (rename atomico). Entre el
+        rename y el borrado de los archivos anteriores un lector puede ver
+        ambas versiones; una caida en ese punto se corrige re-ejecutando.
+
+        Returns:
+            dict: files, records y bytes publicados
+        """
+        window = self._windows.pop((table_name, window_start, window_end), None)
+        if window is None:
+            window = _WindowWrite(table_name, window_start, window_end)
+
+        for partition in list(window.buffers):
+            self._flush(window, partition)
+        for part in window.open_parts.values():
+            part.close()
+
+        published = set()
+        total_bytes = 0
+        for _, part in window.parts:
+            if not part.drop_stale():
+                os.remove(part.tmp_path)
+                continue
+            final_path = part.tmp_path[:-len('.tmp')]
+            total_bytes += os.path.getsize(part.tmp_path)
+            os.replace(part.tmp_path, final_path)
+            published.add(final_path)
+
+        # Sobrescritura idempotente: fuera todo archivo previo de la misma ventana
+        prefix = self.window_key(window_start, window_end) + '-'
+        removed = 0
+        for directory, _, files in os.walk(self.table_dir(table_name)):
+            for name in files:
+                path = os.path.join(directory, name)
+                if name.startswith(prefix) and path not in published:
+                    os.remove(path)
+                    removed += 1
+
+        print(f"[LAKE] {table_name} {window_start} -> {window_end}: {window.records} registros "
+              f"en {len(published)} archivos ({total_bytes / 1024 / 1024:.1f} MB); "
+              f"{removed} archivos previos reemplazados")
+        return {'files': len(published), 'records': window.records, 'bytes': total_bytes}
+
+    def abort_window(self, table_name: str, window_start: str, window_end: str):
+        """Descarta los .tmp de una ventana fallida; lo publicado antes queda intacto"""
+        window = self._windows.pop((table_name, window_start, window_end), None)
+        if window is None:
+            return
+        for _, part in window.parts:
+            try:
+                part.close()
+            finally:
+                if os.path.exists(part.tmp_path):
+                    os.remove(part.tmp_path)
+
+    def close(self):
+        """Descarta las ventanas sin commit"""
+        for table_name, window_start, window_end in list(self._windows):
+            self.abort_window(table_name, window_start, window_end)
+
+
+def get_lake_sink(root: Optional[str] = None, file_format: str = 'parquet'):
+    """
+    Factory function para obtener una instancia del sink de archivos
+
+    Returns:
+        LakeSink: Instancia configurada
+    """
+    return LakeSink(root=root, file_format=file_format)
@@ -0,0 +1,563 @@
+"""
+Journal local de paginas extraidas (write-ahead) entre extraccion y carga
+El extractor agrega cada pagina a segmentos comprimidos con checksum; el
+loader los consume a su ritmo con su propio offset. Una caida de Postgres
+no obliga a volver a pedir la ventana a la API.
+
+Uso (desde mage_data/qbo_project), cada etapa en su propio proceso:
+    python -m utils.page_journal extraer --entidad invoices \\
+        --fecha-inicio 2024-01-01T00:00:00Z --fecha-fin 2024-01-31T23:59:59Z
+    python -m utils.page_journal cargar --entidad invoices \\
+        --fecha-inicio 2024-01-01T00:00:00Z --fecha-fin 2024-01-31T23:59:59Z --seguir
+    python -m utils.page_journal estado
+"""
+import argparse
+import json
+import os
+import shutil
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable, Iterable
+
+from utils.qbo_client import get_qbo_client
+from utils.db_utils import get_postgres_client
+from utils.backfill_runner import ENTITIES, get_entity_config
+from utils.backfill_windows import window_key, format_utc, high_water_mark
+from utils.validation import validate_records, empty_report, merge_reports, VersionIndex, print_report
+
+
+# Directorio del journal (por defecto junto a variables_dir de Mage)
+JOURNAL_DIR = os.environ.get('QBO_JOURNAL_DIR') or os.path.join(
+    os.path.expanduser('~'), '.mage_data', 'qbo_journal'
+)
+
+# Cabecera de cada frame: magic, numero de pagina, largo comprimido, crc32
+FRAME_HEADER = struct.Struct('>4sIII')
+FRAME_MAGIC = b'QBJ1'
+
+# Tamano de segmento antes de rotar al siguiente archivo
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Espera entre lecturas cuando el loader alcanza al extractor (--seguir)
+POLL_SECONDS = 5
+
+# Antiguedad maxima de un journal para repetirlo en lugar de volver a la API
+JOURNAL_MAX_AGE_HOURS = float(os.environ.get('QBO_JOURNAL_MAX_AGE_HOURS') or 24)
+
+
+class PageJournal:
+    """
+    Journal de un tramo (entidad + ventana) en <root>/<entidad>/<ventana>/
+
+    Cada pagina es un frame (cabecera + JSON comprimido con zlib) agregado
+    al segmento actual con fsync, asi que una pagina confirmada por append()
+    sobrevive a una caida. Un frame truncado al final (caida a mitad de
+    escritura) se descarta al reabrir; un checksum invalido es corrupcion.
+
+    Los offsets son (segmento, posicion) y cada consumidor guarda el suyo
+    en <consumidor>.offset, independiente del extractor.
+    """
+
+    def __init__(self, entity_name: str, window_start: str, window_end: str, root: Optional[str] = None):
+        get_entity_config(entity_name)
+        self.entity_name = entity_name
+        self.window_start = window_start
+        self.window_end = window_end
+        self.path = os.path.join(
+            root or JOURNAL_DIR, entity_name, window_key(window_start, window_end)
+        )
+        self._last_page: Optional[int] = None
+        self._tail: Optional[Tuple[int, int]] = None
+
+    # ---- segmentos y frames ----
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment-{segment:06d}.log")
+
+    def segments(self) -> List[int]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            int(name[len('segment-'):-len('.log')])
+            for name in os.listdir(self.path)
+            if name.startswith('segment-') and name.endswith('.log')
+        )
+
+    def _frames(self, segment: int, position: int = 0, decode: bool = True):
+        """
+        Frames completos de un segmento desde position
+
+        Yields:
+            tuple: (posicion, siguiente posicion, numero de pagina, pagina o None)
+        """
+        with open(self._segment_path(segment), 'rb') as handle:
+            handle.seek(position)
+            while True:
+                header = handle.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                magic, page_number, length, checksum = FRAME_HEADER.unpack(header)
+                if magic != FRAME_MAGIC:
+                    raise RuntimeError(f"Journal corrupto: {self._segment_path(segment)} @ {position}")
+                if not decode:
+                    handle.seek(length, os.SEEK_CUR)
+                    if handle.tell() > os.fstat(handle.fileno()).st_size:
+                        return
+                    next_position = handle.tell()
+                    yield position, next_position, page_number, None
+                    position = next_position
+                    continue
+                body = handle.read(length)
+                if len(body) < length:
+                    return
+                if zlib.crc32(body) != checksum:
+                    raise RuntimeError(
+                        f"Checksum invalido en {self._segment_path(segment)} @ {position} "
+                        f"(pagina {page_number})"
+                    )
+                next_position = position + FRAME_HEADER.size + length
+                yield position, next_position, page_number, json.loads(zlib.decompress(body))
+                position = next_position
+
+    def _recover(self):
+        """Ubica el final valido del journal y trunca un frame incompleto"""
+        self._last_page, self._tail = 0, (0, 0)
+        segments = self.segments()
+        if not segments:
+            return
+        for segment in segments:
+            end = 0
+            for _, end, page_number, _ in self._frames(segment, decode=False):
+                self._last_page = page_number
+            self._tail = (segment, end)
+
+        segment, end = self._tail
+        if os.path.getsize(self._segment_path(segment)) > end:
+            with open(self._segment_path(segment), 'r+b') as handle:
+                handle.truncate(end)
+            print(f"[JOURNAL] Frame incompleto descartado en segmento {segment}")
+
+    # ---- escritura (extractor) ----
+
+    def last_page(self) -> int:
+        """Ultima pagina confirmada en el journal (0 si esta vacio)"""
+        if self._last_page is None:
+            self._recover()
+        return self._last_page
+
+    def append(self, page: List[Dict[str, Any]]):
+        """Agrega una pagina (durable al retornar)"""
+        if not page:
+            return
+        if self._tail is None:
+            self._recover()
+        os.makedirs(self.path, exist_ok=True)
+
+        segment, position = self._tail
+        if (segment, position) == (0, 0):
+            self._write_json('journal.json', {'created_at_utc': datetime.now(timezone.utc).isoformat()})
+        if position >= SEGMENT_BYTES:
+            segment, position = segment + 1, 0
+
+        page_number = page[0].get('page_number', self._last_page + 1)
+        body = zlib.compress(json.dumps(page).encode('utf-8'))
+        with open(self._segment_path(segment), 'ab') as handle:
+            handle.write(FRAME_HEADER.pack(FRAME_MAGIC, page_number, len(body), zlib.crc32(body)))
+            handle.write(body)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        self._tail = (segment, position + FRAME_HEADER.size + len(body))
+        self._last_page = page_number
+
+    def _write_json(self, name: str, data: Dict[str, Any]):
+        """Escritura atomica de un archivo de control (tmp + rename)"""
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, name)
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(data, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _read_json(self, name: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as handle:
+            return json.load(handle)
+
+    def mark_complete(self):
+        """Marca la extraccion del tramo como terminada (no llegaran mas paginas)"""
+        self._write_json('complete.json', {
+            'last_page': self.last_page(),
+            'completed_at_utc': datetime.now(timezone.utc).isoformat()
+        })
+        print(f"[JOURNAL] {self.entity_name} {self.window_start} -> {self.window_end}: "
+              f"extraccion completa ({self.last_page()} paginas)")
+
+    def is_complete(self) -> bool:
+        return os.path.exists(os.path.join(self.path, 'complete.json'))
+
+    def age_hours(self) -> Optional[float]:
+        """Horas desde que se escribio la primera pagina (None si esta vacio)"""
+        segments = self.segments()
+        if not segments:
+            return None
+        info = self._read_json('journal.json')
+        if info:
+            created = datetime.fromisoformat(info['created_at_utc'])
+        else:
+            # Journal previo a journal.json: la escritura mas vieja de sus segmentos
+            created = datetime.fromtimestamp(
+                min(os.path.getmtime(self._segment_path(segment)) for segment in segments),
+                tz=timezone.utc
+            )
+        return (datetime.now(timezone.utc) - created).total_seconds() / 3600
+
+    # ---- lectura (consumidores) ----
+
+    def read(
+        self,
+        offset: Tuple[int, int] = (0, 0),
+        start_page: int = 1
+    ) -> Iterator[Tuple[Tuple[int, int], List[Dict[str, Any]]]]:
+        """
+        Paginas desde offset (omitiendo las anteriores a start_page)
+
+        Yields:
+            tuple: (offset siguiente a la pagina, pagina)
+        """
+        first_segment, position = offset
+        for segment in self.segments():
+            if segment < first_segment:
+                continue
+            start = position if segment == first_segment else 0
+            for _, next_position, page_number, page in self._frames(segment, start):
+                if page_number >= start_page:
+                    yield (segment, next_position), page
+
+    def committed_offset(self, consumer: str = 'loader') -> Tuple[int, int]:
+        state = self._read_json(f"{consumer}.offset")
+        return (state['segment'], state['position']) if state else (0, 0)
+
+    def commit_offset(self, consumer: str, offset: Tuple[int, int], pages: int):
+        """Guarda el offset del consumidor despues de procesar hasta ahi"""
+        self._write_json(f"{consumer}.offset", {
+            'segment': offset[0],
+            'position': offset[1],
+            'pages': pages,
+            'updated_at_utc': datetime.now(timezone.utc).isoformat()
+        })
+
+    def resume_from(self) -> Optional[str]:
+        """
+        Mayor LastUpdatedTime de la ultima pagina del journal (None si esta vacio)
+
+        Las paginas llegan ordenadas por LastUpdatedTime, asi que la ultima
+        tiene la mayor fecha; solo se decodifica ese frame.
+        """
+        last = None
+        for segment in self.segments():
+            for position, _, _, _ in self._frames(segment, decode=False):
+                last = (segment, position)
+        if last is None:
+            return None
+        for _, page in self.read(offset=last):
+            high_water = high_water_mark(page)
+            return format_utc(high_water) if high_water else None
+        return None
+
+    def remove(self):
+        """Elimina el journal del tramo (tras una carga completa)"""
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+            print(f"[JOURNAL] Eliminado {self.path}")
+        self._last_page, self._tail = None, None
+
+
+def journaled_pages(
+    journal: PageJournal,
+    fetch_pages: Callable[[int, Optional[str]], Iterable[List[Dict[str, Any]]]],
+    start_page: int = 1,
+    resume_from: Optional[str] = None,
+    max_age_hours: float = JOURNAL_MAX_AGE_HOURS
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Paginas de un tramo pasando por el journal
+
+    Repite desde el journal las paginas ya extraidas (desde start_page) y
+    pide a la API solo las siguientes, agregando cada una antes de
+    entregarla. Con el journal completo no hay ninguna request. Un journal
+    con mas de max_age_hours se descarta y el tramo se vuelve a pedir.
+
+    Args:
+        fetch_pages: Funcion (primera pagina, fecha de reanudacion) ->
+            generador de paginas de la API (ver QBOClient.fetch_entity_pages)
+        resume_from: Fecha de reanudacion del checkpoint (ver resume_point)
+        max_age_hours: Antiguedad maxima del journal para repetirlo
+    """
+    age = journal.age_hours()
+    if age is not None and age > max_age_hours:
+        print(f"[JOURNAL] Journal de {age:.1f} horas (maximo {max_age_hours}); se descarta")
+        journal.remove()
+
+    last_page = journal.last_page()
+    if last_page:
+        print(f"[JOURNAL] {last_page} paginas ya extraidas; se leen del journal")
+    for _, page in journal.read(start_page=start_page):
+        high_water = high_water_mark(page, since=resume_from)
+        resume_from = format_utc(high_water) if high_water else resume_from
+        yield page
+
+    if journal.is_complete():
+        return
+
+    for page in fetch_pages(max(start_page, last_page + 1), resume_from):
+        journal.append(page)
+        yield page
+    journal.mark_complete()
+
+
+def extract_to_journal(
+    entity_name: str,
+    window_start: str,
+    window_end: str,
+    client=None,
+    root: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Etapa de extraccion: API -> journal, reanudando tras la ultima pagina escrita
+
+    Returns:
+        dict: Resumen (paginas en el journal, requests realizadas)
+    """
+    config = get_entity_config(entity_name)
+    client = client or get_qbo_client()
+    journal = PageJournal(entity_name, window_start, window_end, root)
+
+    if journal.is_complete():
+        print(f"[JOURNAL] Tramo ya extraido ({journal.last_page()} paginas); sin requests")
+    else:
+        start_page = journal.last_page() + 1
+        for page in client.fetch_entity_pages(
+            entity=config['qbo_entity'],
+            start_date=window_start,
+            end_date=window_end,
+            date_field='MetaData.LastUpdatedTime',
+            start_page=start_page,
+            resume_from=journal.resume_from()
+        ):
+            for item in page:
+                item['extract_window_start'] = window_start
+                item['extract_window_end'] = window_end
+            journal.append(page)
+        journal.mark_complete()
+
+    return {
+        'status': 'completed',
+        'entity': entity_name,
+        'pages': journal.last_page(),
+        'requests': client.total_requests,
+        'path': journal.path
+    }
+
+
+def load_from_journal(
+    entity_name: str,
+    window_start: str,
+    window_end: str,
+    db=None,
+    follow: bool = False,
+    pages_per_batch: int = 5,
+    skip_unchanged: bool = False,
+    consumer: str = 'loader',
+    root: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Etapa de carga: journal -> Postgres desde el offset propio del loader
+
+    Valida y carga lotes de paginas; el offset se guarda despues de cada
+    lote confirmado (una caida entre ambos re-carga ese lote: el UPSERT es
+    idempotente). Con follow=True espera paginas nuevas hasta que el
+    extractor marca el tramo como completo. Al terminar, elimina el journal.
+
+    Returns:
+        dict: Resumen del tramo (status 'waiting' si faltan paginas y no se sigue)
+    """
+    config = get_entity_config(entity_name)
+    journal = PageJournal(entity_name, window_start, window_end, root)
+    owns_db = db is None
+    db = db or get_postgres_client()
+
+    start_time = datetime.now(timezone.utc)
+    log_id = db.log_backfill_start(entity_name, window_start, window_end)
+    request_payload = {
+        'entity': config['qbo_entity'],
+        'window_start': window_start,
+        'window_end': window_end,
+        'source': 'journal'
+    }
+    totals = {'records_read': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'pages': 0}
+    versions = VersionIndex()
+    quality = empty_report()
+    offset = journal.committed_offset(consumer)
+
+    def flush(batch: List[Dict[str, Any]], batch_offset: Tuple[int, int]):
+        result = db.upsert_records(
+            table_name=config['table_name'],
+            records=batch,
+            window_start=window_start,
+            window_end=window_end,
+            request_payload=request_payload,
+            skip_unchanged=skip_unchanged
+        )
+        for key in ('inserted', 'updated', 'skipped'):
+            totals[key] += result.get(key, 0)
+        journal.commit_offset(consumer, batch_offset, totals['pages'])
+
+    try:
+        while True:
+            # complete antes de leer: si ya estaba, esta lectura llega al final
+            complete = journal.is_complete()
+            batch: List[Dict[str, Any]] = []
+            batch_pages = 0
+            for next_offset, page in journal.read(offset):
+                valid_records, report = validate_records(page, versions, entity_name=entity_name)
+                merge_reports(quality, report)
+                batch.extend(valid_records)
+                batch_pages += 1
+                totals['records_read'] += len(page)
+                totals['pages'] += 1
+                offset = next_offset
+                if batch_pages >= pages_per_batch:
+                    flush(batch, offset)
+                    batch, batch_pages = [], 0
+            if batch_pages:
+                flush(batch, offset)
+
+            if complete or not follow:
+                break
+            print(f"[JOURNAL] Sin paginas nuevas; esperando {POLL_SECONDS}s al extractor...")
+            time.sleep(POLL_SECONDS)
+
+        # Sin --seguir y con la extraccion en curso el tramo no fallo: queda
+        # 'running' hasta que otra ejecucion cargue las paginas que faltan
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        db.log_backfill_complete(
+            log_id=log_id,
+            records_read=totals['records_read'],
+            records_inserted=totals['inserted'],
+            records_updated=totals['updated'],
+            pages_processed=totals['pages'],
+            duration_seconds=duration,
+            status='completed' if complete else 'running',
+            error_message=None if complete else 'Esperando al extractor: journal incompleto'
+        )
+        if complete:
+            db.prune_volumetry(config['table_name'])
+            journal.remove()
+
+    except Exception as e:
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        db.log_backfill_complete(
+            log_id=log_id,
+            records_read=totals['records_read'],
+            records_inserted=totals['inserted'],
+            records_updated=totals['updated'],
+            pages_processed=totals['pages'],
+            duration_seconds=duration,
+            status='failed',
+            error_message=str(e)
+        )
+        print(f"[ERROR] Fallo cargando el journal {entity_name} {window_start} -> {window_end}: {str(e)}")
+        raise
+
+    finally:
+        if owns_db:
+            db.close()
+
+    print(f"[JOURNAL] Cargadas {totals['pages']} paginas ({totals['records_read']} registros): "
+          f"{totals['inserted']} insertados, {totals['updated']} actualizados")
+    print_report(quality)
+    return {
+        'status': 'completed' if complete else 'waiting',
+        'entity': entity_name,
+        'window_start': window_start,
+        'window_end': window_end,
+        'records_loaded': totals['records_read'],
+        'inserted': totals['inserted'],
+        'updated': totals['updated'],
+        'skipped': totals['skipped'],
+        'pages': totals['pages'],
+        'duration_seconds': duration,
+        'quality': quality,
+        'log_id': log_id
+    }
+
+
+def journal_status(root: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Tramos con journal en disco: paginas extraidas, completo y offset del loader"""
+    root = root or JOURNAL_DIR
+    status = []
+    for entity_name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        for window in sorted(os.listdir(os.path.join(root, entity_name))):
+            path = os.path.join(root, entity_name, window)
+            complete = os.path.exists(os.path.join(path, 'complete.json'))
+            loader = None
+            if os.path.exists(os.path.join(path, 'loader.offset')):
+                with open(os.path.join(path, 'loader.offset')) as handle:
+                    loader = json.load(handle)
+            size = sum(
+                os.path.getsize(os.path.join(path, name))
+                for name in os.listdir(path) if name.endswith('.log')
+            )
+            status.append({
+                'entity': entity_name,
+                'window': window,
+                'complete': complete,
+                'loaded_pages': loader['pages'] if loader else 0,
+                'bytes': size
+            })
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Journal local de paginas entre extraccion y carga')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    for name, help_text in (('extraer', 'API -> journal'), ('cargar', 'Journal -> Postgres')):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('--entidad', required=True, choices=list(ENTITIES))
+        sub.add_argument('--fecha-inicio', required=True, help='ISO 8601 UTC (ej: 2024-01-01T00:00:00Z)')
+        sub.add_argument('--fecha-fin', required=True, help='ISO 8601 UTC (ej: 2024-01-31T23:59:59Z)')
+        if name == 'cargar':
+            sub.add_argument('--seguir', action='store_true',
+                             help='Esperar paginas nuevas hasta que la extraccion termine')
+            sub.add_argument('--paginas-por-lote', type=int, default=5)
+            sub.add_argument('--omitir-sin-cambios', action='store_true')
+
+    subparsers.add_parser('estado', help='Tramos con journal en disco')
+    args = parser.parse_args()
+
+    if args.comando == 'extraer':
+        extract_to_journal(args.entidad, args.fecha_inicio, args.fecha_fin)
+    elif args.comando == 'cargar':
+        summary = load_from_journal(
+            args.entidad, args.fecha_inicio, args.fecha_fin,
+            follow=args.seguir,
+            pages_per_batch=args.paginas_por_lote,
+            skip_unchanged=args.omitir_sin_cambios
+        )
+        raise SystemExit(0 if summary['status'] == 'completed' else 1)
+    else:
+        for entry in journal_status():
+            print(f"  {entry['entity']:<10} {entry['window']}  "
+                  f"{'completo' if entry['complete'] else 'en curso':<9} "
+                  f"cargadas={entry['loaded_pages']:<6} {entry['bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,486 @@
+"""
+Runner productor/consumidor en proceso
+Fetchers concurrentes -> transform -> writers, conectados por colas acotadas.
+Si Postgres es mas lento que la API, las colas se llenan y los fetchers se
+bloquean (backpressure); si la API es mas lenta, los writers esperan.
+
+Uso (desde mage_data/qbo_project):
+    python -m utils.pipeline_runner --entidad invoices \\
+        --fecha-inicio 2024-01-01T00:00:00Z --fecha-fin 2024-03-31T23:59:59Z \\
+        --fetchers 3 --writers 2
+"""
+import argparse
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+from utils.qbo_auth import get_qbo_authenticator
+from utils.qbo_client import QBOClient, RateLimiter, get_qbo_client
+from utils.db_utils import get_postgres_client
+from utils.validation import validate_records, empty_report, merge_reports, VersionIndex
+from utils.backfill_runner import get_entity_config, resume_point
+from utils.backfill_windows import parse_utc, high_water_mark
+
+
+# Marca de fin de stream entre etapas
+_DONE = object()
+
+
+class StageMetrics:
+    """
+    Metricas de una etapa del pipeline
+
+    - busy_seconds: tiempo trabajando (request, validacion o upsert)
+    - wait_input_seconds: tiempo esperando entrada (etapa anterior lenta)
+    - wait_output_seconds: tiempo bloqueado por cola llena (etapa siguiente lenta)
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.wait_input_seconds = 0.0
+        self.wait_output_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, field: str, value: float):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 2),
+            'wait_input_seconds': round(self.wait_input_seconds, 2),
+            'wait_output_seconds': round(self.wait_output_seconds, 2)
+        }
+
+
+class BoundedQueue:
+    """
+    Cola acotada que mide su profundidad y el tiempo que cada etapa pasa
+    bloqueada en put/get; deja de bloquear cuando se detiene el pipeline
+    """
+
+    POLL_SECONDS = 0.5
+
+    def __init__(self, name: str, maxsize: int, stop_event: threading.Event):
+        self.name = name
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stop_event = stop_event
+        self._lock = threading.Lock()
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    def _sample_depth(self):
+        depth = self._queue.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._depth_samples += 1
+
+    def put(self, item, metrics: StageMetrics) -> bool:
+        """Encola un item; retorna False si el pipeline se detuvo"""
+        start = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=self.POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        else:
+            return False
+
+        metrics.add('wait_output_seconds', time.monotonic() - start)
+        self._sample_depth()
+        return True
+
+    def get(self, metrics: StageMetrics):
+        """Desencola un item, o _DONE si el pipeline se detuvo"""
+        start = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                item = self._queue.get(timeout=self.POLL_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        else:
+            return _DONE
+
+        metrics.add('wait_input_seconds', time.monotonic() - start)
+        self._sample_depth()
+        return item
+
+    def as_dict(self) -> Dict[str, Any]:
+        avg_depth = self._depth_total / self._depth_samples if self._depth_samples else 0
+        return {
+            'capacity': self.maxsize,
+            'max_depth': self.max_depth,
+            'avg_depth': round(avg_depth, 2)
+        }
+
+
+class ContiguousPages:
+    """
+    Registra las paginas cargadas (que llegan fuera de orden) y calcula la
+    ultima pagina contigua desde el inicio, que es la que se puede
+    persistir como checkpoint, junto con el mayor LastUpdatedTime hasta
+    esa pagina (fecha de reanudacion, ver resume_point)
+    """
+
+    def __init__(self, first_page: int, records_before: int = 0, resume_from=None):
+        self.last_contiguous = first_page - 1
+        self.records_loaded = records_before
+        self.resume_from: Optional[datetime] = parse_utc(resume_from) if resume_from else None
+        self._pending: Dict[int, Tuple[int, Optional[datetime]]] = {}
+
+    def mark(self, pages: List[Tuple[int, int, Optional[datetime]]]) -> bool:
+        """
+        Marca paginas cargadas (numero, registros leidos, mayor LastUpdatedTime)
+
+        Returns:
+            bool: True si avanzo la ultima pagina contigua
+        """
+        for page_number, count, high_water in pages:
+            self._pending[page_number] = (count, high_water)
+        advanced = False
+        while self.last_contiguous + 1 in self._pending:
+            self.last_contiguous += 1
+            count, high_water = self._pending.pop(self.last_contiguous)
+            self.records_loaded += count
+            if high_water is not None and (self.resume_from is None or high_water > self.resume_from):
+                self.resume_from = high_water
+            advanced = True
+        return advanced
+
+
+def run_pipeline(
+    entity_name: str,
+    window_start: str,
+    window_end: str,
+    fetchers: int = 3,
+    writers: int = 2,
+    queue_size: int = 8,
+    pages_per_batch: int = 1,
+    skip_unchanged: bool = False,
+    resume: bool = True,
+    auth=None,
+    rate_limiter: Optional[RateLimiter] = None
+) -> Dict[str, Any]:
+    """
+    Extrae, valida y carga un tramo con etapas concurrentes
+
+    Etapas:
+    - fetch: `fetchers` hilos descargan paginas en paralelo (QBOClient.fetch_page),
+      compartiendo autenticador y rate limit
+    - transform: un hilo valida y deduplica (validate_records) y arma lotes
+    - write: `writers` hilos, cada uno con su PostgresClient, ejecutan el UPSERT
+
+    Las colas entre etapas tienen capacidad `queue_size`, por lo que la
+    memoria en vuelo queda acotada a ~queue_size lotes por cola.
+
+    Args:
+        entity_name: invoices, customers o items
+        window_start: Inicio de ventana (ISO format UTC)
+        window_end: Fin de ventana (ISO format UTC)
+        fetchers: Hilos de descarga
+        writers: Hilos (conexiones) de carga
+        queue_size: Capacidad de cada cola (paginas o lotes)
+        pages_per_batch: Paginas por transaccion de carga
+        skip_unchanged: Omitir registros con el mismo SyncToken ya cargado
+        resume: Continuar desde el checkpoint del tramo
+        auth: Autenticador compartido (opcional)
+        rate_limiter: Rate limiter compartido (opcional)
+
+    Returns:
+        dict: Resumen del tramo con metricas por etapa y por cola
+    """
+    config = get_entity_config(entity_name)
+    auth = auth or get_qbo_authenticator()
+    rate_limiter = rate_limiter or RateLimiter(
+        QBOClient.RATE_LIMIT_REQUESTS, QBOClient.RATE_LIMIT_WINDOW
+    )
+
+    db = get_postgres_client()
+    start_time = datetime.now(timezone.utc)
+    log_id = db.log_backfill_start(entity_name, window_start, window_end)
+
+    start_page, records_before, resume_from = 1, 0, None
+    if resume:
+        start_page, records_before, resume_from = resume_point(
+            db, entity_name, window_start, window_end, QBOClient.PAGE_SIZE
+        )
+    # Al reanudar, la consulta arranca en la fecha del checkpoint y STARTPOSITION 1
+    query_start, first_page = (resume_from, start_page) if resume_from else (window_start, 1)
+
+    request_payload = {
+        'entity': config['qbo_entity'],
+        'window_start': window_start,
+        'window_end': window_end
+    }
+
+    stop_event = threading.Event()
+    errors: List[BaseException] = []
+    page_queue = BoundedQueue('pages', queue_size, stop_event)
+    write_queue = BoundedQueue('batches', queue_size, stop_event)
+    metrics = {
+        'fetch': StageMetrics('fetch', fetchers),
+        'transform': StageMetrics('transform', 1),
+        'write': StageMetrics('write', writers)
+    }
+
+    totals = {'records_read': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'pages': 0}
+    quality = empty_report()
+    totals_lock = threading.Lock()
+    pages = ContiguousPages(start_page, records_before, resume_from)
+    checkpoint_lock = threading.Lock()
+
+    # Paginas: cada fetcher toma el siguiente numero hasta conocer la ultima
+    page_state = {'next': start_page, 'last': None}
+    page_lock = threading.Lock()
+
+    def guarded(target):
+        """Ejecuta una etapa; ante un error detiene todo el pipeline"""
+        def run(*args):
+            try:
+                target(*args)
+            except BaseException as e:
+                errors.append(e)
+                stop_event.set()
+                print(f"[PIPELINE] Error en etapa: {str(e)}")
+        return run
+
+    def fetch_stage():
+        client = get_qbo_client(auth=auth, rate_limiter=rate_limiter)
+        stage = metrics['fetch']
+
+        while not stop_event.is_set():
+            with page_lock:
+                if page_state['last'] is not None and page_state['next'] > page_state['last']:
+                    return
+                page_number = page_state['next']
+                page_state['next'] += 1
+
+            started = time.monotonic()
+            records = client.fetch_page(
+                config['qbo_entity'], page_number,
+                query_start, window_end, 'MetaData.LastUpdatedTime', first_page
+            )
+            stage.add('busy_seconds', time.monotonic() - started)
+
+            # Pagina incompleta o vacia: no hay paginas posteriores
+            if len(records) < client.PAGE_SIZE:
+                last = page_number if records else page_number - 1
+                with page_lock:
+                    if page_state['last'] is None or last < page_state['last']:
+                        page_state['last'] = last
+
+            if not records:
+                continue
+
+            for item in records:
+                item['extract_window_start'] = window_start
+                item['extract_window_end'] = window_end
+            stage.add('items', 1)
+            if not page_queue.put((page_number, records), stage):
+                return
+
+    def transform_stage():
+        stage = metrics['transform']
+        versions = VersionIndex()
+        batch: List[Dict[str, Any]] = []
+        batch_pages: List[Tuple[int, int, Optional[datetime]]] = []
+
+        while True:
+            item = page_queue.get(stage)
+            if item is _DONE:
+                break
+
+            started = time.monotonic()
+            page_number, records = item
+            valid_records, report = validate_records(records, versions, entity_name=entity_name)
+            merge_reports(quality, report)
+            batch.extend(valid_records)
+            batch_pages.append((page_number, len(records), high_water_mark(records)))
+            stage.add('items', 1)
+            stage.add('busy_seconds', time.monotonic() - started)
+
+            if len(batch_pages) >= pages_per_batch:
+                if not write_queue.put((batch_pages, batch), stage):
+                    return
+                batch, batch_pages = [], []
+
+        if batch_pages and not stop_event.is_set():
+            write_queue.put((batch_pages, batch), stage)
+
+        for _ in range(writers):
+            write_queue.put(_DONE, stage)
+
+    def write_stage():
+        writer_db = get_postgres_client()
+        stage = metrics['write']
+
+        try:
+            while True:
+                item = write_queue.get(stage)
+                if item is _DONE:
+                    break
+
+                started = time.monotonic()
+                batch_pages, records = item
+                result = writer_db.upsert_records(
+                    table_name=config['table_name'],
+                    records=records,
+                    window_start=window_start,
+                    window_end=window_end,
+                    request_payload=request_payload,
+                    skip_unchanged=skip_unchanged
+                )
+
+                with totals_lock:
+                    totals['records_read'] += sum(count for _, count, _ in batch_pages)
+                    totals['pages'] += len(batch_pages)
+                    for key in ('inserted', 'updated', 'skipped'):
+                        totals[key] += result.get(key, 0)
+
+                # Checkpoint solo hasta la ultima pagina contigua confirmada
+                with checkpoint_lock:
+                    if pages.mark(batch_pages):
+                        writer_db.save_checkpoint(
+                            entity_name, window_start, window_end,
+                            last_page=pages.last_contiguous,
+                            page_size=QBOClient.PAGE_SIZE,
+                            records_loaded=pages.records_loaded,
+                            resume_from=pages.resume_from
+                        )
+
+                stage.add('items', 1)
+                stage.add('busy_seconds', time.monotonic() - started)
+        finally:
+            writer_db.close()
+
+    print("=" * 60)
+    print(f"PIPELINE CONCURRENTE - {entity_name.upper()}")
+    print(f"  Ventana: {window_start} -> {window_end}")
+    print(f"  Fetchers: {fetchers} | Writers: {writers} | Cola: {queue_size}")
+    print("=" * 60)
+
+    fetch_threads = [threading.Thread(target=guarded(fetch_stage), daemon=True) for _ in range(fetchers)]
+    transform_thread = threading.Thread(target=guarded(transform_stage), daemon=True)
+    write_threads = [threading.Thread(target=guarded(write_stage), daemon=True) for _ in range(writers)]
+
+    try:
+        for thread in fetch_threads + [transform_thread] + write_threads:
+            thread.start()
+
+        for thread in fetch_threads:
+            thread.join()
+        page_queue.put(_DONE, metrics['fetch'])
+
+        transform_thread.join()
+        for thread in write_threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        db.clear_checkpoint(entity_name, window_start, window_end)
+        db.prune_volumetry(config['table_name'])
+
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        db.log_backfill_complete(
+            log_id=log_id,
+            records_read=totals['records_read'],
+            records_inserted=totals['inserted'],
+            records_updated=totals['updated'],
+            pages_processed=totals['pages'],
+            duration_seconds=duration,
+            status='completed'
+        )
+
+    except BaseException as e:
+        stop_event.set()
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        db.log_backfill_complete(
+            log_id=log_id,
+            records_read=totals['records_read'],
+            records_inserted=totals['inserted'],
+            records_updated=totals['updated'],
+            pages_processed=totals['pages'],
+            duration_seconds=duration,
+            status='failed',
+            error_message=str(e)
+        )
+        print(f"[ERROR] Fallo en tramo {entity_name} {window_start} -> {window_end}: {str(e)}")
+        raise
+
+    finally:
+        db.close()
+
+    stages = {name: stage.as_dict() for name, stage in metrics.items()}
+    queues = {q.name: q.as_dict() for q in (page_queue, write_queue)}
+
+    print("\n" + "=" * 60)
+    print("METRICAS DEL PIPELINE")
+    print("=" * 60)
+    for name, stage in stages.items():
+        print(f"  {name:<10} items={stage['items']:<6} ocupado={stage['busy_seconds']:.1f}s "
+              f"espera_entrada={stage['wait_input_seconds']:.1f}s "
+              f"espera_salida={stage['wait_output_seconds']:.1f}s")
+    for name, stats in queues.items():
+        print(f"  cola {name:<6} capacidad={stats['capacity']} max={stats['max_depth']} "
+              f"promedio={stats['avg_depth']}")
+    print(f"  Insertados: {totals['inserted']} | Actualizados: {totals['updated']} | "
+          f"Duracion: {duration:.2f}s")
+    print("=" * 60)
+
+    return {
+        'status': 'completed',
+        'entity': entity_name,
+        'window_start': window_start,
+        'window_end': window_end,
+        'records_loaded': totals['records_read'],
+        'inserted': totals['inserted'],
+        'updated': totals['updated'],
+        'skipped': totals['skipped'],
+        'pages': totals['pages'],
+        'duration_seconds': duration,
+        'quality': quality,
+        'log_id': log_id,
+        'stages': stages,
+        'queues': queues
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline concurrente de backfill de QBO para un tramo')
+    parser.add_argument('--entidad', required=True, choices=['invoices', 'customers', 'items'])
+    parser.add_argument('--fecha-inicio', required=True, help='ISO 8601 UTC (ej: 2024-01-01T00:00:00Z)')
+    parser.add_argument('--fecha-fin', required=True, help='ISO 8601 UTC (ej: 2024-12-31T23:59:59Z)')
+    parser.add_argument('--fetchers', type=int, default=3)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--cola', type=int, default=8, help='Capacidad de cada cola')
+    parser.add_argument('--paginas-por-lote', type=int, default=1)
+    parser.add_argument('--omitir-sin-cambios', action='store_true')
+    args = parser.parse_args()
+
+    run_pipeline(
+        args.entidad,
+        args.fecha_inicio,
+        args.fecha_fin,
+        fetchers=args.fetchers,
+        writers=args.writers,
+        queue_size=args.cola,
+        pages_per_batch=args.paginas_por_lote,
+        skip_unchanged=args.omitir_sin_cambios
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ Maneja la obtencion y renovacion de Access Tokens
 import os
 import requests
 import base64
+import threading
 import time
 from datetime import datetime, timezone
 
@@ -39,6 +40,8 @@ class QBOAuthenticator:
 
         self.access_token = None
         self.token_expiry = None
+        # Evita renovaciones simultaneas si varios hilos comparten el autenticador
+        self._lock = threading.Lock()
 
     @property
     def api_base_url(self):
@@ -70,6 +73,11 @@ class QBOAuthenticator:
         Raises:
             Exception: Si falla la autenticacion
         """
+        with self._lock:
+            return self._get_access_token()
+
+    def _get_access_token(self):
+        """Obtiene o reutiliza el Access Token (llamar con el lock tomado)"""
         # Si el token actual es valido, reutilizarlo
         if self.access_token and self.token_expiry:
             if datetime.now(timezone.utc) < self.token_expiry:
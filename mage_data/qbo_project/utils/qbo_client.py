@@ -3,13 +3,48 @@ Cliente de API para QuickBooks Online
 Maneja paginacion, rate limits, reintentos y extraccion de datos
 """
 import requests
+import threading
 import time
+from collections import deque
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Any, Generator, Optional
 
 from utils.qbo_auth import get_qbo_authenticator
 
 
+class RateLimiter:
+    """
+    Rate limit por ventana deslizante, seguro entre hilos
+
+    Una misma instancia se comparte entre varios QBOClient para que todos
+    consuman un unico presupuesto de requests por minuto.
+    """
+
+    def __init__(self, max_requests: int, window_seconds: float):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self._timestamps = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloquea hasta que haya cupo en la ventana y registra la request"""
+        while True:
+            with self._lock:
+                now = time.time()
+                # Limpiar timestamps viejos (fuera de la ventana)
+                while self._timestamps and now - self._timestamps[0] >= self.window_seconds:
+                    self._timestamps.popleft()
+
+                if len(self._timestamps) < self.max_requests:
+                    self._timestamps.append(now)
+                    return
+
+                wait_time = self.window_seconds - (now - self._timestamps[0]) + 0.1
+
+            print(f"[RATE LIMIT] Esperando {wait_time:.1f}s para respetar limites...")
+            time.sleep(wait_time)
+
+
 class QBOClient:
     """
     Cliente para interactuar con la API de QuickBooks Online
@@ -26,10 +61,27 @@ class QBOClient:
     RATE_LIMIT_REQUESTS = 400
     RATE_LIMIT_WINDOW = 60  # segundos
 
-    def __init__(self):
-        """Inicializa el cliente con autenticador"""
-        self.auth = get_qbo_authenticator()
-        self.request_timestamps: List[float] = []
+    # Sin esta condicion QBO omite los registros inactivos de estas entidades.
+    # Se aplica a toda query de la entidad (extraccion, conteo, ids) para que
+    # lo extraido, lo contado y lo reconciliado sea el mismo conjunto.
+    ENTITY_CONDITIONS = {
+        'Customer': ['Active IN (true, false)'],
+        'Item': ['Active IN (true, false)'],
+    }
+
+    def __init__(self, auth=None, rate_limiter: Optional[RateLimiter] = None):
+        """
+        Inicializa el cliente con autenticador
+
+        Args:
+            auth: Autenticador compartido (por defecto uno nuevo)
+            rate_limiter: Rate limiter compartido entre clientes concurrentes
+                (por defecto uno propio con RATE_LIMIT_REQUESTS/minuto)
+        """
+        self.auth = auth or get_qbo_authenticator()
+        self.rate_limiter = rate_limiter or RateLimiter(
+            self.RATE_LIMIT_REQUESTS, self.RATE_LIMIT_WINDOW
+        )
         self.total_requests = 0
         self.total_retries = 0
 
@@ -41,24 +93,9 @@ class QBOClient:
     def _wait_for_rate_limit(self):
         """
         Espera si es necesario para respetar el rate limit
-        Implementa ventana deslizante
+        Implementa ventana deslizante (ver RateLimiter)
         """
-        now = time.time()
-        # Limpiar timestamps viejos (fuera de la ventana)
-        self.request_timestamps = [
-            ts for ts in self.request_timestamps
-            if now - ts < self.RATE_LIMIT_WINDOW
-        ]
-
-        if len(self.request_timestamps) >= self.RATE_LIMIT_REQUESTS:
-            # Calcular tiempo de espera
-            oldest = min(self.request_timestamps)
-            wait_time = self.RATE_LIMIT_WINDOW - (now - oldest) + 1
-            if wait_time > 0:
-                print(f"[RATE LIMIT] Esperando {wait_time:.1f}s para respetar limites...")
-                time.sleep(wait_time)
-
-        self.request_timestamps.append(time.time())
+        self.rate_limiter.acquire()
 
     def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
         """
@@ -144,70 +181,189 @@ class QBOClient:
         """
         return self._make_request('/query', params={'query': query_string})
 
-    def fetch_entity_paginated(
+    @staticmethod
+    def _where_clause(
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        date_field: str = 'MetaData.LastUpdatedTime',
+        conditions: Optional[List[str]] = None
+    ) -> str:
+        """Clausula WHERE con filtros de fecha (inclusivos) y condiciones extra"""
+        conditions = list(conditions or [])
+        if start_date:
+            conditions.append(f"{date_field} >= '{start_date}'")
+        if end_date:
+            conditions.append(f"{date_field} <= '{end_date}'")
+        return " WHERE " + " AND ".join(conditions) if conditions else ''
+
+    def build_query(
         self,
         entity: str,
+        start_position: int,
         start_date: Optional[str] = None,
         end_date: Optional[str] = None,
         date_field: str = 'MetaData.LastUpdatedTime'
-    ) -> Generator[Dict[str, Any], None, None]:
+    ) -> str:
         """
-        Extrae todos los registros de una entidad con paginacion
+        Construye la query de una pagina con filtros de fecha y paginacion
+
+        Ordena por date_field: asi las paginas ya cargadas quedan antes que
+        cualquier registro pendiente y un tramo se puede reanudar por fecha
+        (ver fetch_entity_pages) en lugar de por posicion.
+        """
+        query = f"SELECT * FROM {entity}" + self._where_clause(
+            start_date, end_date, date_field, self.ENTITY_CONDITIONS.get(entity)
+        )
+        return query + f" ORDERBY {date_field} STARTPOSITION {start_position} MAXRESULTS {self.PAGE_SIZE}"
+
+    def count(
+        self,
+        entity: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        date_field: str = 'MetaData.LastUpdatedTime',
+        conditions: Optional[List[str]] = None
+    ) -> int:
+        """
+        Cantidad de registros de una entidad (SELECT COUNT(*)), en una sola request
+
+        Usa los mismos filtros de fecha y ENTITY_CONDITIONS que build_query,
+        por lo que el conteo de una ventana es comparable con lo extraido
+        para esa ventana.
+        """
+        conditions = self.ENTITY_CONDITIONS.get(entity, []) + list(conditions or [])
+        query = f"SELECT COUNT(*) FROM {entity}" + self._where_clause(
+            start_date, end_date, date_field, conditions
+        )
+        response = self.query(query)
+        return response.get('QueryResponse', {}).get('totalCount', 0)
+
+    def fetch_page(
+        self,
+        entity: str,
+        page_number: int,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        date_field: str = 'MetaData.LastUpdatedTime',
+        first_page: int = 1
+    ) -> List[Dict[str, Any]]:
+        """
+        Extrae una pagina puntual (STARTPOSITION calculado por numero de pagina)
+
+        Permite descargar paginas de una misma ventana en paralelo.
+
+        Args:
+            first_page: Numero de la pagina en STARTPOSITION 1 (al reanudar
+                por fecha la numeracion continua la del checkpoint)
+
+        Returns:
+            list: Registros de la pagina con metadatos (vacia si no hay mas)
+        """
+        start_position = (page_number - first_page) * self.PAGE_SIZE + 1
+        query = self.build_query(entity, start_position, start_date, end_date, date_field)
+
+        print(f"\n[PAGE {page_number}] Ejecutando: {query[:100]}...")
+
+        response = self.query(query)
+
+        # Obtener los registros de la respuesta
+        query_response = response.get('QueryResponse', {})
+        records = query_response.get(entity, [])
+
+        # Cada registro con metadatos de pagina
+        return [
+            {
+                'record': record,
+                'page_number': page_number,
+                'page_size': self.PAGE_SIZE,
+                'position_in_page': position
+            }
+            for position, record in enumerate(records, start=1)
+        ]
+
+    def fetch_by_ids(self, entity: str, ids: List[str]) -> Generator[List[Dict[str, Any]], None, None]:
+        """
+        Extrae registros puntuales por Id (WHERE Id IN (...)), de a PAGE_SIZE ids
+
+        Sirve para completar referencias faltantes sin re-ejecutar el
+        backfill completo de la entidad.
+
+        Yields:
+            list: Registros encontrados de cada lote, con metadatos de pagina
+        """
+        for page_number, offset in enumerate(range(0, len(ids), self.PAGE_SIZE), start=1):
+            batch = ids[offset:offset + self.PAGE_SIZE]
+            id_list = ', '.join("'" + str(record_id).replace("'", "\\'") + "'" for record_id in batch)
+            conditions = [f"Id IN ({id_list})"] + self.ENTITY_CONDITIONS.get(entity, [])
+            query = (f"SELECT * FROM {entity}{self._where_clause(conditions=conditions)} "
+                     f"MAXRESULTS {self.PAGE_SIZE}")
+
+            print(f"\n[IDS {page_number}] Ejecutando: {query[:100]}...")
+            response = self.query(query)
+            records = response.get('QueryResponse', {}).get(entity, [])
+
+            yield [
+                {
+                    'record': record,
+                    'page_number': page_number,
+                    'page_size': self.PAGE_SIZE,
+                    'position_in_page': position
+                }
+                for position, record in enumerate(records, start=1)
+            ]
+
+    def fetch_entity_pages(
+        self,
+        entity: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        date_field: str = 'MetaData.LastUpdatedTime',
+        start_page: int = 1,
+        resume_from: Optional[str] = None
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        """
+        Extrae todos los registros de una entidad, pagina por pagina
 
         Args:
             entity: Nombre de la entidad (Invoice, Customer, Item)
             start_date: Fecha inicio ISO format (UTC)
             end_date: Fecha fin ISO format (UTC)
             date_field: Campo de fecha para filtrar
+            start_page: Primera pagina a extraer (para reanudar desde un checkpoint)
+            resume_from: Mayor date_field ya cargado (ver resume_point). La
+                consulta se rehace desde esa fecha (inclusive) y STARTPOSITION 1,
+                con la numeracion desde start_page: un registro modificado
+                despues de la caida que sale de la ventana no corre las
+                posiciones. Los registros con esa misma fecha se vuelven a
+                leer (el UPSERT es idempotente)
 
         Yields:
-            dict: Registro individual con metadatos de pagina
+            list: Registros de una pagina, cada uno con metadatos de pagina
         """
-        start_position = 1
-        page_number = 1
+        first_page = 1
+        if resume_from:
+            start_date, first_page = resume_from, start_page
+        start_position = (start_page - first_page) * self.PAGE_SIZE + 1
+        page_number = start_page
         total_fetched = 0
 
         print(f"\n[EXTRACT] Iniciando extraccion de {entity}")
         print(f"  Ventana: {start_date} -> {end_date}")
         print(f"  Tamano de pagina: {self.PAGE_SIZE}")
+        if resume_from:
+            print(f"  Reanudando desde pagina {start_page} ({date_field} >= {resume_from})")
+        elif start_page > 1:
+            print(f"  Reanudando desde pagina {start_page} (STARTPOSITION {start_position})")
 
         while True:
-            # Construir query con filtros y paginacion
-            query = f"SELECT * FROM {entity}"
-
-            # Agregar filtros de fecha si se proporcionan
-            conditions = []
-            if start_date:
-                conditions.append(f"{date_field} >= '{start_date}'")
-            if end_date:
-                conditions.append(f"{date_field} <= '{end_date}'")
-
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-
-            query += f" STARTPOSITION {start_position} MAXRESULTS {self.PAGE_SIZE}"
-
-            print(f"\n[PAGE {page_number}] Ejecutando: {query[:100]}...")
-
-            response = self.query(query)
-
-            # Obtener los registros de la respuesta
-            query_response = response.get('QueryResponse', {})
-            records = query_response.get(entity, [])
+            records = self.fetch_page(entity, page_number, start_date, end_date, date_field, first_page)
 
             if not records:
                 print(f"[PAGE {page_number}] No hay mas registros.")
                 break
 
-            # Yield cada registro con metadatos de pagina
-            for record in records:
-                yield {
-                    'record': record,
-                    'page_number': page_number,
-                    'page_size': self.PAGE_SIZE,
-                    'position_in_page': records.index(record) + 1
-                }
-                total_fetched += 1
+            yield records
+            total_fetched += len(records)
 
             print(f"[PAGE {page_number}] Obtenidos: {len(records)} registros. "
                   f"Total acumulado: {total_fetched}")
@@ -218,7 +374,6 @@ class QBOClient:
                 break
 
             # Avanzar a siguiente pagina
-            start_position += self.PAGE_SIZE
             page_number += 1
 
         print(f"\n[SUMMARY] Extraccion completada:")
@@ -227,12 +382,42 @@ class QBOClient:
         print(f"  Total requests: {self.total_requests}")
         print(f"  Total reintentos: {self.total_retries}")
 
+    def fetch_entity_paginated(
+        self,
+        entity: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        date_field: str = 'MetaData.LastUpdatedTime',
+        start_page: int = 1,
+        resume_from: Optional[str] = None
+    ) -> Generator[Dict[str, Any], None, None]:
+        """
+        Extrae todos los registros de una entidad con paginacion
+
+        Args:
+            entity: Nombre de la entidad (Invoice, Customer, Item)
+            start_date: Fecha inicio ISO format (UTC)
+            end_date: Fecha fin ISO format (UTC)
+            date_field: Campo de fecha para filtrar
+            start_page: Primera pagina a extraer (para reanudar desde un checkpoint)
+            resume_from: Fecha de reanudacion (ver fetch_entity_pages)
+
+        Yields:
+            dict: Registro individual con metadatos de pagina
+        """
+        for page in self.fetch_entity_pages(entity, start_date, end_date, date_field, start_page, resume_from):
+            yield from page
+
 
-def get_qbo_client():
+def get_qbo_client(auth=None, rate_limiter: Optional[RateLimiter] = None):
     """
     Factory function para obtener una instancia del cliente
 
+    Args:
+        auth: Autenticador compartido (opcional)
+        rate_limiter: Rate limiter compartido (opcional)
+
     Returns:
         QBOClient: Instancia configurada del cliente
     """
-    return QBOClient()
+    return QBOClient(auth=auth, rate_limiter=rate_limiter)
@@ -0,0 +1,244 @@
+"""
+Reconciliacion de borrados por Id/SyncToken entre QBO y raw.qb_*
+/query de QBO nunca devuelve registros borrados, asi que quedan en raw.qb_*
+para siempre. Este proceso trae solo Id y SyncToken de toda la entidad
+(consultas proyectadas, paginadas y concurrentes), los cruza en streaming
+contra los ids de Postgres ordenados y marca o elimina los que ya no existen.
+
+Uso (desde mage_data/qbo_project):
+    python -m utils.reconciliation --entidad invoices
+    python -m utils.reconciliation --entidad customers --modo borrar --workers 8
+    python -m utils.reconciliation --entidad items --modo reportar
+"""
+import argparse
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Tuple, Iterable, Iterator, Optional
+
+from utils.qbo_auth import get_qbo_authenticator
+from utils.qbo_client import QBOClient, RateLimiter, get_qbo_client
+from utils.db_utils import get_postgres_client, TYPED_COLUMNS
+from utils.backfill_runner import ENTITIES, get_entity_config
+from utils.reference_cache import queue_references
+
+
+# MAXRESULTS maximo que acepta QBO por consulta
+ID_PAGE_SIZE = 1000
+
+# Tope de borrados sobre el total local: protege ante una foto de QBO incompleta
+MAX_DELETE_RATIO = 0.2
+
+# reportar: solo cuenta; marcar: deleted_at_utc; borrar: elimina las filas
+MODES = ('reportar', 'marcar', 'borrar')
+
+
+def fetch_remote_versions(
+    entity_name: str,
+    workers: int = 4,
+    auth=None,
+    rate_limiter: Optional[RateLimiter] = None
+) -> List[Tuple[str, Optional[int]]]:
+    """
+    Foto completa (Id, SyncToken) de una entidad en QBO, ordenada por Id
+
+    Pide primero COUNT(*) para conocer el numero de paginas y luego las
+    descarga en paralelo (SELECT Id, SyncToken ... MAXRESULTS 1000), con
+    auth y rate limiter compartidos entre hilos.
+
+    Raises:
+        RuntimeError: Si la foto tiene menos ids que el COUNT(*) inicial
+            (paginas desplazadas por cambios durante la lectura)
+    """
+    entity = get_entity_config(entity_name)['qbo_entity']
+    # Mismas condiciones que la extraccion y el conteo (inactivos incluidos)
+    where = QBOClient._where_clause(conditions=QBOClient.ENTITY_CONDITIONS.get(entity))
+    auth = auth or get_qbo_authenticator()
+    rate_limiter = rate_limiter or RateLimiter(
+        QBOClient.RATE_LIMIT_REQUESTS, QBOClient.RATE_LIMIT_WINDOW
+    )
+
+    client = get_qbo_client(auth=auth, rate_limiter=rate_limiter)
+    total = client.count(entity)
+    pages = math.ceil(total / ID_PAGE_SIZE)
+    print(f"[RECONCILE] {entity}: {total} registros en QBO, {pages} consultas de ids")
+
+    def fetch(page_number: int) -> List[Tuple[str, Optional[int]]]:
+        page_client = get_qbo_client(auth=auth, rate_limiter=rate_limiter)
+        start_position = (page_number - 1) * ID_PAGE_SIZE + 1
+        response = page_client.query(
+            f"SELECT Id, SyncToken FROM {entity}{where} ORDERBY Id "
+            f"STARTPOSITION {start_position} MAXRESULTS {ID_PAGE_SIZE}"
+        )
+        return [
+            (str(record['Id']), TYPED_COLUMNS['sync_token'](record))
+            for record in response.get('QueryResponse', {}).get(entity, [])
+        ]
+
+    versions: Dict[str, Optional[int]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for page in executor.map(fetch, range(1, pages + 1)):
+            versions.update(page)
+
+    if len(versions) < total:
+        raise RuntimeError(
+            f"Foto incompleta de {entity}: {len(versions)} ids de {total}; "
+            f"re-ejecutar la reconciliacion"
+        )
+    return sorted(versions.items())
+
+
+def merge_versions(
+    remote: Iterable[Tuple[str, Optional[int]]],
+    local: Iterable[Tuple[str, Optional[int], bool]]
+) -> Iterator[Tuple[str, str]]:
+    """
+    Merge en streaming de dos secuencias ordenadas por id
+
+    Args:
+        remote: (id, sync_token) de QBO
+        local: (id, sync_token, marcado_borrado) de Postgres
+
+    Yields:
+        tuple: (accion, id) con accion:
+            deleted  - en Postgres pero no en QBO
+            missing  - en QBO pero no en Postgres
+            stale    - SyncToken de QBO mayor al cargado
+            restored - marcado como borrado pero existe en QBO
+    """
+    remote_iter = iter(remote)
+    current = next(remote_iter, None)
+
+    for local_id, local_token, marked in local:
+        while current is not None and current[0] < local_id:
+            yield 'missing', current[0]
+            current = next(remote_iter, None)
+
+        if current is not None and current[0] == local_id:
+            if marked:
+                yield 'restored', local_id
+            remote_token = current[1]
+            if remote_token is not None and (local_token is None or remote_token > local_token):
+                yield 'stale', local_id
+            current = next(remote_iter, None)
+        elif not marked:
+            yield 'deleted', local_id
+
+    while current is not None:
+        yield 'missing', current[0]
+        current = next(remote_iter, None)
+
+
+def reconcile_entity(
+    entity_name: str,
+    mode: str = 'marcar',
+    workers: int = 4,
+    max_delete_ratio: float = MAX_DELETE_RATIO,
+    queue_missing: bool = True,
+    db=None
+) -> Dict[str, Any]:
+    """
+    Reconcilia una entidad completa contra QBO
+
+    Args:
+        mode: reportar, marcar (deleted_at_utc) o borrar (elimina filas,
+            filas hijas, y ajusta contador y volumetria)
+        workers: Consultas de ids concurrentes contra QBO
+        max_delete_ratio: Aborta si los borrados superan esta fraccion del
+            total local (salvo en modo reportar)
+        queue_missing: Encola los ids faltantes o desactualizados en
+            raw.pending_references para un fetch puntual
+
+    Returns:
+        dict: Resumen con conteos por accion
+    """
+    if mode not in MODES:
+        raise ValueError(f"Modo invalido: {mode}. Opciones: {', '.join(MODES)}")
+
+    table_name = get_entity_config(entity_name)['table_name']
+    owns_db = db is None
+    db = db or get_postgres_client()
+    started = datetime.now(timezone.utc)
+
+    try:
+        remote = fetch_remote_versions(entity_name, workers=workers)
+
+        # Filas cargadas desde el inicio quedan fuera: son posteriores a la foto
+        local_rows = {'count': 0}
+
+        def counted(rows):
+            for row in rows:
+                local_rows['count'] += 1
+                yield row
+
+        found: Dict[str, List[str]] = {action: [] for action in ('deleted', 'missing', 'stale', 'restored')}
+        for action, record_id in merge_versions(remote, counted(db.iter_versions(table_name, started))):
+            found[action].append(record_id)
+
+        summary = {
+            'entity': entity_name,
+            'mode': mode,
+            'remote': len(remote),
+            'local': local_rows['count'],
+            **{action: len(ids) for action, ids in found.items()},
+            'applied': 0
+        }
+
+        print(f"[RECONCILE] {table_name}: {summary['remote']} en QBO, {summary['local']} en Postgres")
+        print(f"  Borrados en QBO:       {summary['deleted']} (ej: {found['deleted'][:5]})")
+        print(f"  Faltantes en Postgres: {summary['missing']}")
+        print(f"  Desactualizados:       {summary['stale']}")
+        print(f"  Restaurados:           {summary['restored']}")
+
+        if mode == 'reportar':
+            return summary
+
+        if local_rows['count'] and len(found['deleted']) / local_rows['count'] > max_delete_ratio:
+            raise RuntimeError(
+                f"{len(found['deleted'])} borrados de {local_rows['count']} superan el tope "
+                f"({max_delete_ratio:.0%}); revisar la foto o usar --max-borrado"
+            )
+
+        if mode == 'marcar':
+            summary['applied'] = db.mark_deleted(table_name, found['deleted'])
+        else:
+            summary['applied'] = db.delete_records(table_name, found['deleted'])
+        db.mark_deleted(table_name, found['restored'], deleted=False)
+
+        if queue_missing:
+            queue_references(
+                db, {entity_name: set(found['missing']) | set(found['stale'])},
+                referenced_by='reconciliation'
+            )
+
+        print(f"[RECONCILE] {summary['applied']} registros "
+              f"{'marcados' if mode == 'marcar' else 'eliminados'} en {table_name}")
+        return summary
+
+    finally:
+        if owns_db:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconciliacion de borrados QBO vs raw.qb_*')
+    parser.add_argument('--entidad', required=True, choices=list(ENTITIES))
+    parser.add_argument('--modo', default='marcar', choices=MODES)
+    parser.add_argument('--workers', type=int, default=4, help='Consultas de ids concurrentes')
+    parser.add_argument('--max-borrado', type=float, default=MAX_DELETE_RATIO,
+                        help='Fraccion maxima de borrados sobre el total local')
+    parser.add_argument('--sin-encolar', action='store_true',
+                        help='No encolar faltantes/desactualizados para fetch puntual')
+    args = parser.parse_args()
+
+    reconcile_entity(
+        args.entidad,
+        mode=args.modo,
+        workers=args.workers,
+        max_delete_ratio=args.max_borrado,
+        queue_missing=not args.sin_encolar
+    )
+
+
+if __name__ == '__main__':
+    main()
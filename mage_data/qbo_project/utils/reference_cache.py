@@ -0,0 +1,225 @@
+"""
+Cache de integridad referencial entre entidades (invoices -> customers, items)
+Pre-carga los ids ya cargados para que las reglas References de la
+validacion resuelvan cada referencia en O(1); los ids no encontrados se
+encolan en raw.pending_references y se buscan puntualmente en QBO.
+
+Uso (desde mage_data/qbo_project):
+    python -m utils.reference_cache resolver
+    python -m utils.reference_cache resolver --entidad customers --limite 500
+    python -m utils.reference_cache resolver --entidad invoices   (faltantes de la reconciliacion)
+"""
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Set, Iterable
+
+from psycopg2.extras import execute_values
+
+from utils.qbo_client import get_qbo_client
+from utils.db_utils import get_postgres_client
+from utils.backfill_runner import ENTITIES, get_entity_config
+
+
+# Entidades que otras referencian (CustomerRef, ItemRef)
+REFERENCED_ENTITIES = ('customers', 'items')
+
+# Busquedas sin encontrar el id antes de dejar de reintentarlo
+MAX_RESOLVE_ATTEMPTS = 3
+
+
+class ReferenceCache:
+    """
+    Sets de ids cargados por entidad referenciada
+
+    references() se pasa tal cual a validate_records / filter_artifact;
+    unresolved() extrae del reporte los ids que no estaban en el cache.
+    """
+
+    def __init__(self, ids: Optional[Dict[str, Set[str]]] = None):
+        self._ids: Dict[str, Set[str]] = {
+            entity_name: set(entity_ids) for entity_name, entity_ids in (ids or {}).items()
+        }
+
+    @classmethod
+    def load(cls, db, referenced: Dict[str, Set[str]]) -> 'ReferenceCache':
+        """
+        Pre-carga cuales de los ids referenciados ya estan en raw.qb_customers / raw.qb_items
+
+        Args:
+            referenced: Ids referenciados por entidad (ver validation.referenced_ids);
+                solo se consultan esos, no la tabla completa
+        """
+        cache = cls()
+        for entity_name in REFERENCED_ENTITIES:
+            ids = referenced.get(entity_name, set())
+            table_name = get_entity_config(entity_name)['table_name']
+            cache._ids[entity_name] = db.existing_ids(table_name, ids)
+            print(f"[REFS] {len(cache._ids[entity_name])} de {len(ids)} ids de {entity_name} ya cargados")
+        return cache
+
+    def references(self) -> Dict[str, Set[str]]:
+        return self._ids
+
+    def add(self, entity_name: str, ids: Iterable[str]):
+        """Agrega ids resueltos (ej: tras un fetch puntual)"""
+        self._ids.setdefault(entity_name, set()).update(ids)
+
+    def unresolved(self, report: Dict[str, Any]) -> Dict[str, Set[str]]:
+        """Ids referenciados que no estan en el cache, por entidad, segun el reporte"""
+        missing: Dict[str, Set[str]] = {}
+        for stats in report['rules'].values():
+            if stats.get('missing'):
+                known_ids = self._ids.get(stats['entity'], set())
+                missing.setdefault(stats['entity'], set()).update(
+                    ref_id for ref_id in stats['missing'] if ref_id not in known_ids
+                )
+        return {entity_name: ids for entity_name, ids in missing.items() if ids}
+
+
+def queue_references(db, missing: Dict[str, Set[str]], referenced_by: str) -> int:
+    """
+    Encola ids faltantes en raw.pending_references (los ya encolados se refrescan)
+
+    Returns:
+        int: Cantidad de ids encolados o refrescados
+    """
+    rows = [
+        (entity_name, str(ref_id), referenced_by)
+        for entity_name, ids in missing.items()
+        for ref_id in ids
+    ]
+    if not rows:
+        return 0
+
+    conn = db.connect()
+    cursor = conn.cursor()
+    execute_values(
+        cursor,
+        """
+        INSERT INTO raw.pending_references (entity_name, ref_id, referenced_by)
+        VALUES %s
+        ON CONFLICT (entity_name, ref_id) DO UPDATE SET last_seen_utc = NOW()
+        """,
+        rows
+    )
+    conn.commit()
+    cursor.close()
+
+    for entity_name, ids in missing.items():
+        print(f"[REFS] {len(ids)} ids de {entity_name} encolados para fetch puntual")
+    return len(rows)
+
+
+def resolve_pending(
+    entity_name: str,
+    client=None,
+    db=None,
+    limit: int = 1000
+) -> Dict[str, Any]:
+    """
+    Busca en QBO los ids pendientes de una entidad y los carga con upsert
+
+    Los encontrados salen de la cola; los no encontrados (ej: borrados en
+    QBO) suman un intento y dejan de buscarse tras MAX_RESOLVE_ATTEMPTS.
+
+    Returns:
+        dict: Resumen (pendientes, encontrados, insertados, actualizados)
+    """
+    config = get_entity_config(entity_name)
+    client = client or get_qbo_client()
+    owns_db = db is None
+    db = db or get_postgres_client()
+
+    try:
+        conn = db.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT ref_id FROM raw.pending_references
+            WHERE entity_name = %s AND attempts < %s
+            ORDER BY first_seen_utc
+            LIMIT %s
+            """,
+            (entity_name, MAX_RESOLVE_ATTEMPTS, limit)
+        )
+        pending = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+
+        summary = {'entity': entity_name, 'pending': len(pending), 'found': 0,
+                   'inserted': 0, 'updated': 0}
+        if not pending:
+            print(f"[REFS] Sin ids pendientes de {entity_name}")
+            return summary
+
+        request_payload = {
+            'entity': config['qbo_entity'],
+            'mode': 'reference',
+            'requested_at': datetime.now(timezone.utc).isoformat()
+        }
+        found: Set[str] = set()
+        for page in client.fetch_by_ids(config['qbo_entity'], pending):
+            if not page:
+                continue
+            result = db.upsert_records(
+                table_name=config['table_name'],
+                records=page,
+                window_start=None,
+                window_end=None,
+                request_payload=request_payload
+            )
+            summary['inserted'] += result['inserted']
+            summary['updated'] += result['updated']
+            found.update(str(item['record'].get('Id')) for item in page)
+
+        not_found = [ref_id for ref_id in pending if ref_id not in found]
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM raw.pending_references WHERE entity_name = %s AND ref_id = ANY(%s)",
+            (entity_name, list(found))
+        )
+        cursor.execute(
+            """
+            UPDATE raw.pending_references
+            SET attempts = attempts + 1, last_attempt_utc = NOW()
+            WHERE entity_name = %s AND ref_id = ANY(%s)
+            """,
+            (entity_name, not_found)
+        )
+        conn.commit()
+        cursor.close()
+
+        summary['found'] = len(found)
+        print(f"[REFS] {entity_name}: {len(found)}/{len(pending)} ids encontrados y cargados")
+        if not_found:
+            print(f"[WARN] {len(not_found)} ids de {entity_name} no existen en QBO "
+                  f"(ej: {not_found[:5]})")
+        return summary
+
+    finally:
+        if owns_db:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resuelve referencias pendientes con fetch puntual')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    resolver = subparsers.add_parser('resolver', help='Busca y carga los ids pendientes')
+    resolver.add_argument('--entidad', choices=list(ENTITIES),
+                          help='Entidad a resolver (por defecto customers e items)')
+    resolver.add_argument('--limite', type=int, default=1000, help='Ids por ejecucion y entidad')
+
+    args = parser.parse_args()
+
+    client = get_qbo_client()
+    db = get_postgres_client()
+    try:
+        for entity_name in ([args.entidad] if args.entidad else REFERENCED_ENTITIES):
+            resolve_pending(entity_name, client=client, db=db, limit=args.limite)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
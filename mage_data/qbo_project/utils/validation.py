@@ -0,0 +1,529 @@
+"""
+Motor de validacion declarativo para registros extraidos de QBO
+Cada entidad declara sus reglas (campos requeridos, tipos, rangos,
+referencias); se evaluan por lote, campo por campo, con conteos por regla
+"""
+from collections import deque
+from concurrent.futures import Executor
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, Iterable, Iterator
+
+from utils.backfill_windows import parse_utc
+
+
+def _field_getter(path: str) -> Callable[[Dict[str, Any]], Any]:
+    """
+    Compila un campo con notacion de punto (ej: CustomerRef.value) a un getter
+
+    Un segmento terminado en [] recorre una lista y el getter retorna la
+    lista de valores no nulos (ej: Line[].SalesItemLineDetail.ItemRef.value).
+    """
+    keys = path.split('.')
+    for position, key in enumerate(keys):
+        if key.endswith('[]'):
+            head = _field_getter('.'.join(keys[:position] + [key[:-2]]))
+            rest = keys[position + 1:]
+            tail = _field_getter('.'.join(rest)) if rest else None
+
+            def get_each(record: Dict[str, Any]) -> List[Any]:
+                items = head(record)
+                if not isinstance(items, list):
+                    return []
+                if tail is not None:
+                    items = [tail(item) for item in items if isinstance(item, dict)]
+                return [value for value in items if value is not None]
+
+            return get_each
+
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda record: record.get(key)
+
+    def get(record: Dict[str, Any]) -> Any:
+        value = record
+        for key in keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    return get
+
+
+def pack_version(sync_token: Optional[int], last_updated: Optional[datetime]) -> int:
+    """
+    Version comparable de un registro en un solo entero
+
+    Ordena por SyncToken y, a igual token, por LastUpdatedTime (segundos
+    epoch en los 34 bits bajos). Valores ausentes cuentan como 0.
+    """
+    token = sync_token if sync_token is not None and sync_token >= 0 else 0
+    seconds = int(last_updated.timestamp()) if last_updated is not None else 0
+    return (token << 34) | seconds
+
+
+def record_version(record: Dict[str, Any]) -> int:
+    """Version (SyncToken, LastUpdatedTime) de un payload de QBO"""
+    try:
+        token = int(record.get('SyncToken'))
+    except (TypeError, ValueError):
+        token = None
+    last_updated = (record.get('MetaData') or {}).get('LastUpdatedTime')
+    return pack_version(token, parse_utc(last_updated) if last_updated else None)
+
+
+class VersionIndex:
+    """
+    Indice hash id -> version mas reciente vista en la ventana
+
+    Guarda un solo entero por id (ver pack_version) para que el indice
+    de una ventana de millones de registros quede en un dict compacto.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def __contains__(self, record_id) -> bool:
+        return record_id in self._versions
+
+    def offer(self, record_id, version: int) -> Optional[bool]:
+        """
+        Registra una copia del id
+
+        Returns:
+            None si es la primera copia, True si es mas nueva que la
+            registrada (la reemplaza) y False si es igual o anterior
+        """
+        current = self._versions.get(record_id)
+        if current is None:
+            self._versions[record_id] = version
+            return None
+        if version > current:
+            self._versions[record_id] = version
+            return True
+        return False
+
+
+class Rule:
+    """
+    Regla sobre un campo del payload
+
+    severity 'error' excluye el registro de la carga; 'warn' solo se reporta.
+    """
+
+    kind = 'rule'
+
+    def __init__(self, field: str, severity: str = 'error'):
+        self.field = field
+        self.severity = severity
+        self.name = f"{self.kind}:{field}"
+        self._get = _field_getter(field)
+
+    def check(self, values: List[Any], references: Dict[str, Set[str]]) -> Optional[List[bool]]:
+        """Evalua la regla sobre la columna; None si no se puede evaluar"""
+        raise NotImplementedError
+
+    def failures(self, records: List[Dict[str, Any]], references: Dict[str, Set[str]]) -> Optional[List[int]]:
+        """Indices de los registros que no cumplen la regla"""
+        values = [self._get(record) for record in records]
+        passed = self.check(values, references)
+        if passed is None:
+            return None
+        return [i for i, ok in enumerate(passed) if not ok]
+
+    def details(
+        self,
+        records: List[Dict[str, Any]],
+        failed: List[int],
+        references: Dict[str, Set[str]]
+    ) -> Dict[str, Any]:
+        """Datos extra para el reporte de la regla (se combinan en merge_reports)"""
+        return {}
+
+
+class Required(Rule):
+    """Campo presente, no nulo y no vacio"""
+
+    kind = 'required'
+
+    def check(self, values, references):
+        return [value is not None and value != '' for value in values]
+
+
+class IsType(Rule):
+    """Campo del tipo indicado (los nulos se aceptan; usar Required para exigirlos)"""
+
+    kind = 'type'
+
+    def __init__(self, field: str, types: Tuple[type, ...], severity: str = 'error'):
+        super().__init__(field, severity)
+        self.types = types
+
+    def check(self, values, references):
+        types = self.types
+        return [value is None or isinstance(value, types) for value in values]
+
+
+class InRange(Rule):
+    """Campo numerico dentro de [minimum, maximum] (los nulos se aceptan)"""
+
+    kind = 'range'
+
+    def __init__(
+        self,
+        field: str,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+        severity: str = 'error'
+    ):
+        super().__init__(field, severity)
+        self.minimum = float('-inf') if minimum is None else minimum
+        self.maximum = float('inf') if maximum is None else maximum
+
+    def check(self, values, references):
+        low, high = self.minimum, self.maximum
+        return [
+            value is None or (isinstance(value, (int, float)) and low <= value <= high)
+            for value in values
+        ]
+
+
+class OneOf(Rule):
+    """Campo con un valor del conjunto permitido (los nulos se aceptan)"""
+
+    kind = 'one_of'
+
+    def __init__(self, field: str, allowed: Iterable[Any], severity: str = 'error'):
+        super().__init__(field, severity)
+        self.allowed = frozenset(allowed)
+
+    def check(self, values, references):
+        allowed = self.allowed
+        return [value is None or value in allowed for value in values]
+
+
+class References(Rule):
+    """
+    Campo que referencia un id de otra entidad (ej: CustomerRef.value -> customers)
+
+    Solo se evalua si se provee el conjunto de ids de la entidad referenciada.
+    Con un campo lista (Line[]...) falla si alguno de los ids no existe; los
+    ids faltantes quedan en el reporte ('missing') para resolverlos despues.
+    """
+
+    kind = 'reference'
+
+    def __init__(self, field: str, entity_name: str, severity: str = 'warn'):
+        super().__init__(field, severity)
+        self.entity_name = entity_name
+        self.name = f"{self.kind}:{field}->{entity_name}"
+
+    def check(self, values, references):
+        known_ids = references.get(self.entity_name)
+        if known_ids is None:
+            return None
+        return [
+            all(v in known_ids for v in value) if isinstance(value, list)
+            else value is None or value in known_ids
+            for value in values
+        ]
+
+    def details(self, records, failed, references):
+        """Ids referenciados que no estan en el conjunto conocido"""
+        known_ids = references[self.entity_name]
+        missing = set()
+        for i in failed:
+            value = self._get(records[i])
+            for v in (value if isinstance(value, list) else [value]):
+                if v is not None and v not in known_ids:
+                    missing.add(v)
+        return {'entity': self.entity_name, 'missing': missing}
+
+
+# Reglas comunes: el Id es obligatorio (es la PK de raw.qb_*)
+BASE_RULES: List[Rule] = [
+    Required('Id'),
+    Required('SyncToken', severity='warn'),
+    Required('MetaData.LastUpdatedTime', severity='warn'),
+]
+
+# Reglas declaradas por entidad. Solo las de severidad 'error' excluyen
+# registros; el resto alimenta las metricas de calidad.
+ENTITY_RULES: Dict[str, List[Rule]] = {
+    'invoices': BASE_RULES + [
+        Required('TxnDate', severity='warn'),
+        Required('CustomerRef.value', severity='warn'),
+        IsType('TotalAmt', (int, float), severity='warn'),
+        InRange('Balance', minimum=0, severity='warn'),
+        References('CustomerRef.value', 'customers', severity='warn'),
+        References('Line[].SalesItemLineDetail.ItemRef.value', 'items', severity='warn'),
+    ],
+    'customers': BASE_RULES + [
+        Required('DisplayName', severity='warn'),
+        IsType('Active', (bool,), severity='warn'),
+        IsType('Balance', (int, float), severity='warn'),
+    ],
+    'items': BASE_RULES + [
+        Required('Name', severity='warn'),
+        OneOf('Type', ('Inventory', 'NonInventory', 'Service', 'Group', 'Category'), severity='warn'),
+        IsType('UnitPrice', (int, float), severity='warn'),
+        InRange('UnitPrice', minimum=0, severity='warn'),
+    ],
+}
+
+
+def referenced_ids(data: Iterable[Dict[str, Any]], entity_name: str) -> Dict[str, Set[str]]:
+    """
+    Ids que referencian los items extraidos, por entidad referenciada
+
+    Recorre los campos de las reglas References de la entidad (ej:
+    CustomerRef.value -> customers) para consultar solo esos ids.
+    """
+    rules = [rule for rule in ENTITY_RULES.get(entity_name, []) if isinstance(rule, References)]
+    ids: Dict[str, Set[str]] = {rule.entity_name: set() for rule in rules}
+    for item in data:
+        record = item.get('record') or {}
+        for rule in rules:
+            value = rule._get(record)
+            for v in (value if isinstance(value, list) else [value]):
+                if v is not None:
+                    ids[rule.entity_name].add(v)
+    return ids
+
+
+def empty_report() -> Dict[str, Any]:
+    """Reporte de calidad vacio (para acumular lotes con merge_reports)"""
+    return {
+        'received': 0, 'valid': 0, 'invalid': 0,
+        'duplicates': 0, 'superseded': 0, 'rules': {}
+    }
+
+
+def merge_reports(total: Dict[str, Any], report: Dict[str, Any]) -> Dict[str, Any]:
+    """Acumula el reporte de un lote sobre total (in place)"""
+    for key in ('received', 'valid', 'invalid', 'duplicates', 'superseded'):
+        total[key] += report[key]
+    for name, stats in report['rules'].items():
+        current = total['rules'].setdefault(
+            name, {'severity': stats['severity'], 'failures': 0, 'samples': []}
+        )
+        current['failures'] += stats['failures']
+        current['samples'] = (current['samples'] + stats['samples'])[:5]
+        if 'missing' in stats:
+            current['entity'] = stats['entity']
+            current['missing'] = current.get('missing', set()) | stats['missing']
+    return total
+
+
+def collapse_versions(
+    candidates: Iterable[Tuple[int, Any, int]],
+    versions: VersionIndex,
+    report: Dict[str, Any]
+) -> List[int]:
+    """
+    Colapsa las copias de un mismo Id conservando la version mas reciente
+
+    Args:
+        candidates: Tuplas (indice, id, version) de registros validos, en orden
+        versions: Versiones vistas en lotes previos; se actualiza
+        report: Reporte del lote (suma duplicates, superseded y valid)
+
+    Returns:
+        list: Indices elegidos, en orden
+    """
+    # Id -> indice de la copia elegida dentro de este lote
+    chosen: Dict[Any, int] = {}
+    for index, record_id, version in candidates:
+        outcome = versions.offer(record_id, version)
+        if outcome is None:
+            chosen[record_id] = index
+            continue
+
+        report['duplicates'] += 1
+        if outcome:
+            # Copia mas nueva: reemplaza la del lote o, si la anterior
+            # ya se entrego en un lote previo, se vuelve a emitir
+            if record_id not in chosen:
+                report['superseded'] += 1
+            chosen[record_id] = index
+
+    keep = sorted(chosen.values())
+    report['valid'] = len(keep)
+    return keep
+
+
+def mark_transformed(data: List[Dict[str, Any]], keep: List[int]) -> List[Dict[str, Any]]:
+    """Items elegidos con transformed_at_utc (un solo timestamp por lote)"""
+    transform_time = datetime.now(timezone.utc).isoformat()
+    valid_records = []
+    for index in keep:
+        item = data[index]
+        item['transformed_at_utc'] = transform_time
+        valid_records.append(item)
+    return valid_records
+
+
+class ValidationEngine:
+    """
+    Evalua las reglas de una entidad sobre lotes de registros
+
+    Cada regla se aplica a la columna completa del lote (una list
+    comprehension por regla, sin logica por registro en el loop principal);
+    luego se descartan los registros con errores y se colapsan las copias
+    de un mismo Id, conservando la de mayor SyncToken/LastUpdatedTime.
+    """
+
+    def __init__(self, rules: List[Rule], references: Optional[Dict[str, Set[str]]] = None):
+        self.rules = rules
+        self.references = references or {}
+
+    def apply_rules(self, records: List[Dict[str, Any]]) -> Tuple[List[int], Dict[str, Any]]:
+        """
+        Evalua las reglas sobre un lote de payloads (sin deduplicar)
+
+        Returns:
+            tuple: (indices que pasan las reglas 'error', reporte del lote)
+        """
+        report = empty_report()
+        report['received'] = len(records)
+        rejected: Set[int] = set()
+
+        for rule in self.rules:
+            failed = rule.failures(records, self.references)
+            if failed is None:
+                continue
+            report['rules'][rule.name] = {
+                'severity': rule.severity,
+                'failures': len(failed),
+                'samples': [records[i].get('Id') for i in failed[:5]],
+                **rule.details(records, failed, self.references)
+            }
+            if rule.severity == 'error':
+                rejected.update(failed)
+
+        report['invalid'] = len(rejected)
+        return [i for i in range(len(records)) if i not in rejected], report
+
+    def evaluate(
+        self,
+        records: List[Dict[str, Any]],
+        versions: Optional[VersionIndex] = None
+    ) -> Tuple[List[int], Dict[str, Any]]:
+        """
+        Evalua un lote de payloads
+
+        Args:
+            records: Payloads de QBO (el campo 'record' de cada item)
+            versions: Versiones ya vistas en lotes previos de la ventana;
+                se actualiza con las de este lote
+
+        Returns:
+            tuple: (indices de registros validos en orden, reporte del lote)
+        """
+        passed, report = self.apply_rules(records)
+        keep = collapse_versions(
+            ((i, records[i].get('Id'), record_version(records[i])) for i in passed),
+            versions if versions is not None else VersionIndex(),
+            report
+        )
+        return keep, report
+
+    def validate(
+        self,
+        data: List[Dict[str, Any]],
+        versions: Optional[VersionIndex] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Valida items extraidos ({'record': ..., metadatos}) y marca transformed_at_utc"""
+        keep, report = self.evaluate([item.get('record') or {} for item in data], versions)
+        return mark_transformed(data, keep), report
+
+
+def get_validation_engine(
+    entity_name: Optional[str] = None,
+    references: Optional[Dict[str, Set[str]]] = None
+) -> ValidationEngine:
+    """Motor con las reglas de la entidad (o las reglas comunes si no se indica)"""
+    return ValidationEngine(ENTITY_RULES.get(entity_name, BASE_RULES), references)
+
+
+def validate_records(
+    data: List[Dict[str, Any]],
+    versions: Optional[VersionIndex] = None,
+    entity_name: Optional[str] = None,
+    references: Optional[Dict[str, Set[str]]] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Valida un lote de registros extraidos con las reglas de la entidad
+
+    Args:
+        data: Lista de registros con 'record' y metadatos de pagina
+        versions: Versiones vistas en lotes anteriores de la misma ventana;
+            se actualiza con las de este lote
+        entity_name: invoices, customers o items (define las reglas)
+        references: Ids conocidos por entidad para reglas References
+
+    Returns:
+        tuple: (registros validos, reporte de calidad con conteos por regla)
+    """
+    return get_validation_engine(entity_name, references).validate(data, versions)
+
+
+# Motor del proceso actual del pool (ver init_worker)
+_worker_engine: Optional[ValidationEngine] = None
+
+
+def init_worker(entity_name: Optional[str], references: Optional[Dict[str, Set[str]]] = None):
+    """Initializer del pool: arma el motor una vez por proceso, no por chunk"""
+    global _worker_engine
+    _worker_engine = get_validation_engine(entity_name, references)
+
+
+def worker_engine() -> ValidationEngine:
+    """Motor inicializado en este proceso por init_worker"""
+    if _worker_engine is None:
+        raise RuntimeError("Proceso sin motor de validacion: usar init_worker como initializer")
+    return _worker_engine
+
+
+def map_ordered(
+    executor: Executor,
+    fn: Callable,
+    tasks: Iterable[Tuple],
+    max_pending: int
+) -> Iterator[Any]:
+    """
+    Como executor.map pero con a lo sumo max_pending tareas en vuelo
+
+    Los argumentos se generan a medida que se consumen los resultados,
+    asi que las tareas pendientes no se acumulan todas en memoria.
+    """
+    pending = deque()
+    for args in tasks:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def print_report(report: Dict[str, Any]):
+    """Imprime el reporte de calidad en el formato de los bloques transform"""
+    print(f"\nMetricas de calidad:")
+    print(f"  Total recibidos:    {report['received']}")
+    print(f"  Registros validos:  {report['valid']}")
+    print(f"  Registros invalidos:{report['invalid']}")
+    print(f"  Versiones colapsadas:{report['duplicates']}")
+    if report['superseded']:
+        print(f"  Reemplazadas por version mas nueva de un lote previo: {report['superseded']}")
+
+    failing = {name: stats for name, stats in report['rules'].items() if stats['failures']}
+    if failing:
+        print(f"\n[WARN] Reglas con fallos:")
+        for name, stats in failing.items():
+            print(f"  - [{stats['severity']}] {name}: {stats['failures']} "
+                  f"(ej: {stats['samples']})")
+            if stats.get('missing'):
+                print(f"      ids no encontrados: {len(stats['missing'])}")
@@ -63,6 +63,187 @@ CREATE TABLE IF NOT EXISTS raw.qb_items (
 CREATE INDEX IF NOT EXISTS idx_items_ingested_at
 ON raw.qb_items(ingested_at_utc);
 
+-- ============================================
+-- COLUMNAS TIPADAS SOBRE EL PAYLOAD JSONB
+-- Evitan detoast + cast de JSONB en filtros frecuentes
+-- ============================================
+-- sync_token, last_updated_utc y txn_date las escribe el loader
+-- (los casts a fecha no son IMMUTABLE y no pueden ser GENERATED).
+-- Las extracciones de texto puro son columnas GENERATED.
+ALTER TABLE raw.qb_invoices
+    ADD COLUMN IF NOT EXISTS sync_token INTEGER,
+    ADD COLUMN IF NOT EXISTS last_updated_utc TIMESTAMP WITH TIME ZONE,
+    ADD COLUMN IF NOT EXISTS txn_date DATE,
+    ADD COLUMN IF NOT EXISTS customer_ref VARCHAR(50)
+        GENERATED ALWAYS AS (payload->'CustomerRef'->>'value') STORED;
+
+ALTER TABLE raw.qb_customers
+    ADD COLUMN IF NOT EXISTS sync_token INTEGER,
+    ADD COLUMN IF NOT EXISTS last_updated_utc TIMESTAMP WITH TIME ZONE,
+    ADD COLUMN IF NOT EXISTS display_name TEXT
+        GENERATED ALWAYS AS (payload->>'DisplayName') STORED;
+
+ALTER TABLE raw.qb_items
+    ADD COLUMN IF NOT EXISTS sync_token INTEGER,
+    ADD COLUMN IF NOT EXISTS last_updated_utc TIMESTAMP WITH TIME ZONE,
+    ADD COLUMN IF NOT EXISTS item_name TEXT
+        GENERATED ALWAYS AS (payload->>'Name') STORED,
+    ADD COLUMN IF NOT EXISTS item_type VARCHAR(30)
+        GENERATED ALWAYS AS (payload->>'Type') STORED;
+
+-- Completar filas cargadas antes de existir las columnas tipadas
+-- (un SyncToken no numerico queda en NULL, igual que en el loader)
+UPDATE raw.qb_invoices SET
+    sync_token = CASE WHEN payload->>'SyncToken' ~ '^\d{1,9}$'
+                      THEN (payload->>'SyncToken')::INTEGER END,
+    last_updated_utc = (payload->'MetaData'->>'LastUpdatedTime')::TIMESTAMP WITH TIME ZONE,
+    txn_date = (payload->>'TxnDate')::DATE
+WHERE last_updated_utc IS NULL;
+
+UPDATE raw.qb_customers SET
+    sync_token = CASE WHEN payload->>'SyncToken' ~ '^\d{1,9}$'
+                      THEN (payload->>'SyncToken')::INTEGER END,
+    last_updated_utc = (payload->'MetaData'->>'LastUpdatedTime')::TIMESTAMP WITH TIME ZONE
+WHERE last_updated_utc IS NULL;
+
+UPDATE raw.qb_items SET
+    sync_token = CASE WHEN payload->>'SyncToken' ~ '^\d{1,9}$'
+                      THEN (payload->>'SyncToken')::INTEGER END,
+    last_updated_utc = (payload->'MetaData'->>'LastUpdatedTime')::TIMESTAMP WITH TIME ZONE
+WHERE last_updated_utc IS NULL;
+
+-- Indices B-tree sobre columnas tipadas
+CREATE INDEX IF NOT EXISTS idx_invoices_last_updated
+ON raw.qb_invoices(last_updated_utc);
+
+CREATE INDEX IF NOT EXISTS idx_invoices_txn_date
+ON raw.qb_invoices(txn_date);
+
+CREATE INDEX IF NOT EXISTS idx_invoices_customer_ref
+ON raw.qb_invoices(customer_ref);
+
+CREATE INDEX IF NOT EXISTS idx_customers_last_updated
+ON raw.qb_customers(last_updated_utc);
+
+CREATE INDEX IF NOT EXISTS idx_items_last_updated
+ON raw.qb_items(last_updated_utc);
+
+-- Indices GIN (jsonb_path_ops) para filtros de contencion: payload @> '{...}'
+CREATE INDEX IF NOT EXISTS idx_invoices_payload_path
+ON raw.qb_invoices USING GIN (payload jsonb_path_ops);
+
+CREATE INDEX IF NOT EXISTS idx_customers_payload_path
+ON raw.qb_customers USING GIN (payload jsonb_path_ops);
+
+CREATE INDEX IF NOT EXISTS idx_items_payload_path
+ON raw.qb_items USING GIN (payload jsonb_path_ops);
+
+-- ============================================
+-- TABLA: raw.extraction_requests
+-- Una fila por ejecucion/ventana/pagina con el payload de la solicitud
+-- ============================================
+CREATE TABLE IF NOT EXISTS raw.extraction_requests (
+    id BIGSERIAL PRIMARY KEY,
+    run_id UUID NOT NULL,                                -- Ejecucion de carga
+    table_name VARCHAR(100) NOT NULL,                    -- Tabla destino (raw.qb_*)
+    window_start_utc TIMESTAMP WITH TIME ZONE,
+    window_end_utc TIMESTAMP WITH TIME ZONE,
+    page_number INTEGER,
+    page_size INTEGER,
+    request_payload JSONB,                               -- Payload de la solicitud (una vez por pagina)
+    created_at_utc TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_extraction_requests_run
+ON raw.extraction_requests(run_id);
+
+-- Cada registro referencia su solicitud en lugar de repetir el payload.
+-- request_payload por fila queda en NULL para cargas nuevas.
+ALTER TABLE raw.qb_invoices
+    ADD COLUMN IF NOT EXISTS extraction_request_id BIGINT
+        REFERENCES raw.extraction_requests(id);
+
+ALTER TABLE raw.qb_customers
+    ADD COLUMN IF NOT EXISTS extraction_request_id BIGINT
+        REFERENCES raw.extraction_requests(id);
+
+ALTER TABLE raw.qb_items
+    ADD COLUMN IF NOT EXISTS extraction_request_id BIGINT
+        REFERENCES raw.extraction_requests(id);
+
+-- ============================================
+-- TABLA: raw.table_row_counts
+-- Contador de filas por tabla mantenido por el loader
+-- ============================================
+-- El loader suma los insertados en la misma transaccion del upsert.
+-- Varios slots por tabla evitan que cargas paralelas se bloqueen;
+-- el total es SUM(row_count).
+CREATE TABLE IF NOT EXISTS raw.table_row_counts (
+    table_name VARCHAR(100) NOT NULL,                    -- raw.qb_invoices, raw.qb_customers, raw.qb_items
+    counter_slot SMALLINT NOT NULL DEFAULT 0,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    updated_at_utc TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (table_name, counter_slot)
+);
+
+-- Inicializar contadores (conteo exacto una sola vez si ya hay datos)
+INSERT INTO raw.table_row_counts (table_name, counter_slot, row_count)
+SELECT 'raw.qb_invoices', 0, COUNT(*) FROM raw.qb_invoices
+WHERE NOT EXISTS (SELECT 1 FROM raw.table_row_counts WHERE table_name = 'raw.qb_invoices');
+
+INSERT INTO raw.table_row_counts (table_name, counter_slot, row_count)
+SELECT 'raw.qb_customers', 0, COUNT(*) FROM raw.qb_customers
+WHERE NOT EXISTS (SELECT 1 FROM raw.table_row_counts WHERE table_name = 'raw.qb_customers');
+
+INSERT INTO raw.table_row_counts (table_name, counter_slot, row_count)
+SELECT 'raw.qb_items', 0, COUNT(*) FROM raw.qb_items
+WHERE NOT EXISTS (SELECT 1 FROM raw.table_row_counts WHERE table_name = 'raw.qb_items');
+
+-- ============================================
+-- TABLA: raw.volumetry_stats
+-- Rollup de volumetria por tabla, ventana y pagina
+-- ============================================
+-- El loader descuenta las filas reescritas de su ventana/pagina previa
+-- y suma las cargadas, en la misma transaccion del upsert (o una vez por
+-- lote en la carga paralela). Las filas en cero se eliminan al cerrar
+-- cada tramo.
+-- Ventanas nulas se guardan como -infinity/infinity y pagina nula como 0.
+CREATE TABLE IF NOT EXISTS raw.volumetry_stats (
+    table_name VARCHAR(100) NOT NULL,
+    window_start_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+    window_end_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+    page_number INTEGER NOT NULL,
+    record_count BIGINT NOT NULL DEFAULT 0,
+    first_ingested_utc TIMESTAMP WITH TIME ZONE,         -- Aproximado tras re-cargas
+    last_ingested_utc TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (table_name, window_start_utc, window_end_utc, page_number)
+);
+
+-- Inicializar el rollup (un GROUP BY por tabla, una sola vez)
+INSERT INTO raw.volumetry_stats
+SELECT 'raw.qb_invoices', COALESCE(extract_window_start_utc, '-infinity'),
+       COALESCE(extract_window_end_utc, 'infinity'), COALESCE(page_number, 0),
+       COUNT(*), MIN(ingested_at_utc), MAX(ingested_at_utc)
+FROM raw.qb_invoices
+WHERE NOT EXISTS (SELECT 1 FROM raw.volumetry_stats WHERE table_name = 'raw.qb_invoices')
+GROUP BY 2, 3, 4;
+
+INSERT INTO raw.volumetry_stats
+SELECT 'raw.qb_customers', COALESCE(extract_window_start_utc, '-infinity'),
+       COALESCE(extract_window_end_utc, 'infinity'), COALESCE(page_number, 0),
+       COUNT(*), MIN(ingested_at_utc), MAX(ingested_at_utc)
+FROM raw.qb_customers
+WHERE NOT EXISTS (SELECT 1 FROM raw.volumetry_stats WHERE table_name = 'raw.qb_customers')
+GROUP BY 2, 3, 4;
+
+INSERT INTO raw.volumetry_stats
+SELECT 'raw.qb_items', COALESCE(extract_window_start_utc, '-infinity'),
+       COALESCE(extract_window_end_utc, 'infinity'), COALESCE(page_number, 0),
+       COUNT(*), MIN(ingested_at_utc), MAX(ingested_at_utc)
+FROM raw.qb_items
+WHERE NOT EXISTS (SELECT 1 FROM raw.volumetry_stats WHERE table_name = 'raw.qb_items')
+GROUP BY 2, 3, 4;
+
 -- ============================================
 -- TABLA: raw.backfill_log
 -- Registro de ejecuciones del backfill
@@ -77,16 +258,297 @@ CREATE TABLE IF NOT EXISTS raw.backfill_log (
     records_updated INTEGER DEFAULT 0,
     pages_processed INTEGER DEFAULT 0,
     duration_seconds NUMERIC(10,2),
-    status VARCHAR(20) NOT NULL,                         -- running, completed, failed
+    status VARCHAR(20) NOT NULL,                         -- running, completed, failed, mismatch
     error_message TEXT,
     started_at_utc TIMESTAMP WITH TIME ZONE NOT NULL,
     completed_at_utc TIMESTAMP WITH TIME ZONE,
     created_at_utc TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Ventana como rango inclusivo [inicio, fin] para detectar huecos y
+-- solapes con operadores de rango (GiST sobre entidad + rango).
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE raw.backfill_log
+    ADD COLUMN IF NOT EXISTS window_range TSTZRANGE
+        GENERATED ALWAYS AS (tstzrange(window_start_utc, window_end_utc, '[]')) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_backfill_log_entity_window
+ON raw.backfill_log USING GIST (entity_name, window_range);
+
+-- ============================================
+-- TABLA: raw.backfill_jobs
+-- Cola de tramos para workers distribuidos (claim con SKIP LOCKED)
+-- ============================================
+CREATE TABLE IF NOT EXISTS raw.backfill_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    entity_name VARCHAR(50) NOT NULL,                    -- invoices, customers, items
+    window_start_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+    window_end_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',       -- pending, running, completed, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    available_at_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),  -- Backoff tras un fallo
+    worker_id VARCHAR(200),                              -- Worker con el lease vigente
+    lease_expires_at_utc TIMESTAMP WITH TIME ZONE,       -- Vencido = worker caido, se re-asigna
+    heartbeat_at_utc TIMESTAMP WITH TIME ZONE,
+    backfill_log_id INTEGER REFERENCES raw.backfill_log(id),
+    last_error TEXT,
+    created_at_utc TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    started_at_utc TIMESTAMP WITH TIME ZONE,
+    completed_at_utc TIMESTAMP WITH TIME ZONE,
+    UNIQUE (entity_name, window_start_utc, window_end_utc)
+);
+
+-- Solo los jobs reclamables; los completados no pesan en el claim
+CREATE INDEX IF NOT EXISTS idx_backfill_jobs_claimable
+ON raw.backfill_jobs (window_start_utc, id)
+WHERE status IN ('pending', 'running');
+
+-- ============================================
+-- TABLA: raw.backfill_checkpoints
+-- Ultima pagina cargada por entidad y ventana (reanudacion a mitad de tramo)
+-- ============================================
+CREATE TABLE IF NOT EXISTS raw.backfill_checkpoints (
+    entity_name VARCHAR(50) NOT NULL,                    -- invoices, customers, items
+    window_start_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+    window_end_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_page INTEGER NOT NULL,                          -- Ultima pagina cargada de forma durable
+    page_size INTEGER NOT NULL,                          -- STARTPOSITION = last_page * page_size + 1
+    records_loaded INTEGER NOT NULL DEFAULT 0,           -- Acumulado de registros hasta last_page
+    updated_at_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (entity_name, window_start_utc, window_end_utc)
+);
+
+-- Reanudacion por fecha: las paginas se piden ordenadas por LastUpdatedTime,
+-- asi que el tramo se retoma desde el mayor LastUpdatedTime cargado hasta
+-- last_page (inclusive). Un checkpoint sin esta columna reinicia el tramo.
+ALTER TABLE raw.backfill_checkpoints
+    ADD COLUMN IF NOT EXISTS resume_from_utc TIMESTAMP WITH TIME ZONE;
+
+-- ============================================
+-- TABLA: raw.sync_watermarks
+-- High-water mark de MetaData.LastUpdatedTime por entidad (modo incremental)
+-- ============================================
+CREATE TABLE IF NOT EXISTS raw.sync_watermarks (
+    entity_name VARCHAR(50) PRIMARY KEY,                 -- invoices, customers, items
+    last_updated_utc TIMESTAMP WITH TIME ZONE NOT NULL,  -- Mayor LastUpdatedTime cargado
+    last_window_end_utc TIMESTAMP WITH TIME ZONE,        -- Fin de la ultima ventana incremental
+    updated_at_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- ============================================
+-- TABLA: raw.qb_invoice_lines
+-- Lineas de factura aplanadas desde payload->'Line'
+-- ============================================
+-- El loader las reemplaza por factura (DELETE + COPY) en la misma
+-- transaccion del upsert de raw.qb_invoices.
+CREATE TABLE IF NOT EXISTS raw.qb_invoice_lines (
+    invoice_id VARCHAR(50) NOT NULL,                     -- ID de la factura (raw.qb_invoices.id)
+    line_number INTEGER NOT NULL,                        -- Posicion en payload->'Line' (1..n)
+    line_id VARCHAR(50),                                 -- Line.Id en QBO (nulo en subtotales)
+    detail_type VARCHAR(50),                             -- SalesItemLineDetail, SubTotalLineDetail, ...
+    item_ref VARCHAR(50),                                -- <detalle>.ItemRef.value
+    description TEXT,
+    qty NUMERIC(18, 4),
+    unit_price NUMERIC(18, 6),
+    amount NUMERIC(18, 2),
+    txn_date DATE,                                       -- TxnDate de la factura
+    PRIMARY KEY (invoice_id, line_number)
+);
+
+CREATE INDEX IF NOT EXISTS idx_invoice_lines_item_ref
+ON raw.qb_invoice_lines(item_ref);
+
+CREATE INDEX IF NOT EXISTS idx_invoice_lines_txn_date
+ON raw.qb_invoice_lines(txn_date);
+
+-- Completar lineas de facturas cargadas antes de existir la tabla
+INSERT INTO raw.qb_invoice_lines (
+    invoice_id, line_number, line_id, detail_type, item_ref,
+    description, qty, unit_price, amount, txn_date
+)
+SELECT
+    i.id,
+    l.ordinality,
+    l.line->>'Id',
+    l.line->>'DetailType',
+    l.line->(l.line->>'DetailType')->'ItemRef'->>'value',
+    l.line->>'Description',
+    (l.line->(l.line->>'DetailType')->>'Qty')::NUMERIC,
+    (l.line->(l.line->>'DetailType')->>'UnitPrice')::NUMERIC,
+    (l.line->>'Amount')::NUMERIC,
+    i.txn_date
+FROM raw.qb_invoices i
+CROSS JOIN LATERAL jsonb_array_elements(COALESCE(i.payload->'Line', '[]'::JSONB))
+    WITH ORDINALITY AS l(line, ordinality)
+WHERE NOT EXISTS (SELECT 1 FROM raw.qb_invoice_lines);
+
+-- ============================================
+-- TABLA: raw.pending_references
+-- Ids referenciados (ej: CustomerRef, ItemRef) que aun no estan cargados
+-- ============================================
+-- Los encola el transform de invoices; utils.reference_cache los busca
+-- puntualmente en QBO (WHERE Id IN (...)) y los elimina al cargarlos.
+CREATE TABLE IF NOT EXISTS raw.pending_references (
+    entity_name VARCHAR(50) NOT NULL,                    -- Entidad referenciada: customers, items
+    ref_id VARCHAR(50) NOT NULL,                         -- Id referenciado en QBO
+    referenced_by VARCHAR(50) NOT NULL,                  -- Entidad que referencia (invoices)
+    attempts INTEGER NOT NULL DEFAULT 0,                 -- Busquedas sin encontrar el id
+    first_seen_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_seen_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_attempt_utc TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (entity_name, ref_id)
+);
+
+-- ============================================
+-- BORRADOS EN QBO
+-- deleted_at_utc lo marca la reconciliacion (utils/reconciliation.py)
+-- cuando un id ya no existe en QBO; un upsert posterior lo limpia
+-- ============================================
+ALTER TABLE raw.qb_invoices ADD COLUMN IF NOT EXISTS deleted_at_utc TIMESTAMP WITH TIME ZONE;
+ALTER TABLE raw.qb_customers ADD COLUMN IF NOT EXISTS deleted_at_utc TIMESTAMP WITH TIME ZONE;
+ALTER TABLE raw.qb_items ADD COLUMN IF NOT EXISTS deleted_at_utc TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS idx_invoices_deleted
+ON raw.qb_invoices(deleted_at_utc) WHERE deleted_at_utc IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_customers_deleted
+ON raw.qb_customers(deleted_at_utc) WHERE deleted_at_utc IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_items_deleted
+ON raw.qb_items(deleted_at_utc) WHERE deleted_at_utc IS NOT NULL;
+
+-- ============================================
+-- VERIFICACION DE CONTEOS POR VENTANA
+-- utils/count_verification.py compara COUNT(*) de QBO con el conteo de
+-- last_updated_utc en la misma ventana; las diferencias quedan en
+-- raw.backfill_log con status 'mismatch'
+-- ============================================
+ALTER TABLE raw.backfill_log
+    ADD COLUMN IF NOT EXISTS qbo_count INTEGER,
+    ADD COLUMN IF NOT EXISTS postgres_count INTEGER;
+
+-- Conteo por rango de fechas solo sobre filas vigentes (index-only scan)
+CREATE INDEX IF NOT EXISTS idx_invoices_live_last_updated
+ON raw.qb_invoices(last_updated_utc) WHERE deleted_at_utc IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_customers_live_last_updated
+ON raw.qb_customers(last_updated_utc) WHERE deleted_at_utc IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_items_live_last_updated
+ON raw.qb_items(last_updated_utc) WHERE deleted_at_utc IS NULL;
+
+-- ============================================
+-- DESTINO DEL TRAMO
+-- Un tramo escrito al lake (utils/lake_sink.py) no cubre la capa RAW:
+-- find_missing_windows calcula la cobertura por destino
+-- ============================================
+ALTER TABLE raw.backfill_log
+    ADD COLUMN IF NOT EXISTS destination VARCHAR(20) NOT NULL DEFAULT 'postgres';  -- postgres, lake
+
+-- ============================================
+-- FUNCION: raw.migrate_to_hash_partitions
+-- Migra una tabla raw.qb_* a un layout particionado por HASH (id)
+-- Opcional: ver sql/migrar_particiones.sql
+-- ============================================
+CREATE OR REPLACE FUNCTION raw.migrate_to_hash_partitions(
+    p_table TEXT,                                        -- Nombre sin esquema (ej: qb_invoices)
+    p_partitions INTEGER DEFAULT 8                       -- Numero de particiones hash
+)
+RETURNS BIGINT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_old TEXT := p_table || '_heap_old';
+    v_regclass REGCLASS := format('raw.%I', p_table)::regclass;
+    v_pkey TEXT;
+    v_columns TEXT;
+    v_comment TEXT;
+    v_index_defs TEXT[];
+    v_constraint_defs TEXT[];
+    v_def TEXT;
+    v_rows BIGINT;
+    i INTEGER;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = v_regclass) THEN
+        RAISE NOTICE 'raw.% ya esta particionada', p_table;
+        RETURN 0;
+    END IF;
+
+    -- Indices secundarios y constraints (FK/CHECK) a recrear sobre la tabla padre
+    SELECT COALESCE(array_agg(pg_get_indexdef(indexrelid)), '{}')
+    INTO v_index_defs
+    FROM pg_index
+    WHERE indrelid = v_regclass AND NOT indisprimary;
+
+    SELECT COALESCE(array_agg(format('ADD CONSTRAINT %I %s', conname, pg_get_constraintdef(oid))), '{}')
+    INTO v_constraint_defs
+    FROM pg_constraint
+    WHERE conrelid = v_regclass AND contype IN ('f', 'c');
+
+    SELECT conname INTO v_pkey
+    FROM pg_constraint
+    WHERE conrelid = v_regclass AND contype = 'p';
+
+    -- Columnas copiables (las generadas se recalculan solas)
+    SELECT string_agg(quote_ident(column_name), ', ' ORDER BY ordinal_position)
+    INTO v_columns
+    FROM information_schema.columns
+    WHERE table_schema = 'raw' AND table_name = p_table AND is_generated = 'NEVER';
+
+    v_comment := obj_description(v_regclass, 'pg_class');
+
+    -- Apartar la tabla heap y liberar el nombre de su PK
+    EXECUTE format('ALTER TABLE raw.%I RENAME TO %I', p_table, v_old);
+    EXECUTE format('ALTER TABLE raw.%I RENAME CONSTRAINT %I TO %I', v_old, v_pkey, v_old || '_pkey');
+
+    EXECUTE format(
+        'CREATE TABLE raw.%I (LIKE raw.%I INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING COMMENTS) '
+        'PARTITION BY HASH (id)',
+        p_table, v_old
+    );
+    EXECUTE format('ALTER TABLE raw.%I ADD PRIMARY KEY (id)', p_table);
+
+    FOR i IN 0..p_partitions - 1 LOOP
+        EXECUTE format(
+            'CREATE TABLE raw.%I PARTITION OF raw.%I FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+            p_table || '_p' || i, p_table, p_partitions, i
+        );
+    END LOOP;
+
+    EXECUTE format('INSERT INTO raw.%1$I (%2$s) SELECT %2$s FROM raw.%3$I', p_table, v_columns, v_old);
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+    EXECUTE format('DROP TABLE raw.%I', v_old);
+
+    FOREACH v_def IN ARRAY v_index_defs LOOP
+        EXECUTE v_def;
+    END LOOP;
+    FOREACH v_def IN ARRAY v_constraint_defs LOOP
+        EXECUTE format('ALTER TABLE raw.%I %s', p_table, v_def);
+    END LOOP;
+
+    IF v_comment IS NOT NULL THEN
+        EXECUTE format('COMMENT ON TABLE raw.%I IS %L', p_table, v_comment);
+    END IF;
+
+    RAISE NOTICE 'raw.% migrada a % particiones hash (% filas)', p_table, p_partitions, v_rows;
+    RETURN v_rows;
+END;
+$$;
+
 -- Comentarios de documentacion
 COMMENT ON SCHEMA raw IS 'Esquema RAW para datos crudos de QuickBooks Online';
 COMMENT ON TABLE raw.qb_invoices IS 'Facturas extraidas de QBO con payload completo';
 COMMENT ON TABLE raw.qb_customers IS 'Clientes extraidos de QBO con payload completo';
 COMMENT ON TABLE raw.qb_items IS 'Items/productos extraidos de QBO con payload completo';
+COMMENT ON TABLE raw.extraction_requests IS 'Solicitudes de extraccion por ejecucion, ventana y pagina';
+COMMENT ON TABLE raw.table_row_counts IS 'Contadores de filas por tabla mantenidos transaccionalmente por el loader';
+COMMENT ON TABLE raw.volumetry_stats IS 'Volumetria por tabla, ventana y pagina mantenida por el loader';
 COMMENT ON TABLE raw.backfill_log IS 'Registro de ejecuciones del pipeline de backfill';
+COMMENT ON TABLE raw.backfill_jobs IS 'Cola de tramos de backfill para workers distribuidos';
+COMMENT ON TABLE raw.backfill_checkpoints IS 'Ultima pagina cargada por entidad y ventana para reanudar tramos';
+COMMENT ON TABLE raw.sync_watermarks IS 'Ultimo LastUpdatedTime cargado por entidad para el modo incremental';
+COMMENT ON TABLE raw.qb_invoice_lines IS 'Lineas de factura aplanadas, reemplazadas por factura en cada upsert';
+COMMENT ON TABLE raw.pending_references IS 'Ids referenciados aun no cargados, pendientes de fetch puntual';
@@ -0,0 +1,27 @@
+-- ============================================
+-- MIGRACION OPCIONAL A TABLAS PARTICIONADAS
+-- Convierte raw.qb_* en tablas particionadas por HASH (id)
+-- ============================================
+-- Cada llamada corre en una sola transaccion: copia los datos a la
+-- nueva tabla padre, recrea indices/constraints y elimina la tabla heap.
+-- Bloquea la tabla durante la copia: ejecutar sin pipelines corriendo.
+-- Es idempotente: si la tabla ya esta particionada no hace nada.
+--
+-- La clave de particion es id (la PK), por lo que el UPSERT
+-- ON CONFLICT (id) sigue funcionando sin cambios en los loaders.
+
+SELECT raw.migrate_to_hash_partitions('qb_invoices', 16);
+SELECT raw.migrate_to_hash_partitions('qb_customers', 4);
+SELECT raw.migrate_to_hash_partitions('qb_items', 4);
+
+-- Verificar particiones y filas por particion
+SELECT
+    parent.relname AS tabla,
+    child.relname AS particion,
+    child.reltuples::BIGINT AS filas_estimadas
+FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+JOIN pg_namespace ns ON ns.oid = parent.relnamespace
+WHERE ns.nspname = 'raw'
+ORDER BY parent.relname, child.relname;
@@ -3,101 +3,65 @@
 -- Ejecutar en PgAdmin para generar evidencia
 -- ============================================
 
+-- Todas las consultas leen raw.table_row_counts y raw.volumetry_stats,
+-- mantenidas por el loader: no recorren las tablas raw.qb_*.
+
 -- 1. CONTEO TOTAL POR ENTIDAD
 SELECT '=== CONTEO TOTAL POR ENTIDAD ===' as reporte;
 
 SELECT
-    'qb_invoices' as entidad,
-    COUNT(*) as total_registros
-FROM raw.qb_invoices
-UNION ALL
-SELECT
-    'qb_customers' as entidad,
-    COUNT(*) as total_registros
-FROM raw.qb_customers
-UNION ALL
-SELECT
-    'qb_items' as entidad,
-    COUNT(*) as total_registros
-FROM raw.qb_items;
+    table_name as entidad,
+    SUM(row_count) as total_registros
+FROM raw.table_row_counts
+WHERE table_name IN ('raw.qb_invoices', 'raw.qb_customers', 'raw.qb_items')
+GROUP BY table_name
+ORDER BY table_name;
 
--- 2. VERIFICACION DE DUPLICADOS (debe retornar 0 filas)
-SELECT '=== VERIFICACION DE DUPLICADOS ===' as reporte;
+-- 2. VERIFICACION DE CONSISTENCIA (debe retornar 0 filas)
+-- La PK sobre id ya garantiza que no hay duplicados; aqui se verifica
+-- que el contador de filas y el rollup de volumetria coincidan.
+SELECT '=== VERIFICACION DE CONSISTENCIA ===' as reporte;
 
-SELECT 'qb_invoices' as tabla, id, COUNT(*) as duplicados
-FROM raw.qb_invoices
-GROUP BY id
-HAVING COUNT(*) > 1
-UNION ALL
-SELECT 'qb_customers' as tabla, id, COUNT(*) as duplicados
-FROM raw.qb_customers
-GROUP BY id
-HAVING COUNT(*) > 1
-UNION ALL
-SELECT 'qb_items' as tabla, id, COUNT(*) as duplicados
-FROM raw.qb_items
-GROUP BY id
-HAVING COUNT(*) > 1;
+SELECT
+    c.table_name as tabla,
+    c.total as contador,
+    v.total as volumetria
+FROM (
+    SELECT table_name, SUM(row_count) as total
+    FROM raw.table_row_counts
+    GROUP BY table_name
+) c
+FULL JOIN (
+    SELECT table_name, SUM(record_count) as total
+    FROM raw.volumetry_stats
+    GROUP BY table_name
+) v ON v.table_name = c.table_name
+WHERE c.total IS DISTINCT FROM v.total;
 
 -- 3. RESUMEN DE INGESTA POR VENTANA DE EXTRACCION
 SELECT '=== RESUMEN POR VENTANA DE EXTRACCION ===' as reporte;
 
 SELECT
-    'qb_invoices' as entidad,
-    extract_window_start_utc,
-    extract_window_end_utc,
-    COUNT(*) as registros,
-    MIN(ingested_at_utc) as primera_ingesta,
-    MAX(ingested_at_utc) as ultima_ingesta
-FROM raw.qb_invoices
-GROUP BY extract_window_start_utc, extract_window_end_utc
-UNION ALL
-SELECT
-    'qb_customers' as entidad,
-    extract_window_start_utc,
-    extract_window_end_utc,
-    COUNT(*) as registros,
-    MIN(ingested_at_utc) as primera_ingesta,
-    MAX(ingested_at_utc) as ultima_ingesta
-FROM raw.qb_customers
-GROUP BY extract_window_start_utc, extract_window_end_utc
-UNION ALL
-SELECT
-    'qb_items' as entidad,
-    extract_window_start_utc,
-    extract_window_end_utc,
-    COUNT(*) as registros,
-    MIN(ingested_at_utc) as primera_ingesta,
-    MAX(ingested_at_utc) as ultima_ingesta
-FROM raw.qb_items
-GROUP BY extract_window_start_utc, extract_window_end_utc;
+    table_name as entidad,
+    window_start_utc as extract_window_start_utc,
+    window_end_utc as extract_window_end_utc,
+    SUM(record_count) as registros,
+    MIN(first_ingested_utc) as primera_ingesta,
+    MAX(last_ingested_utc) as ultima_ingesta
+FROM raw.volumetry_stats
+GROUP BY table_name, window_start_utc, window_end_utc
+ORDER BY table_name, window_start_utc;
 
 -- 4. ESTADISTICAS POR PAGINA
 SELECT '=== ESTADISTICAS POR PAGINA ===' as reporte;
 
 SELECT
-    'qb_invoices' as entidad,
-    page_number,
-    COUNT(*) as registros_en_pagina
-FROM raw.qb_invoices
-GROUP BY page_number
-ORDER BY page_number;
-
-SELECT
-    'qb_customers' as entidad,
-    page_number,
-    COUNT(*) as registros_en_pagina
-FROM raw.qb_customers
-GROUP BY page_number
-ORDER BY page_number;
-
-SELECT
-    'qb_items' as entidad,
+    table_name as entidad,
     page_number,
-    COUNT(*) as registros_en_pagina
-FROM raw.qb_items
-GROUP BY page_number
-ORDER BY page_number;
+    SUM(record_count) as registros_en_pagina
+FROM raw.volumetry_stats
+GROUP BY table_name, page_number
+ORDER BY table_name, page_number;
 
 -- 5. MUESTRA DE DATOS (primeros 3 registros por entidad)
 SELECT '=== MUESTRA DE DATOS ===' as reporte;